@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shlex
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+
+EXIT_SUCCESS = 0
+EXIT_INVALID_ARGUMENTS = 3
+
+GRAPH_SHAPES: List[str] = ["chain", "fanout", "cycles", "mixed"]
+
+# The scenarios each benchmark run times, as arguments to find-package-dependents.py
+# ({root} is replaced with the root package of the graph)
+SCENARIOS: Dict[str, str] = {
+    "direct": "{root}",
+    "all": "{root} --all --format json",
+    "source-packages": "{root} --all --source-packages --format json",
+    "filter-command": "{root} --all --filter-command 'case $PACKAGE in *3) exit 1;; esac' --format json",
+    "max-results": "{root} --all --max-results 50 --format json",
+}
+
+# Environment variable naming the socket of the fake dnf server
+SOCKET_VARIABLE = "BENCHMARK_DNF_SOCKET"
+
+# The fake dnf put on PATH: it hands its command to the fake dnf server, which has the graph
+# loaded, so each call only costs starting a bare interpreter
+FAKE_DNF_CLIENT = f"""#!{sys.executable}
+import json, os, socket, sys
+
+with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+    connection.connect(os.environ["{SOCKET_VARIABLE}"])
+    connection.sendall(json.dumps({{"arguments": sys.argv[1:]}}).encode() + b"\\n")
+    with connection.makefile("rb") as response_file:
+        response = json.loads(response_file.readline())
+
+sys.stdout.write(response["stdout"])
+sys.stderr.write(response["stderr"])
+sys.exit(response["exit_code"])
+"""
+
+# Environment variable naming the file the benchmarked script's peak memory is written to
+PEAK_MEMORY_VARIABLE = "BENCHMARK_PEAK_MEMORY_FILE"
+
+# Runs a script like 'python script arguments...' would, and writes the peak memory of
+# its own process (not of the dnf processes it starts) to a file when it exits
+PEAK_MEMORY_BOOTSTRAP = f"""
+import atexit, os, resource, runpy, sys
+
+def write_peak_memory(process_id=os.getpid()):
+    # Forked worker processes inherit the handler, but aren't the script
+    if os.getpid() == process_id:
+        with open(os.environ["{PEAK_MEMORY_VARIABLE}"], "w") as peak_memory_file:
+            peak_memory_file.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+
+atexit.register(write_peak_memory)
+sys.argv = sys.argv[1:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+# How many binary packages come from each source package of a generated graph
+PACKAGES_PER_SOURCE = 4
+
+
+def package_name(index: int) -> str:
+    """
+    Name a package of a generated graph.
+
+    Args:
+        index: The index of the package
+
+    Returns:
+        The package name
+    """
+    return f"pkg-{index}"
+
+
+def generate_graph(shape: str, package_count: int, fanout: int = 8, cycle_length: int = 50, seed: int = 0) -> Dict[str, Any]:
+    """
+    Generate a synthetic dependency graph.
+
+    The shapes are:
+    - chain: every package requires the one before it, so the closure of the first one is the whole graph
+    - fanout: a tree where every package is required by fanout packages
+    - cycles: rings of cycle_length packages requiring each other, each ring requiring the one before it
+    - mixed: every package requires a few earlier packages, mostly the first ones (like core
+      libraries), some through a provided capability, and a few packages require later ones,
+      which makes cycles
+
+    Args:
+        shape: One of GRAPH_SHAPES
+        package_count: Number of packages
+        fanout: Number of dependents of each package, for the fanout shape
+        cycle_length: Number of packages in each ring, for the cycles shape
+        seed: Seed for the random choices of the mixed shape
+
+    Returns:
+        Dictionary with the 'root' package that every other package depends on, and the
+        'packages', mapping each package name to its 'requires', 'provides', 'source' and 'description'
+    """
+    requires: List[List[str]] = [[] for _ in range(package_count)]
+
+    if shape == "chain":
+        for index in range(1, package_count):
+            requires[index].append(package_name(index - 1))
+    elif shape == "fanout":
+        for index in range(1, package_count):
+            requires[index].append(package_name((index - 1) // fanout))
+    elif shape == "cycles":
+        for index in range(package_count):
+            ring_start = index - index % cycle_length
+            ring_end = min(ring_start + cycle_length, package_count)
+            previous = index - 1 if index > ring_start else ring_end - 1
+            if previous != index:
+                requires[index].append(package_name(previous))
+            if index == ring_start and ring_start > 0:
+                requires[index].append(package_name(ring_start - 1))
+    elif shape == "mixed":
+        generator = random.Random(seed)
+        for index in range(1, package_count):
+            targets = {int(index * generator.random() ** 2) for _ in range(1 + min(int(generator.expovariate(0.7)), 6))}
+            for target in sorted(targets):
+                if generator.random() < 0.5:
+                    requires[index].append(f"lib{package_name(target)}.so.1()(64bit)")
+                else:
+                    requires[index].append(package_name(target))
+        for _ in range(package_count // 50):
+            index = generator.randrange(1, package_count)
+            requires[index].append(package_name(generator.randrange(index, package_count)))
+    else:
+        raise ValueError(f"Unknown graph shape {shape!r}")
+
+    packages = {}
+    for index in range(package_count):
+        name = package_name(index)
+        packages[name] = {
+            "requires": requires[index],
+            "provides": [f"lib{name}.so.1()(64bit)"],
+            "source": f"src-{index // PACKAGES_PER_SOURCE}",
+            "description": f"Synthetic package {index} of a {shape} graph.\nIt has {len(requires[index])} dependencies.",
+        }
+
+    return {"root": package_name(0), "packages": packages}
+
+
+def format_package(package: str, entry: Dict[str, Any], query_format: str) -> str:
+    """
+    Format a package like dnf repoquery --qf does.
+
+    Args:
+        package: The package name
+        entry: The package entry of the graph
+        query_format: The query format, with tags like %{name}
+
+    Returns:
+        The formatted package
+    """
+    tags = {
+        "name": package,
+        "version": "1.0",
+        "release": "1",
+        "arch": "x86_64",
+        "sourcerpm": f"{entry['source']}-1.0-1.src.rpm",
+        "description": entry["description"],
+        "provides": "\n".join([package] + entry["provides"]),
+        "requires": "\n".join(entry["requires"]),
+        "files": "",
+    }
+    output = query_format.replace("\\n", "\n").replace("\\t", "\t")
+    return re.sub(r"%\{(\w+)\}", lambda match: tags.get(match.group(1), ""), output)
+
+
+class FakeDnfServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Answers the commands of the fake dnf from a graph loaded once for the whole benchmark.
+
+    Each request is one line of JSON with the fake dnf's command line arguments, and
+    each response is one line of JSON with the exit code and what dnf would write to
+    stdout and stderr. Requests are answered concurrently, like separate dnf runs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, graph: Dict[str, Any], latency: float = 0.0):
+        self._packages: Dict[str, Dict[str, Any]] = graph["packages"]
+        self._latency = latency
+        self._call_count = 0
+        self._lock = threading.Lock()
+
+        # The packages requiring each capability, so whatdepends doesn't go through the whole graph
+        self._requirers: Dict[str, Set[str]] = {}
+        for package, entry in self._packages.items():
+            for capability in entry["requires"]:
+                self._requirers.setdefault(capability, set()).add(package)
+
+        super().__init__(str(socket_path), FakeDnfRequestHandler)
+
+    def answer(self, argv: List[str]) -> Dict[str, Any]:
+        """
+        Answer a dnf command from the graph, like dnf repoquery would.
+
+        Only what find-package-dependents.py asks for is supported: makecache, and repoquery
+        with package names, --all, --whatdepends and --qf. Repository options are ignored.
+
+        Args:
+            argv: The dnf command line arguments
+
+        Returns:
+            Dictionary with the 'exit_code', 'stdout' and 'stderr' of the command
+        """
+        with self._lock:
+            self._call_count += 1
+
+        time.sleep(self._latency)
+
+        if not argv or argv[0] == "makecache":
+            return {"exit_code": EXIT_SUCCESS, "stdout": "", "stderr": ""}
+        if argv[0] != "repoquery":
+            return {"exit_code": EXIT_INVALID_ARGUMENTS, "stdout": "", "stderr": f"Unsupported dnf command: {argv[0]}\n"}
+
+        names: List[str] = []
+        whatdepends: List[str] = []
+        query_format = "%{name}-%{version}-%{release}.%{arch}\n"
+        all_packages = False
+        arguments = iter(argv[1:])
+        for argument in arguments:
+            if argument == "--whatdepends":
+                whatdepends.extend(next(arguments).split(","))
+            elif argument == "--qf":
+                query_format = next(arguments)
+            elif argument == "--all":
+                all_packages = True
+            elif not argument.startswith("-"):
+                names.append(argument)
+
+        if all_packages or not names:
+            selected = set(self._packages)
+        else:
+            selected = {name for name in names if name in self._packages}
+
+        if whatdepends:
+            capabilities: Set[str] = set()
+            for name in whatdepends:
+                # Like dnf, fall back to treating the name as a capability if no package has it
+                capabilities.update([name] + self._packages[name]["provides"] if name in self._packages else [name])
+            requirers: Set[str] = set()
+            for capability in capabilities:
+                requirers.update(self._requirers.get(capability, ()))
+            selected &= requirers
+
+        lines = sorted({format_package(package, self._packages[package], query_format) for package in selected})
+        return {"exit_code": EXIT_SUCCESS, "stdout": "".join(lines), "stderr": ""}
+
+    def take_call_count(self) -> int:
+        """
+        Hand over the number of dnf commands answered so far, and start counting again.
+
+        Returns:
+            The number of dnf commands answered since the last call
+        """
+        with self._lock:
+            call_count = self._call_count
+            self._call_count = 0
+        return call_count
+
+
+class FakeDnfRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads a command from the fake dnf and sends back the answer.
+    """
+
+    def handle(self) -> None:
+        request_line = self.rfile.readline()
+        if not request_line:
+            return
+
+        try:
+            argv = [str(argument) for argument in json.loads(request_line)["arguments"]]
+        except (ValueError, KeyError, TypeError) as error:
+            response = {"exit_code": EXIT_INVALID_ARGUMENTS, "stdout": "", "stderr": f"Invalid request: {error}\n"}
+        else:
+            response = self.server.answer(argv)
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def run_scenario(
+        script: Path,
+        arguments: List[str],
+        bin_directory: Path,
+        server: FakeDnfServer,
+        timeout: float | None = None
+    ) -> Dict[str, Any]:
+    """
+    Run find-package-dependents.py once against the fake dnf and measure it.
+
+    Args:
+        script: The find-package-dependents.py script to run
+        arguments: Its command line arguments
+        bin_directory: Directory with the fake dnf, put first on PATH
+        server: The fake dnf server
+        timeout: Seconds after which to give up on the run
+
+    Returns:
+        Dictionary with the 'wall_time', 'dnf_calls', 'peak_memory' (in bytes, of the script's
+        own process, or 0 if it timed out), 'exit_code', whether the run 'timed_out', and the
+        'output_sha256' of what the script wrote to stdout
+    """
+    with tempfile.NamedTemporaryFile("w+", suffix=".peak") as peak_memory_file, tempfile.TemporaryFile() as output:
+        environment = os.environ.copy()
+        environment["PATH"] = f"{bin_directory}{os.pathsep}{environment['PATH']}"
+        environment[SOCKET_VARIABLE] = server.server_address
+        environment[PEAK_MEMORY_VARIABLE] = peak_memory_file.name
+
+        server.take_call_count()
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", PEAK_MEMORY_BOOTSTRAP, str(script)] + arguments + ["--no-refresh"],
+            stdout=output,
+            stderr=subprocess.DEVNULL,
+            env=environment
+        )
+
+        timed_out = False
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            timed_out = True
+        wall_time = time.perf_counter() - start_time
+
+        output.seek(0)
+        peak_memory = peak_memory_file.read().strip()
+        return {
+            "wall_time": wall_time,
+            "dnf_calls": server.take_call_count(),
+            "peak_memory": int(peak_memory) if peak_memory else 0,
+            "exit_code": process.returncode,
+            "timed_out": timed_out,
+            "output_sha256": hashlib.sha256(output.read()).hexdigest(),
+        }
+
+
+def run_benchmark(arguments: argparse.Namespace, graph: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Run the benchmark scenarios against the fake dnf.
+
+    Args:
+        arguments: Parsed command line arguments
+        graph: The graph the fake dnf answers from
+
+    Returns:
+        Dictionary mapping each scenario to its measurements, with the median wall time of the repeats
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark-dnf-") as bin_directory:
+        fake_dnf_path = Path(bin_directory) / "dnf"
+        fake_dnf_path.write_text(FAKE_DNF_CLIENT)
+        fake_dnf_path.chmod(0o755)
+
+        server = FakeDnfServer(Path(bin_directory) / "dnf.socket", graph, arguments.latency)
+        server_thread = threading.Thread(target=server.serve_forever, name="fake-dnf-server", daemon=True)
+        server_thread.start()
+        try:
+            for scenario in arguments.scenarios:
+                scenario_arguments = shlex.split(SCENARIOS[scenario].format(root=graph["root"])) + shlex.split(arguments.extra_arguments)
+                runs = [
+                    run_scenario(arguments.script, scenario_arguments, Path(bin_directory), server, arguments.timeout)
+                    for _ in range(arguments.repeat)
+                ]
+                result = dict(runs[-1])
+                result["wall_time"] = statistics.median(run["wall_time"] for run in runs)
+                result["peak_memory"] = max(run["peak_memory"] for run in runs)
+                results[scenario] = result
+                print(format_result(scenario, result, arguments.baseline_results.get(scenario)), flush=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    return results
+
+
+def format_result(scenario: str, result: Dict[str, Any], baseline: Dict[str, Any] | None = None) -> str:
+    """
+    Format the measurements of a scenario as a line of the report.
+
+    Args:
+        scenario: The scenario
+        result: Its measurements
+        baseline: The measurements of the same scenario in the baseline, if any
+
+    Returns:
+        The report line
+    """
+    line = (
+        f"{scenario:<16} {result['wall_time']:>9.2f}s {result['dnf_calls']:>9} "
+        f"{result['peak_memory'] / 1048576:>9.1f} MiB  exit {result['exit_code']}"
+    )
+    if result["timed_out"]:
+        line += " (timed out)"
+
+    if baseline is not None:
+        speedup = baseline["wall_time"] / result["wall_time"] if result["wall_time"] else float("inf")
+        line += (
+            f"  | baseline {baseline['wall_time']:.2f}s ({speedup:.2f}x), "
+            f"{baseline['dnf_calls']} dnf calls, {baseline['peak_memory'] / 1048576:.1f} MiB"
+        )
+        if baseline["output_sha256"] != result["output_sha256"]:
+            line += "  ⚠️  output differs"
+
+    return line
+
+
+def parse_command_line_arguments() -> argparse.Namespace:
+    """
+    Parse command line arguments for the benchmark.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark find-package-dependents.py against a fake dnf answering from a synthetic dependency graph."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    graph_options = argparse.ArgumentParser(add_help=False)
+    graph_options.add_argument(
+        "--shape",
+        choices=GRAPH_SHAPES,
+        default="mixed",
+        help="Shape of the generated graph (default: mixed)"
+    )
+    graph_options.add_argument(
+        "--packages",
+        type=int,
+        default=2000,
+        help="Number of packages in the generated graph (default: 2000)"
+    )
+    graph_options.add_argument(
+        "--fanout",
+        type=int,
+        default=8,
+        help="Number of dependents of each package, for the fanout shape (default: 8)"
+    )
+    graph_options.add_argument(
+        "--cycle-length",
+        type=int,
+        default=50,
+        help="Number of packages in each cycle, for the cycles shape (default: 50)"
+    )
+    graph_options.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the mixed shape (default: 0)"
+    )
+
+    generate_parser = subparsers.add_parser(
+        "generate",
+        parents=[graph_options],
+        help="Write a synthetic dependency graph to a file"
+    )
+    generate_parser.add_argument(
+        "graph_file",
+        type=Path,
+        help="The graph file to write"
+    )
+
+    run_parser = subparsers.add_parser(
+        "run",
+        parents=[graph_options],
+        help="Time find-package-dependents.py scenarios against the fake dnf"
+    )
+    run_parser.add_argument(
+        "--graph-file",
+        type=Path,
+        help="Answer from this graph file (written by 'generate') instead of generating one"
+    )
+    run_parser.add_argument(
+        "--script",
+        type=Path,
+        default=Path(__file__).resolve().with_name("find-package-dependents.py"),
+        help="The find-package-dependents.py to benchmark (default: the one next to this script)"
+    )
+    run_parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios to run (default: {','.join(SCENARIOS)})"
+    )
+    run_parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake dnf sleeps on each call, to stand in for dnf loading the repositories (default: 0)"
+    )
+    run_parser.add_argument(
+        "--extra-arguments",
+        default="",
+        help="Extra arguments for every scenario, e.g. '--jobs 4'"
+    )
+    run_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Run each scenario this many times and report the median wall time (default: 1)"
+    )
+    run_parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Give up on a scenario run after this many seconds"
+    )
+    run_parser.add_argument(
+        "--save-results",
+        type=Path,
+        metavar="FILE",
+        help="Save the measurements to this JSON file, to compare later runs against"
+    )
+    run_parser.add_argument(
+        "--baseline",
+        type=Path,
+        metavar="FILE",
+        help="Compare against measurements saved with --save-results, e.g. from before an optimization"
+    )
+    arguments = parser.parse_args()
+
+    if arguments.packages < 1:
+        parser.error("--packages must be at least 1")
+    if arguments.command == "run":
+        arguments.scenarios = [scenario.strip() for scenario in arguments.scenarios.split(",") if scenario.strip()]
+        unknown_scenarios = [scenario for scenario in arguments.scenarios if scenario not in SCENARIOS]
+        if unknown_scenarios:
+            parser.error(f"unknown scenarios: {', '.join(unknown_scenarios)} (choose from {', '.join(SCENARIOS)})")
+        if arguments.repeat < 1:
+            parser.error("--repeat must be at least 1")
+
+    return arguments
+
+
+def main() -> None:
+    """
+    Main entry point for the benchmark.
+    """
+    arguments = parse_command_line_arguments()
+
+    if arguments.command == "generate":
+        graph = generate_graph(arguments.shape, arguments.packages, arguments.fanout, arguments.cycle_length, arguments.seed)
+        with open(arguments.graph_file, "w") as graph_file:
+            json.dump(graph, graph_file)
+        print(f"Wrote {arguments.shape} graph of {arguments.packages} packages to {arguments.graph_file}")
+        sys.exit(EXIT_SUCCESS)
+
+    arguments.baseline_results = {}
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            arguments.baseline_results = json.load(baseline_file)["results"]
+
+    if arguments.graph_file:
+        with open(arguments.graph_file) as graph_file:
+            graph = json.load(graph_file)
+        description = f"graph {arguments.graph_file} ({len(graph['packages'])} packages)"
+    else:
+        graph = generate_graph(arguments.shape, arguments.packages, arguments.fanout, arguments.cycle_length, arguments.seed)
+        description = f"{arguments.shape} graph of {arguments.packages} packages"
+
+    print(f"Benchmarking {arguments.script} on a {description}, {arguments.latency}s per dnf call")
+    print(f"{'scenario':<16} {'wall time':>10} {'dnf calls':>9} {'peak memory':>13}")
+    results = run_benchmark(arguments, graph)
+
+    if arguments.save_results:
+        with open(arguments.save_results, "w") as results_file:
+            json.dump({
+                "script": str(arguments.script),
+                "graph": description,
+                "latency": arguments.latency,
+                "extra_arguments": arguments.extra_arguments,
+                "results": results,
+            }, results_file, indent=2)
+
+    sys.exit(EXIT_SUCCESS)
+
+
+if __name__ == "__main__":
+    main()
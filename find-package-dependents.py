@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
 
 import argparse
+import bz2
+import concurrent.futures
+import contextlib
+import gzip
+import importlib
+import importlib.util
+import io
 import json
 import logging
+import lzma
+import multiprocessing
 import os
+import queue
 import re
 import shlex
+import shutil
 import signal
+import socket
+import socketserver
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+from array import array
 from collections import deque
 from hashlib import sha256
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Set, Generator, Any
+from typing import BinaryIO, Callable, Dict, Iterable, List, Set, Tuple, Generator, Any
 from urllib.parse import urlparse
 
 
@@ -22,9 +43,93 @@ EXIT_NO_DEPENDENTS_FOUND = 2
 EXIT_INVALID_ARGUMENTS = 3
 EXIT_CACHE_UPDATE_ERROR = 4
 EXIT_PACKAGE_NOT_FOUND = 5
+EXIT_SERVER_ERROR = 6
+EXIT_FILTER_ERROR = 7
+
+# How many whatdepends results may pile up ahead of the source package lookups
+PIPELINE_BUFFER_SIZE = 64
+
+# How many binary packages to resolve to source packages per query
+SOURCE_QUERY_BATCH_SIZE = 256
+
+# How many packages to fetch descriptions for per query
+DESCRIPTION_QUERY_BATCH_SIZE = 256
+
+# How many packages of a dependents graph level to find the dependents of per query
+WHATDEPENDS_QUERY_BATCH_SIZE = 256
+
+# How many packages --rank-all lists by default
+DEFAULT_RANK_COUNT = 20
+
+# Prefix of the metric names of --stats-format prometheus
+PROMETHEUS_METRIC_PREFIX = "find_package_dependents"
+
+# Separators for query output that contains free-form text, like descriptions
+QUERY_FIELD_SEPARATOR = "\x1f"
+QUERY_RECORD_SEPARATOR = "\x1e"
 
 KNOWN_ARCHS: Set[str] = {"x86_64", "aarch64", "ppc64le", "s390x", "noarch"}
 
+QUERY_ENGINES: List[str] = ["dnf", "repodata", "libsolv"]
+
+REPOSITORY_METADATA_NAMESPACES: Dict[str, str] = {
+    "repo": "http://linux.duke.edu/metadata/repo",
+    "common": "http://linux.duke.edu/metadata/common",
+    "rpm": "http://linux.duke.edu/metadata/rpm",
+}
+
+# The same dependency kinds dnf repoquery --whatdepends matches against
+DEPENDENCY_TYPES: List[str] = ["requires", "recommends", "suggests", "supplements", "enhances"]
+
+RICH_DEPENDENCY_KEYWORDS: Set[str] = {"and", "or", "if", "else", "with", "without", "unless"}
+
+
+def get_resident_memory() -> int | None:
+    """
+    Get the resident memory of the process.
+
+    Returns:
+        The resident memory in bytes, or None if it can't be read (from /proc)
+    """
+    try:
+        with open("/proc/self/statm") as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def get_peak_resident_memory() -> int | None:
+    """
+    Get the peak resident memory of the process so far.
+
+    Returns:
+        The peak resident memory in bytes, or None if it can't be read (from /proc)
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        return None
+    return None
+
+
+def compute_percentile(sorted_values: List[float], percent: int) -> float:
+    """
+    Compute a percentile of some values with the nearest-rank method.
+
+    Args:
+        sorted_values: The values, sorted in ascending order (at least one)
+        percent: The percentile (e.g. 95 for the 95th percentile)
+
+    Returns:
+        The smallest value that at least that percentage of the values are less than or equal to
+    """
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[rank - 1]
+
 
 class RepoQueryMetrics:
     """
@@ -32,14 +137,39 @@ class RepoQueryMetrics:
 
     This class focuses purely on metrics gathering:
     - Call counting by type
+    - Wall-clock and CPU timing by type (calls, filter runs, cache lookups, subprocess spawns),
+      with the CPU time of the commands run (dnf, filter commands) apart from this process's
+    - Sizes of the dependents graphs walked and of their transitive closures
+    - Trace events for a Chrome/Perfetto trace, if tracing is on
     - Statistics generation
     """
 
-    def __init__(self):
+    def __init__(self, tracing: bool = False):
         self._call_count: int = 0
         self._calls_by_type: Dict[str, int] = {}
         self._filter_calls: int = 0
         self._filter_failures: int = 0
+        self._filter_time: float = 0.0
+        self._slowest_filter_call: float = 0.0
+        self._latencies: Dict[str, List[float]] = {}
+        self._cpu_times: Dict[str, float] = {}
+        self._command_cpu_times: Dict[str, float] = {}
+        self._tracing = tracing
+        self._trace_events: List[Dict[str, Any]] = []
+        self._thread_names: Dict[Tuple[int, int], str] = {}
+        self._graph_count: int = 0
+        self._graph_packages: int = 0
+        self._graph_edges: int = 0
+        self._closure_count: int = 0
+        self._closure_dependents: int = 0
+        self._largest_closure: int = 0
+        self._initial_resident_memory: int | None = get_resident_memory()
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        """Whether trace events are recorded."""
+        return self._tracing
 
     def log_call(self, purpose: str, package_name: str) -> None:
         """
@@ -49,20 +179,182 @@ class RepoQueryMetrics:
             purpose: The purpose of the repoquery call (e.g., 'find_direct_dependents')
             package_name: The package being queried
         """
-        self._call_count += 1
-        self._calls_by_type[purpose] = self._calls_by_type.get(purpose, 0) + 1
+        with self._lock:
+            self._call_count += 1
+            self._calls_by_type[purpose] = self._calls_by_type.get(purpose, 0) + 1
+
+    @contextlib.contextmanager
+    def time_call(self, purpose: str, package_name: str) -> Generator[None, None, None]:
+        """
+        Log a repoquery call and time it, for the duration of the with block.
+
+        Args:
+            purpose: The purpose of the repoquery call (e.g., 'find_direct_dependents')
+            package_name: The package being queried
+        """
+        self.log_call(purpose, package_name)
+        start_time = time.perf_counter()
+        start_cpu_time = time.thread_time()
+        start_command_cpu_time = get_command_cpu_time()
+        try:
+            yield
+        finally:
+            self.record_span(
+                purpose, package_name, start_time,
+                time.perf_counter() - start_time, time.thread_time() - start_cpu_time,
+                get_command_cpu_time() - start_command_cpu_time
+            )
 
-    def log_filter_call(self, package_name: str, success: bool) -> None:
+    def log_filter_call(self, package_name: str, success: bool, duration: float = 0.0) -> None:
         """
         Log a filter command call.
 
         Args:
             package_name: The package being filtered
             success: Whether the filter command succeeded
+            duration: How long the filter command took, in seconds
+        """
+        with self._lock:
+            self._filter_calls += 1
+            if not success:
+                self._filter_failures += 1
+            self._filter_time += duration
+            self._slowest_filter_call = max(self._slowest_filter_call, duration)
+
+    def log_graph(self, package_count: int, edge_count: int) -> None:
+        """
+        Log the size of a dependents graph that was walked.
+
+        Args:
+            package_count: Number of packages in the graph
+            edge_count: Number of direct dependencies between them
+        """
+        with self._lock:
+            self._graph_count += 1
+            self._graph_packages += package_count
+            self._graph_edges += edge_count
+
+    def log_closure_sizes(self, dependents_counts: Iterable[int]) -> None:
+        """
+        Log the sizes of transitive closures that were computed.
+
+        Args:
+            dependents_counts: Number of transitive dependents of each package
+        """
+        with self._lock:
+            for dependents_count in dependents_counts:
+                self._closure_count += 1
+                self._closure_dependents += dependents_count
+                self._largest_closure = max(self._largest_closure, dependents_count)
+
+    def record_span(
+            self,
+            category: str,
+            name: str,
+            start_time: float,
+            wall_time: float,
+            cpu_time: float = 0.0,
+            command_cpu_time: float = 0.0,
+            trace: bool = True
+        ) -> None:
+        """
+        Record how long something took, for the latency statistics and the trace.
+
+        Args:
+            category: What kind of thing it was (a call type, 'filter', a cache lookup, ...)
+            name: What it was done on, usually a package name
+            start_time: When it started, from time.perf_counter()
+            wall_time: How long it took, in seconds
+            cpu_time: How much CPU time the thread spent on it, in seconds
+            command_cpu_time: How much CPU time the commands run for it spent, in seconds
+            trace: Whether to add it to the trace too, if tracing is on (cache lookups
+                are too many and too short to be worth it)
+        """
+        with self._lock:
+            self._latencies.setdefault(category, []).append(wall_time)
+            self._cpu_times[category] = self._cpu_times.get(category, 0.0) + cpu_time
+            if command_cpu_time:
+                self._command_cpu_times[category] = self._command_cpu_times.get(category, 0.0) + command_cpu_time
+
+            if not (self._tracing and trace):
+                return
+
+            thread = threading.current_thread()
+            process_id = os.getpid()
+            thread_id = threading.get_native_id()
+            self._thread_names.setdefault((process_id, thread_id), thread.name)
+            self._trace_events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start_time * 1e6,
+                "dur": wall_time * 1e6,
+                "pid": process_id,
+                "tid": thread_id,
+                "args": {"cpu_ms": round(cpu_time * 1e3, 3), "command_cpu_ms": round(command_cpu_time * 1e3, 3)},
+            })
+
+    def take_measurements(self) -> Dict[str, Any]:
+        """
+        Hand over the timings recorded so far and forget about them.
+
+        Query workers use this to pass their timings on to the metrics of the
+        process that started them.
+
+        Returns:
+            Dictionary with the recorded 'latencies', 'cpu_times', 'command_cpu_times',
+            'trace_events' and 'thread_names'
+        """
+        with self._lock:
+            measurements = {
+                "latencies": self._latencies,
+                "cpu_times": self._cpu_times,
+                "command_cpu_times": self._command_cpu_times,
+                "trace_events": self._trace_events,
+                "thread_names": self._thread_names,
+            }
+            self._latencies = {}
+            self._cpu_times = {}
+            self._command_cpu_times = {}
+            self._trace_events = []
+            self._thread_names = {}
+        return measurements
+
+    def add_measurements(self, measurements: Dict[str, Any]) -> None:
+        """
+        Add timings handed over by take_measurements.
+
+        Args:
+            measurements: The timings, as returned by take_measurements
+        """
+        with self._lock:
+            for category, latencies in measurements["latencies"].items():
+                self._latencies.setdefault(category, []).extend(latencies)
+            for category, cpu_time in measurements["cpu_times"].items():
+                self._cpu_times[category] = self._cpu_times.get(category, 0.0) + cpu_time
+            for category, command_cpu_time in measurements["command_cpu_times"].items():
+                self._command_cpu_times[category] = self._command_cpu_times.get(category, 0.0) + command_cpu_time
+            if self._tracing:
+                self._trace_events.extend(measurements["trace_events"])
+                for thread_key, thread_name in measurements["thread_names"].items():
+                    self._thread_names.setdefault(thread_key, thread_name)
+
+    def write_trace(self, trace_file: Path) -> None:
+        """
+        Write the trace events in the Chrome trace event format, which Perfetto reads too.
+
+        Args:
+            trace_file: The file to write the trace to
         """
-        self._filter_calls += 1
-        if not success:
-            self._filter_failures += 1
+        with self._lock:
+            trace_events = [
+                {"name": "thread_name", "ph": "M", "pid": process_id, "tid": thread_id, "args": {"name": thread_name}}
+                for (process_id, thread_id), thread_name in self._thread_names.items()
+            ]
+            trace_events.extend(sorted(self._trace_events, key=lambda event: event["ts"]))
+
+        with open(trace_file, "w") as output:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, output)
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -71,24 +363,160 @@ class RepoQueryMetrics:
         Returns:
             Dictionary containing statistics about dnf repoquery calls
         """
+        with self._lock:
+            latencies = {}
+            for category, durations in self._latencies.items():
+                sorted_durations = sorted(durations)
+                latencies[category] = {
+                    "count": len(sorted_durations),
+                    "total": sum(sorted_durations),
+                    "cpu_time": self._cpu_times.get(category, 0.0),
+                    "command_cpu_time": self._command_cpu_times.get(category, 0.0),
+                    "p50": compute_percentile(sorted_durations, 50),
+                    "p95": compute_percentile(sorted_durations, 95),
+                    "max": sorted_durations[-1],
+                }
+
         return {
             "total_calls": self._call_count,
             "calls_by_type": self._calls_by_type.copy(),
             "filter_calls": self._filter_calls,
             "filter_failures": self._filter_failures,
+            "filter_time": self._filter_time,
+            "slowest_filter_call": self._slowest_filter_call,
+            "latencies": latencies,
+            "graph_count": self._graph_count,
+            "graph_packages": self._graph_packages,
+            "graph_edges": self._graph_edges,
+            "closure_count": self._closure_count,
+            "closure_dependents": self._closure_dependents,
+            "largest_closure": self._largest_closure,
+            "initial_resident_memory": self._initial_resident_memory,
+            "resident_memory": get_resident_memory(),
+            "peak_resident_memory": get_peak_resident_memory(),
+        }
+
+
+class PersistentCacheStore:
+    """
+    Stores cache entries on disk so they can be shared between invocations.
+
+    Entries live in an SQLite database and are keyed by a fingerprint of the
+    repository set (see compute_repository_key), so they stop being used as soon
+    as a compose changes. SQLite's file locking, in write-ahead-log mode, lets
+    several invocations read and write the same database concurrently.
+    """
+
+    # Drop entries for repository sets that haven't been used in this many seconds
+    EXPIRY_SECONDS = 14 * 24 * 60 * 60
+
+    def __init__(self, path: Path, repository_key: str):
+        self._path = path
+        self._repository_key = repository_key
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS repository_keys "
+            "(repository_key TEXT PRIMARY KEY, last_used REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries "
+            "(repository_key TEXT NOT NULL, cache_name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (repository_key, cache_name, key))"
+        )
+
+        now = time.time()
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO repository_keys (repository_key, last_used) VALUES (?, ?)",
+                (repository_key, now)
+            )
+            self._connection.execute(
+                "DELETE FROM cache_entries WHERE repository_key IN "
+                "(SELECT repository_key FROM repository_keys WHERE last_used < ?)",
+                (now - self.EXPIRY_SECONDS,)
+            )
+            self._connection.execute("DELETE FROM repository_keys WHERE last_used < ?", (now - self.EXPIRY_SECONDS,))
+
+        logging.debug(f"📋 Using persistent cache {path} (repository key {repository_key[:16]})")
+
+    def load(self, cache_name: str, key: str) -> Any | None:
+        """
+        Load a cache entry.
+
+        Args:
+            cache_name: The name of the cache the entry belongs to
+            key: The entry key
+
+        Returns:
+            The stored value, or None if there is no entry
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM cache_entries WHERE repository_key = ? AND cache_name = ? AND key = ?",
+                (self._repository_key, cache_name, key)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def store(self, cache_name: str, key: str, value: Any) -> None:
+        """
+        Store a cache entry, replacing any existing one.
+
+        Args:
+            cache_name: The name of the cache the entry belongs to
+            key: The entry key
+            value: The value to store (must be JSON serializable)
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (repository_key, cache_name, key, value) VALUES (?, ?, ?, ?)",
+                (self._repository_key, cache_name, key, json.dumps(value))
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get persistent store statistics.
+
+        Returns:
+            Dictionary containing the database path and repository key
+        """
+        return {
+            "path": str(self._path),
+            "repository_key": self._repository_key,
         }
 
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        with self._lock:
+            self._connection.close()
+
 
 class SourcePackageCache:
     """
     Caches source package mappings for performance optimization.
 
     This class handles the caching of binary package to source package mappings
-    to avoid repeated repoquery calls for the same package.
+    to avoid repeated repoquery calls for the same package. Mappings are also
+    kept in the persistent store, if there is one.
+
+    Once the cache has been preloaded with the mappings of every package in the
+    repositories, packages it doesn't know about are reported as not found.
     """
 
-    def __init__(self):
+    def __init__(self, persistent_store: PersistentCacheStore | None = None):
         self._cache: Dict[str, str] = {}
+        self._persistent_store = persistent_store
+        self._preloaded: bool = False
+        self._memory_hits: int = 0
+        self._persistent_hits: int = 0
 
     def get(self, package_name: str) -> str | None:
         """
@@ -100,7 +528,49 @@ class SourcePackageCache:
         Returns:
             The cached source package name, None if not cached, or '' if package not found
         """
-        return self._cache.get(package_name)
+        source_package_name = self._cache.get(package_name)
+        if source_package_name is not None:
+            self._memory_hits += 1
+            return source_package_name
+
+        if self._preloaded:
+            self._memory_hits += 1
+            return ''
+
+        if self._persistent_store is None:
+            return None
+
+        source_package_name = self._persistent_store.load("source_packages", package_name)
+        if source_package_name is not None:
+            self._persistent_hits += 1
+            self._cache[package_name] = source_package_name
+        return source_package_name
+
+    def has(self, package_name: str) -> bool:
+        """
+        Check if a package has a cached source package mapping (found or not found).
+
+        Unlike get, this isn't counted as a cache lookup in the statistics.
+
+        Args:
+            package_name: The binary package name
+
+        Returns:
+            True if the package has a cached mapping, False otherwise
+        """
+        if package_name in self._cache or self._preloaded:
+            return True
+
+        if self._persistent_store is None:
+            return False
+
+        source_package_name = self._persistent_store.load("source_packages", package_name)
+        if source_package_name is None:
+            return False
+
+        self._persistent_hits += 1
+        self._cache[package_name] = source_package_name
+        return True
 
     def set(self, package_name: str, source_package_name: str | None) -> None:
         """
@@ -111,61 +581,142 @@ class SourcePackageCache:
             source_package_name: The source package name, or '' if package not found
         """
         self._cache[package_name] = source_package_name
+        if self._persistent_store is not None:
+            self._persistent_store.store("source_packages", package_name, source_package_name)
         if source_package_name == '':
             logging.debug(f"   Cached package not found: {package_name} → not found")
         else:
             logging.debug(f"   Cached source package mapping: {package_name} → {source_package_name}")
 
-    def get_stats(self) -> Dict[str, Any]:
+    def copy_from(self, other: "SourcePackageCache", keep: Callable[[str], bool]) -> None:
+        """
+        Copy the mappings another cache has found, e.g. for an older compose, that still hold.
+
+        The mappings are kept in memory only.
+
+        Args:
+            other: The cache to copy from
+            keep: Function that takes a binary package name and returns True if its mapping still holds
+        """
+        mappings = {package_name: source_package_name for package_name, source_package_name in other._cache.items() if keep(package_name)}
+        self._cache.update(mappings)
+        logging.debug(f"   Copied {len(mappings)} source package mappings")
+
+    def preload(self, source_packages: Dict[str, str]) -> None:
+        """
+        Fill the cache with the source package mappings of every package in the repositories.
+
+        The mappings are kept in memory only, since they're cheap to load again.
+
+        Args:
+            source_packages: Dictionary mapping every binary package name to its source package name
+        """
+        self._cache.update(source_packages)
+        self._preloaded = True
+        logging.debug(f"   Preloaded {len(source_packages)} source package mappings")
+
+    def get_stats(self, include_results: bool = False) -> Dict[str, Any]:
         """
         Get cache statistics.
 
+        Args:
+            include_results: Whether to list the cached result of every package
+
         Returns:
             Dictionary containing cache statistics
         """
-        found_count = sum(1 for result in self._cache.values() if result is not None)
+        found_count = sum(1 for result in self._cache.values() if result)
         not_found_count = len(self._cache) - found_count
-        return {
+        stats = {
             "cache_size": len(self._cache),
             "found_count": found_count,
             "not_found_count": not_found_count,
-            "cached_packages": list(sorted(self._cache.keys())),
+            "preloaded": self._preloaded,
+            "memory_hits": self._memory_hits,
+            "persistent_hits": self._persistent_hits,
         }
+        if include_results:
+            stats["cached_results"] = {package: self._cache[package] for package in sorted(self._cache.keys())}
+        return stats
 
 
-class FilterCache:
+class DescriptionCache:
     """
-    Caches filter command results for performance optimization.
+    Caches package descriptions.
 
-    This class handles the caching of filter command results to avoid running
-    the same filter command multiple times for the same package.
+    This class handles the caching of package descriptions to avoid repeated
+    repoquery calls for the same package. Descriptions are also kept in the
+    persistent store, if there is one.
     """
 
-    def __init__(self):
-        self._cache: Dict[str, bool] = {}
+    def __init__(self, persistent_store: PersistentCacheStore | None = None):
+        self._cache: Dict[str, str] = {}
+        self._persistent_store = persistent_store
+        self._memory_hits: int = 0
+        self._persistent_hits: int = 0
 
-    def get(self, package_name: str) -> bool | None:
+    def get(self, package_name: str) -> str | None:
         """
-        Get a cached filter result.
+        Get a cached package description.
 
         Args:
             package_name: The package name
 
         Returns:
-            The cached filter result (True if package passed filter, False if failed), or None if not cached
+            The cached description, None if not cached, or '' if the package has no description
         """
-        return self._cache.get(package_name)
+        description = self._cache.get(package_name)
+        if description is not None:
+            self._memory_hits += 1
+            return description
 
-    def set(self, package_name: str, passed_filter: bool) -> None:
+        if self._persistent_store is None:
+            return None
+
+        description = self._persistent_store.load("descriptions", package_name)
+        if description is not None:
+            self._persistent_hits += 1
+            self._cache[package_name] = description
+        return description
+
+    def has(self, package_name: str) -> bool:
         """
-        Cache a filter result.
+        Check if a package has a cached description.
+
+        Unlike get, this isn't counted as a cache lookup in the statistics.
 
         Args:
             package_name: The package name
-            passed_filter: Whether the package passed the filter (True) or failed (False)
+
+        Returns:
+            True if the package has a cached description, False otherwise
         """
-        self._cache[package_name] = passed_filter
-        logging.debug(f"   Cached filter result: {package_name} → {'pass' if passed_filter else 'fail'}")
+        if package_name in self._cache:
+            return True
+
+        if self._persistent_store is None:
+            return False
+
+        description = self._persistent_store.load("descriptions", package_name)
+        if description is None:
+            return False
+
+        self._persistent_hits += 1
+        self._cache[package_name] = description
+        return True
+
+    def set(self, package_name: str, description: str) -> None:
+        """
+        Cache a package description.
+
+        Args:
+            package_name: The package name
+            description: The description, or '' if the package has no description
+        """
+        self._cache[package_name] = description
+        if self._persistent_store is not None:
+            self._persistent_store.store("descriptions", package_name, description)
+        logging.debug(f"   Cached description for {package_name}")
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -174,1391 +725,6850 @@ class FilterCache:
         Returns:
             Dictionary containing cache statistics
         """
-        passed_count = sum(1 for result in self._cache.values() if result)
-        failed_count = len(self._cache) - passed_count
+        found_count = sum(1 for description in self._cache.values() if description)
         return {
             "cache_size": len(self._cache),
-            "passed_count": passed_count,
-            "failed_count": failed_count,
-            "cached_packages": list(sorted(self._cache.keys())),
+            "found_count": found_count,
+            "not_found_count": len(self._cache) - found_count,
+            "memory_hits": self._memory_hits,
+            "persistent_hits": self._persistent_hits,
         }
 
 
-class DependencyCache:
+class FilterCache:
     """
-    Caches dependency query results for performance optimization.
+    Caches filter command results for performance optimization.
 
-    This class handles the caching of dnf repoquery --whatdepends results to avoid
-    repeated calls for the same package. It also tracks whether the cached results
-    are partial (limited by max_results) or complete.
+    This class handles the caching of filter command results to avoid running
+    the same filter command multiple times for the same package. Results are
+    also kept in the persistent store, if there is one, under the filter's description.
     """
 
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, persistent_store: PersistentCacheStore | None = None, filter_description: str | None = None):
+        self._cache: Dict[str, bool] = {}
+        self._persistent_store = persistent_store
+        self._persistent_cache_name = f"filter_results {filter_description}"
+        self._memory_hits: int = 0
+        self._persistent_hits: int = 0
 
-    def get(self, package_name: str) -> List[str] | None:
+    def get(self, package_name: str) -> bool | None:
         """
-        Get cached dependencies for a package.
+        Get a cached filter result.
 
         Args:
             package_name: The package name
 
         Returns:
-            The cached list of dependent packages, or None if not cached
+            The cached filter result (True if package passed filter, False if failed), or None if not cached
         """
-        entry = self._cache.get(package_name)
-        if entry is not None:
-            return entry["dependents"]
-        return None
+        passed_filter = self._cache.get(package_name)
+        if passed_filter is not None:
+            self._memory_hits += 1
+            return passed_filter
+
+        if self._persistent_store is None:
+            return None
+
+        passed_filter = self._persistent_store.load(self._persistent_cache_name, package_name)
+        if passed_filter is not None:
+            self._persistent_hits += 1
+            self._cache[package_name] = passed_filter
+        return passed_filter
 
     def has(self, package_name: str) -> bool:
         """
-        Check if a package has any cached results (partial or complete).
+        Check if a package has a cached filter result.
+
+        Unlike get, this isn't counted as a cache lookup in the statistics.
 
         Args:
             package_name: The package name
 
         Returns:
-            True if the package has cached results, False otherwise
+            True if the package has a cached filter result, False otherwise
         """
-        return package_name in self._cache
+        if package_name in self._cache:
+            return True
 
-    def has_all(self, package_name: str) -> bool:
-        """
-        Check if a package has complete (non-partial) cached results.
+        if self._persistent_store is None:
+            return False
 
-        Args:
-            package_name: The package name
+        passed_filter = self._persistent_store.load(self._persistent_cache_name, package_name)
+        if passed_filter is None:
+            return False
 
-        Returns:
-            True if the package has complete cached results, False otherwise
-        """
-        entry = self._cache.get(package_name)
-        if entry is not None:
-            return not entry["partial"]
-        return False
+        self._persistent_hits += 1
+        self._cache[package_name] = passed_filter
+        return True
 
-    def set(self, package_name: str, dependents: List[str], partial: bool = False) -> None:
+    def set(self, package_name: str, passed_filter: bool) -> None:
         """
-        Cache dependency results for a package.
+        Cache a filter result.
 
         Args:
             package_name: The package name
-            dependents: List of dependent package names
-            partial: Whether the results are partial (limited by max_results)
+            passed_filter: Whether the package passed the filter (True) or failed (False)
         """
-        self._cache[package_name] = {
-            "dependents": dependents,
-            "partial": partial
-        }
-        partial_info = " (partial)" if partial else ""
-        logging.debug(f"   Cached dependency results: {package_name} → {len(dependents)} dependents{partial_info}")
+        self._cache[package_name] = passed_filter
+        if self._persistent_store is not None:
+            self._persistent_store.store(self._persistent_cache_name, package_name, passed_filter)
+        logging.debug(f"   Cached filter result: {package_name} → {'pass' if passed_filter else 'fail'}")
 
-    def get_stats(self) -> Dict[str, Any]:
+    def get_stats(self, include_results: bool = False) -> Dict[str, Any]:
         """
         Get cache statistics.
 
+        Args:
+            include_results: Whether to list the cached result of every package
+
         Returns:
             Dictionary containing cache statistics
         """
-        total_dependents = sum(len(entry["dependents"]) for entry in self._cache.values())
-        partial_count = sum(1 for entry in self._cache.values() if entry["partial"])
-        complete_count = len(self._cache) - partial_count
-        return {
+        passed_count = sum(1 for result in self._cache.values() if result)
+        failed_count = len(self._cache) - passed_count
+        stats = {
             "cache_size": len(self._cache),
-            "total_dependents": total_dependents,
-            "complete_count": complete_count,
-            "partial_count": partial_count,
-            "cached_packages": list(sorted(self._cache.keys())),
+            "passed_count": passed_count,
+            "failed_count": failed_count,
+            "memory_hits": self._memory_hits,
+            "persistent_hits": self._persistent_hits,
         }
+        if include_results:
+            stats["cached_results"] = {package: self._cache[package] for package in sorted(self._cache.keys())}
+        return stats
 
 
-class RepoQueryError(Exception):
-    """Raised when a dnf repoquery call fails or returns invalid data."""
+class PackageIds:
+    """
+    Interns package names as integer IDs.
 
-    def __init__(self, message: str, exit_code: int = EXIT_REPO_QUERY_ERROR):
-        super().__init__(message)
-        self.exit_code = exit_code
+    Dependency graphs hold package IDs in compact arrays instead of a Python string
+    per edge and a dictionary per node. Names are looked up again when the results
+    are written out.
+    """
 
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
 
-class NoDependentsFoundError(Exception):
-    """Raised when no dependents are found for a package."""
+    def intern(self, package_name: str) -> int:
+        """
+        Get the ID of a package, assigning a new one if the package doesn't have one yet.
 
-    def __init__(self, package_name: str):
-        super().__init__(f"No dependents found for package: {package_name}")
-        self.package_name = package_name
-        self.exit_code = EXIT_NO_DEPENDENTS_FOUND
+        Args:
+            package_name: The package name
+
+        Returns:
+            The package ID
+        """
+        package_id = self._ids.get(package_name)
+        if package_id is None:
+            package_id = len(self._names)
+            self._ids[package_name] = package_id
+            self._names.append(package_name)
+        return package_id
+
+    def name(self, package_id: int) -> str:
+        """
+        Get the name of a package from its ID.
 
+        Args:
+            package_id: The package ID
 
-class PackageNotFoundError(Exception):
-    """Raised when a package is not found in the repositories."""
+        Returns:
+            The package name
+        """
+        return self._names[package_id]
 
-    def __init__(self, package_name: str):
-        super().__init__(f"Package not found in repositories: {package_name}")
-        self.package_name = package_name
-        self.exit_code = EXIT_PACKAGE_NOT_FOUND
+    def names(self, package_ids: Iterable[int]) -> List[str]:
+        """
+        Get the names of packages from their IDs.
+
+        Args:
+            package_ids: The package IDs
+
+        Returns:
+            The package names, in the same order
+        """
+        return [self._names[package_id] for package_id in package_ids]
 
+    def __len__(self) -> int:
+        return len(self._names)
 
-def run_filter_command(package_name: str, filter_command: str, metrics: RepoQueryMetrics, filter_cache: FilterCache, verbose: bool = False) -> bool:
+
+class DependentsRecord:
+    """
+    The dependents of a package, as an array of package IDs, and whether they are partial.
     """
-    Run a filter command on a package to determine if it should be included.
 
-    Args:
-        package_name: The package name to check
-        filter_command: The shell command to run
-        metrics: Metrics object to track filter command usage
-        filter_cache: Cache object to store filter results
-        verbose: Whether to enable verbose logging
+    __slots__ = ("dependents", "partial")
 
-    Returns:
-        True if the command succeeds (package should be included), False otherwise
+    def __init__(self, dependents: Iterable[int] = (), partial: bool = False):
+        self.dependents = array("i", dependents)
+        self.partial = partial
+
+
+class TransitiveClosure:
     """
-    if not filter_command or not filter_command.strip():
-        return True
+    The transitive dependents of the packages of a dependents graph.
 
-    cached_result = filter_cache.get(package_name)
-    if cached_result is not None:
-        logging.debug(f"📋 Filter cache hit: Filter result for {package_name} → {'pass' if cached_result else 'fail'}")
-        return cached_result
+    The dependents of all the packages are stored back to back in one array of
+    package IDs, with a second array holding the offset where the dependents of
+    each package start (compressed sparse row layout).
+    """
 
-    logging.debug(f"🔍 Running filter command on package: {package_name}")
+    def __init__(self, package_ids: PackageIds):
+        self._package_ids = package_ids
+        self._positions: Dict[int, int] = {}
+        self._packages = array("i")
+        self._offsets = array("q", [0])
+        self._dependents = array("i")
+        self._partial = bytearray()
 
-    try:
-        result = run_command(
-            filter_command,
-            extra_environment={"PACKAGE": package_name}
-        )
+    def add(self, package_id: int, dependents: Iterable[int], partial: bool) -> None:
+        """
+        Add the transitive dependents of a package.
 
-        success = result["return_code"] == 0
-        metrics.log_filter_call(package_name, success)
+        Args:
+            package_id: The package ID
+            dependents: The IDs of the transitive dependents of the package
+            partial: Whether the dependents are partial
+        """
+        self._positions[package_id] = len(self._packages)
+        self._packages.append(package_id)
+        self._dependents.extend(dependents)
+        self._offsets.append(len(self._dependents))
+        self._partial.append(partial)
 
-        filter_cache.set(package_name, success)
+    def dependents(self, package_id: int) -> array:
+        """
+        Get the transitive dependents of a package.
 
-        if success:
-            logging.debug(f"   ✅ Filter command succeeded for {package_name}")
-        else:
-            logging.debug(f"   ❌ Filter command failed for {package_name} (exit code: {result['return_code']})")
+        Args:
+            package_id: The package ID
 
-        return success
+        Returns:
+            The IDs of the transitive dependents of the package
+        """
+        position = self._positions[package_id]
+        return self._dependents[self._offsets[position]:self._offsets[position + 1]]
 
-    except Exception as e:
-        logging.debug(f"   💥 Filter command error for {package_name}: {e}")
-        metrics.log_filter_call(package_name, False)
-        filter_cache.set(package_name, False)
-        return False
+    def items(self) -> Generator[Tuple[str, List[str], bool], None, None]:
+        """
+        Generator that yields the packages by name, in the order they were added.
 
+        Yields:
+            Tuples of package name, transitive dependent names and partial flag
+        """
+        for position, package_id in enumerate(self._packages):
+            dependent_ids = self._dependents[self._offsets[position]:self._offsets[position + 1]]
+            yield self._package_ids.name(package_id), self._package_ids.names(dependent_ids), bool(self._partial[position])
 
-def update_dnf_cache(repository_paths: Dict[str, str], verbose: bool = False) -> None:
-    """
-    Update dnf cache for all repositories once upfront.
-    This allows subsequent repoquery calls to use --cacheonly for better performance.
+    def entries(self) -> Iterable[Dict[str, Any]]:
+        """
+        Get the packages as the package dictionaries of the --all output, in the order they were added.
 
-    Args:
-        repository_paths: Dictionary mapping repository IDs to URLs
-        verbose: Whether to enable verbose logging
+        The dictionaries are made every time they're iterated over, from the arrays.
 
-    Raises:
-        RepoQueryError: If the dnf cache update fails
-    """
+        Returns:
+            Iterable of dictionaries with the package name, its transitive dependent names and its partial flag
+        """
+        return TransitiveClosureEntries(self)
 
-    logging.debug("🔄 Updating dnf cache for all repositories...")
+    def dependents_counts(self) -> Generator[int, None, None]:
+        """
+        Generator that yields the number of transitive dependents of each package, in the order they were added.
 
-    try:
-        result = dnf("makecache --refresh", repository_paths, verbose, cache_only=False)
-        logging.debug("✅ Dnf cache updated successfully")
-        logging.debug(f"Cache update output: {result}")
-    except subprocess.CalledProcessError as error:
-        stderr = error.stderr.strip() if error.stderr else "Unknown error"
-        raise RepoQueryError(f"Failed to update dnf cache: {stderr}", EXIT_CACHE_UPDATE_ERROR)
+        Yields:
+            Number of transitive dependents of a package
+        """
+        for position in range(len(self._packages)):
+            yield self._offsets[position + 1] - self._offsets[position]
 
+    def __contains__(self, package_id: int) -> bool:
+        return package_id in self._positions
 
-def derive_repository_id_from_url(repository_url: str) -> str:
+    def __len__(self) -> int:
+        return len(self._packages)
+
+
+class TransitiveClosureEntries:
+    """
+    The packages of a transitive closure as package dictionaries, made as they're iterated over.
     """
-    Derive a unique repository key from a full repository URL.
 
-    The algorithm is:
-    - Uses hostname[_port] as fallback if no suitable path segment is found
-    - Picks the last path segment that isn't 'os' or known architectures
-    - Appends first 16 hex chars of SHA-256 for uniqueness
+    def __init__(self, graph: TransitiveClosure):
+        self._graph = graph
 
-    Args:
-        repository_url: The full repository URL to derive an ID from
+    def __iter__(self) -> Generator[Dict[str, Any], None, None]:
+        for package, dependents, partial in self._graph.items():
+            yield {"package": package, "dependents": dependents, "partial": partial}
 
-    Returns:
-        A unique repository identifier string
+
+class FinishedPackageTracker:
+    """
+    Tracks which packages of a dependents graph being walked have their final transitive dependents.
+
+    A package is finished once it can't reach any package still to be walked. Each
+    walked package counts its dependents that aren't finished yet, and finishing a
+    package counts down its dependers, so packages finish from the bottom of the graph
+    up as the walk goes. Packages in a cycle keep each other's counts up, so once
+    enough packages were walked since the last time (and at the end of the walk), the
+    packages that still reach unwalked packages are worked out again, and the others
+    are finished too.
+
+    Like compute_transitive_closure, it works out which packages each finished package
+    reaches, and whether any of them is partial, once per strongly connected component.
     """
-    parsed_url = urlparse(repository_url)
 
-    segments = [segment for segment in parsed_url.path.strip("/").split("/") if segment]
+    def __init__(self):
+        self._positions: Dict[int, int] = {}
+        self._dependers: Dict[int, List[int]] = {}
+        self._unfinished_counts: Dict[int, int] = {}
+        self._reachable_packages: Dict[int, int] = {}
+        self._dependents_partial: Dict[int, bool] = {}
+        self._may_have_cycles = False
+        self._walked_since_recount = 0
+
+    def add_level(self, dependents_map: Dict[int, DependentsRecord], queue: Iterable[int]) -> List[int]:
+        """
+        Take in the packages walked since the last call, and find the packages they finish.
 
-    component = None
-    for segment in reversed(segments):
-        if segment == "os" or segment in KNOWN_ARCHS:
-            continue
-        component = segment
-        break
+        Args:
+            dependents_map: Dictionary mapping package IDs, in the order they were walked, to their direct dependents
+            queue: The packages still to be walked
 
-    if not component:
-        host = parsed_url.hostname or ""
-        component = f"{host}_{parsed_url.port}" if parsed_url.port else host
+        Returns:
+            The packages that finished, in the order they were walked
+        """
+        ready_packages: List[int] = []
+        for package in islice(dependents_map, len(self._positions), None):
+            self._positions[package] = len(self._positions)
+            self._walked_since_recount += 1
+
+            unfinished_count = 0
+            for dependent in set(dependents_map[package].dependents):
+                if dependent == package or dependent in self._reachable_packages:
+                    continue
+                if dependent in self._positions:
+                    # Walked but not finished, so the edge may close a cycle
+                    self._may_have_cycles = True
+                self._dependers.setdefault(dependent, []).append(package)
+                unfinished_count += 1
 
-    component_safe = re.sub(r"[^A-Za-z0-9_]+", "_", component)
-    digest = sha256(repository_url.encode("utf-8")).hexdigest()[:16]
-    return f"{component_safe}_{digest}"
+            self._unfinished_counts[package] = unfinished_count
+            if not unfinished_count:
+                ready_packages.append(package)
 
+        finished_packages = self._count_down(ready_packages)
 
-def get_signal_name(signal_num: int) -> str:
-    """
-    Get the name of a signal number.
+        queue = list(queue)
+        recount_due = not queue or self._walked_since_recount >= len(self._unfinished_counts)
+        if self._unfinished_counts and self._may_have_cycles and recount_due:
+            finished_packages.extend(self._finish_unreaching(queue))
 
-    Args:
-        signal_num: The signal number
+        self._settle_reachable_packages(finished_packages, dependents_map)
 
-    Returns:
-        The signal name as a string
-    """
-    try:
-        return signal.Signals(signal_num).name
-    except ValueError:
-        return f"SIG{signal_num}"
+        return sorted(finished_packages, key=self._positions.__getitem__)
 
+    def walk_position(self, package: int) -> int:
+        """
+        Get where a walked package comes in the walk.
 
-def quote_command(args):
-    """
-    Join a list of arguments into a command string, only quoting arguments
-    that would be semantically different if left unquoted.
+        Args:
+            package: The walked package ID
 
-    An argument needs quoting if leaving it unquoted would cause the shell
-    to interpret it differently (split it into multiple arguments, perform
-    expansions, etc.).
+        Returns:
+            How many packages were walked before it
+        """
+        return self._positions[package]
 
-    Args:
-        args: List of string arguments
+    def reachable_count(self, package: int) -> int:
+        """
+        Get how many packages a finished package can reach, itself included if it's in a cycle.
 
-    Returns:
-        String representing the command with minimal quoting
-    """
-    quoted_args = []
+        Args:
+            package: The finished package ID
 
-    for arg in args:
-        if not arg:
-            quoted_args.append(shlex.quote(arg))
-            continue
+        Returns:
+            The number of packages it can reach
+        """
+        return self._reachable_packages[package].bit_count()
 
-        try:
-            if shlex.split(arg) == [arg]:
-                quoted_args.append(arg)
-            else:
-                quoted_args.append(shlex.quote(arg))
-        except ValueError:
-            quoted_args.append(shlex.quote(arg))
+    def dependents_partial(self, package: int) -> bool:
+        """
+        Get whether a finished package is partial or reaches a partial package, as walked so far.
 
-    return ' '.join(quoted_args)
+        Args:
+            package: The finished package ID
 
-def run_command(command: List[str] | str, extra_environment: Dict[str, str] | None = None) -> Dict[str, Any]:
-    """
-    Run a command and log output.
+        Returns:
+            Whether the transitive dependents of the package are partial
+        """
+        return self._dependents_partial[package]
 
-    Args:
-        command: List of command arguments to execute (or string)
-        extra_environment: Optional dictionary of additional environment variables
+    def _count_down(self, ready_packages: List[int]) -> List[int]:
+        """
+        Finish packages with no unfinished dependents, and the dependers that leaves without any.
 
-    Returns:
-        Dictionary containing 'return_code' and 'output' keys
+        Args:
+            ready_packages: Packages with no unfinished dependents
 
-    Raises:
-        subprocess.CalledProcessError: If the command returns a non-zero exit code
-    """
-    if isinstance(command, list):
-        command_string = quote_command(command)
-    else:
-        command_string = command
+        Returns:
+            The packages that finished
+        """
+        finished_packages: List[int] = []
+        while ready_packages:
+            package = ready_packages.pop()
+            del self._unfinished_counts[package]
+            finished_packages.append(package)
+            for depender in self._dependers.pop(package, ()):
+                self._unfinished_counts[depender] -= 1
+                if not self._unfinished_counts[depender]:
+                    ready_packages.append(depender)
+        return finished_packages
+
+    def _finish_unreaching(self, unwalked_packages: List[int]) -> List[int]:
+        """
+        Finish the unfinished packages that can't reach any unwalked package, such as cycles of walked packages.
 
-    logging.debug(f"\n        ❯ {command_string}")
+        Args:
+            unwalked_packages: The packages still to be walked
 
-    environment = None
-    if extra_environment:
-        environment = os.environ.copy()
-        environment.update(extra_environment)
+        Returns:
+            The packages that finished
+        """
+        self._walked_since_recount = 0
+
+        reaching_packages = set(unwalked_packages)
+        search_queue = deque(reaching_packages)
+        while search_queue:
+            package = search_queue.popleft()
+            for depender in self._dependers.get(package, ()):
+                if depender not in reaching_packages:
+                    reaching_packages.add(depender)
+                    search_queue.append(depender)
+
+        finished_packages = [package for package in self._unfinished_counts if package not in reaching_packages]
+        for package in finished_packages:
+            del self._unfinished_counts[package]
+        for package in finished_packages:
+            for depender in self._dependers.pop(package, ()):
+                if depender in self._unfinished_counts:
+                    self._unfinished_counts[depender] -= 1
+        return finished_packages
+
+    def _settle_reachable_packages(self, finished_packages: List[int], dependents_map: Dict[int, DependentsRecord]) -> None:
+        """
+        Work out which packages newly finished packages reach, and whether any of them is partial.
 
-    result = subprocess.run(
-        command_string,
-        env=environment,
-        capture_output=True,
-        shell=True,
-        text=True
-    )
+        Args:
+            finished_packages: The newly finished packages
+            dependents_map: Dictionary mapping package IDs to their direct dependents
+        """
+        finished_map = {package: dependents_map[package] for package in finished_packages}
 
-    for line in result.stderr.splitlines():
-        if line.strip():
-            logging.debug(f"        {line.strip()}")
+        # Dependents finished earlier show up as components of their own, and are already settled
+        for component in reversed(find_strongly_connected_components(finished_map)):
+            if component[0] not in finished_map:
+                continue
 
-    for line in result.stdout.splitlines():
-        if line.strip():
-            logging.debug(f"        {line.strip()}")
+            component_members = 0
+            has_partial_members = False
+            for member in component:
+                component_members |= 1 << self._positions[member]
+                has_partial_members = has_partial_members or dependents_map[member].partial
 
-    if result.returncode < 0:
-        signal_name = get_signal_name(abs(result.returncode))
-        logging.debug(f"        Process killed by signal {abs(result.returncode)} ({signal_name})")
-    else:
-        logging.debug(f"        Process exited with code {result.returncode}")
+            # Packages in a cycle reach each other, and themselves
+            reachable_packages = 0
+            reaches_partial_packages = False
+            first_member = component[0]
+            if len(component) > 1 or first_member in dependents_map[first_member].dependents:
+                reachable_packages = component_members
+                reaches_partial_packages = has_partial_members
 
-    if result.returncode != 0:
-        raise subprocess.CalledProcessError(
-            result.returncode, command,
-            result.stdout,
-            result.stderr
-        )
+            for member in component:
+                for dependent in dependents_map[member].dependents:
+                    if dependent in component:
+                        continue
+                    reachable_packages |= (1 << self._positions[dependent]) | self._reachable_packages[dependent]
+                    reaches_partial_packages = reaches_partial_packages or self._dependents_partial[dependent]
 
-    return {"return_code": result.returncode, "output": result.stdout}
+            for member in component:
+                self._reachable_packages[member] = reachable_packages
+                self._dependents_partial[member] = dependents_map[member].partial or reaches_partial_packages
 
 
-def dnf(command: str, repository_paths: Dict[str, str], verbose: bool = False, cache_only: bool = True) -> str:
+class DependencyCache:
     """
-    Execute a dnf command with repository setup and return stdout content.
+    Caches dependency query results for performance optimization.
 
-    This function factors out the repeated pattern of setting up dnf commands
-    with repository configuration and executing them.
+    This class handles the caching of dnf repoquery --whatdepends results to avoid
+    repeated calls for the same package. It also tracks whether the cached results
+    are partial (limited by max_results) or complete. Complete results are also
+    kept in the persistent store, if there is one.
 
-    Args:
-        command: The dnf command as a string (e.g., "repoquery --whatdepends package")
-        repository_paths: Dictionary mapping repository IDs to URLs
-        verbose: Whether to enable verbose logging
-        cache_only: Whether to use --cacheonly flag (default: True)
+    The results are kept as arrays of package IDs, from the package_ids table.
+    """
 
-    Returns:
-        The stdout content as a string (stripped)
+    def __init__(self, persistent_store: PersistentCacheStore | None = None):
+        self._cache: Dict[int, DependentsRecord] = {}
+        self._package_ids = PackageIds()
+        self._persistent_store = persistent_store
+        self._unused_persistent_entries: Set[int] = set()
+        self._memory_hits: int = 0
+        self._persistent_hits: int = 0
 
-    Raises:
-        subprocess.CalledProcessError: If the command returns a non-zero exit code
-    """
-    command_parts = shlex.split(command)
-    full_command = ["dnf"] + command_parts
+    @property
+    def package_ids(self) -> PackageIds:
+        """The table of package IDs the cached results use."""
+        return self._package_ids
 
-    full_command.extend(["--disablerepo=*"])
-    if not verbose:
-        full_command.append("--quiet")
-    if cache_only:
-        full_command.append("--cacheonly")
-    for repository_id, repository_url in repository_paths.items():
-        full_command.append(f"--repofrompath=repo-{repository_id},{repository_url}")
-    for repository_id in repository_paths:
-        full_command.append(f"--enablerepo=repo-{repository_id}")
+    def _get_entry(self, package_name: str) -> DependentsRecord | None:
+        """
+        Get the cache entry for a package, loading it from the persistent store if needed.
 
-    result = run_command(full_command)
-    return result["output"].strip()
+        Args:
+            package_name: The package name
 
+        Returns:
+            The cache entry, or None if not cached
+        """
+        package_id = self._package_ids.intern(package_name)
+        entry = self._cache.get(package_id)
+        if entry is not None or self._persistent_store is None:
+            return entry
 
-def generate_direct_dependents(
-        package_name: str,
-        repository_paths: Dict[str, str],
-        metrics: RepoQueryMetrics,
-        dependency_cache: DependencyCache,
-        verbose: bool = False,
-        cache_only: bool = False,
-        max_results: int | None = None
-    ) -> Generator[str, None, None]:
-    """
-    Generator that yields direct dependents one at a time.
-
-    Args:
-        package_name: The package to find direct dependents for
-        repository_paths: Dictionary mapping repository IDs to URLs
-        metrics: Metrics object to track repoquery calls
-        dependency_cache: Cache object to store dependency results
-        verbose: Whether to enable verbose logging
-        cache_only: If True, only return cached results and never make repoquery calls
-        max_results: Maximum number of dependents to yield (None for unlimited)
+        dependents = self._persistent_store.load("dependents", package_name)
+        if dependents is None:
+            return None
 
-    Yields:
-        Package names that directly depend on the given package
+        entry = DependentsRecord(map(self._package_ids.intern, dependents))
+        self._cache[package_id] = entry
+        self._unused_persistent_entries.add(package_id)
+        return entry
 
-    Raises:
-        RepoQueryError: If the dnf repoquery call fails
-    """
-    logging.debug(f"\n🔍 Finding direct dependents for package: {package_name}")
+    def get(self, package_name: str) -> List[str] | None:
+        """
+        Get cached dependencies for a package.
 
-    if (not cache_only and dependency_cache.has_all(package_name)) or (cache_only and dependency_cache.has(package_name)):
-        cached_dependents = dependency_cache.get(package_name)
-        logging.debug(f"📋 Dependency cache hit: Dependents for {package_name} → {len(cached_dependents)} dependents")
-        count = 0
-        for dependent_name in cached_dependents:
-            if max_results is not None and count >= max_results:
-                break
-            yield dependent_name
-            count += 1
-        return
+        Args:
+            package_name: The package name
 
-    if cache_only:
-        logging.debug(f"📋 CACHE ONLY MODE: No sufficient cached dependents for {package_name}, skipping repoquery call")
-        return
+        Returns:
+            The cached list of dependent packages, or None if not cached
+        """
+        entry = self._get_entry(package_name)
+        if entry is not None:
+            # The first use of an entry loaded from disk counts as a persistent cache hit
+            package_id = self._package_ids.intern(package_name)
+            if package_id in self._unused_persistent_entries:
+                self._unused_persistent_entries.discard(package_id)
+                self._persistent_hits += 1
+            else:
+                self._memory_hits += 1
+            return self._package_ids.names(entry.dependents)
+        return None
 
-    metrics.log_call("dnf repoquery --whatdepends", package_name)
-    try:
-        stdout_content = dnf(f"repoquery --whatdepends {package_name} --qf '%{{name}}\\n'", repository_paths, verbose)
-    except subprocess.CalledProcessError as error:
-        stderr = error.stderr.strip() if error.stderr else "Unknown error"
-        raise RepoQueryError(
-            f"Failed to query reverse dependencies for {package_name!r}: {stderr}"
-        )
+    def has(self, package_name: str) -> bool:
+        """
+        Check if a package has any cached results (partial or complete).
 
-    seen: Set[str] = set()
-    dependents_found = 0
-    dependents_list: List[str] = []
-    is_partial = False
-    count = 0
-    
-    for line in stdout_content.splitlines():
-        if max_results is not None and count > max_results:
-            is_partial = True
-            break
+        Args:
+            package_name: The package name
 
-        dependent_name = line.strip()
-        if dependent_name and dependent_name not in seen:
-            seen.add(dependent_name)
-            dependents_found += 1
-            dependents_list.append(dependent_name)
-            logging.debug(f"\n   Found dependent: {dependent_name}")
-            
-            if max_results is None or count <= max_results:
-                dependency_cache.set(package_name, dependents_list, partial=True)
-                yield dependent_name
-                count += 1
+        Returns:
+            True if the package has cached results, False otherwise
+        """
+        return self._get_entry(package_name) is not None
 
-    dependency_cache.set(package_name, dependents_list, is_partial)
-    logging.debug(f"\n   Total direct dependents found for {package_name}: {len(dependents_list)} ({'partial' if is_partial else 'complete'})")
+    def has_all(self, package_name: str) -> bool:
+        """
+        Check if a package has complete (non-partial) cached results.
 
+        Args:
+            package_name: The package name
 
-def query_source_package(
-        package_name: str,
-        repository_paths: Dict[str, str],
-        metrics: RepoQueryMetrics,
-        source_cache: SourcePackageCache,
-        verbose: bool = False,
-        allow_missing: bool = False
-    ) -> str:
-    """
-    Query the source package name for a given binary package.
+        Returns:
+            True if the package has complete cached results, False otherwise
+        """
+        entry = self._get_entry(package_name)
+        if entry is not None:
+            return not entry.partial
+        return False
 
-    Args:
-        package_name: The binary package name to find the source package for
-        repository_paths: Dictionary mapping repository IDs to URLs
-        metrics: Metrics object to track repoquery calls
-        source_cache: Cache object to store source package mappings
-        verbose: Whether to enable verbose logging
-        allow_missing: Whether to allow missing packages to be non-fatal
+    def set(self, package_name: str, dependents: List[str], partial: bool = False) -> None:
+        """
+        Cache dependency results for a package.
 
-    Returns:
-        The source package name, or empty string if package not found and allow_missing is True
+        Args:
+            package_name: The package name
+            dependents: List of dependent package names
+            partial: Whether the results are partial (limited by max_results)
+        """
+        package_id = self._package_ids.intern(package_name)
+        self._cache[package_id] = DependentsRecord(map(self._package_ids.intern, dependents), partial)
+        self._unused_persistent_entries.discard(package_id)
+        if self._persistent_store is not None and not partial:
+            self._persistent_store.store("dependents", package_name, dependents)
+        partial_info = " (partial)" if partial else ""
+        logging.debug(f"   Cached dependency results: {package_name} → {len(dependents)} dependents{partial_info}")
 
-    Raises:
-        RepoQueryError: If the query fails or returns invalid data
-        PackageNotFoundError: If the package is not found and allow_missing is False
-    """
+    def add_dependent(self, package_name: str, dependent_name: str) -> None:
+        """
+        Add a dependent to the partial results cached for a package, while its query is still being read.
 
-    cached_source_package = source_cache.get(package_name)
-    if cached_source_package == '' and not allow_missing:
-        logging.debug(f"\n📋 Source cache hit: Package {package_name} → not found")
-        raise PackageNotFoundError(package_name)
+        This saves setting the whole list again for each new dependent.
 
-    if cached_source_package:
-        logging.debug(f"\n📋 Source cache hit: Source package for {package_name} → {cached_source_package}")
-        return cached_source_package
+        Args:
+            package_name: The package name
+            dependent_name: The dependent package name
+        """
+        package_id = self._package_ids.intern(package_name)
+        entry = self._cache.get(package_id)
+        if entry is None or not entry.partial:
+            entry = DependentsRecord(partial=True)
+            self._cache[package_id] = entry
+            self._unused_persistent_entries.discard(package_id)
+        entry.dependents.append(self._package_ids.intern(dependent_name))
+        logging.debug(f"   Cached dependency results: {package_name} → {len(entry.dependents)} dependents (partial)")
+
+    def get_stats(self, include_results: bool = False) -> Dict[str, Any]:
+        """
+        Get cache statistics.
 
-    logging.debug(f"\n🔍 Querying source package for binary package: {package_name}")
+        Args:
+            include_results: Whether to list the cached result of every package
 
-    metrics.log_call("dnf repoquery --qf '%{sourcerpm}'", package_name)
-    try:
-        stdout_content = dnf(f"repoquery {package_name} --qf '%{{sourcerpm}}\\n'", repository_paths, verbose)
-    except subprocess.CalledProcessError as error:
-        stderr = error.stderr.strip() if error.stderr else "Unknown error"
-        raise RepoQueryError(
-            f"Failed to query source package for {package_name!r}: {stderr}"
-        )
+        Returns:
+            Dictionary containing cache statistics
+        """
+        total_dependents = sum(len(entry.dependents) for entry in self._cache.values())
+        partial_count = sum(1 for entry in self._cache.values() if entry.partial)
+        complete_count = len(self._cache) - partial_count
+        stats = {
+            "cache_size": len(self._cache),
+            "total_dependents": total_dependents,
+            "complete_count": complete_count,
+            "partial_count": partial_count,
+            "memory_hits": self._memory_hits,
+            "persistent_hits": self._persistent_hits,
+        }
+        if include_results:
+            entries = {self._package_ids.name(package_id): entry for package_id, entry in self._cache.items()}
+            stats["cached_results"] = {
+                package: {"dependents": len(entries[package].dependents), "partial": entries[package].partial}
+                for package in sorted(entries.keys())
+            }
+        return stats
 
-    source_rpm = stdout_content.strip()
-    if not source_rpm:
-        source_cache.set(package_name, '')
-        if allow_missing:
-            logging.debug(f"   Package {package_name} not found, but continuing due to --allow-missing")
-            return ''
-        raise PackageNotFoundError(package_name)
 
-    m = re.match(r'^(?P<name>.*)-[^-]+-[^-]+\.src\.rpm$', source_rpm)
-    if not m:
-        raise RepoQueryError(
-            f"Unexpected source-RPM format for {package_name!r}: {source_rpm!r}"
-        )
+class RepoQueryError(Exception):
+    """Raised when a dnf repoquery call fails or returns invalid data."""
 
-    source_package_name = m.group("name")
-    logging.debug(f"\n   Source package for {package_name}: {source_package_name}")
+    def __init__(self, message: str, exit_code: int = EXIT_REPO_QUERY_ERROR):
+        super().__init__(message)
+        self.exit_code = exit_code
 
-    source_cache.set(package_name, source_package_name)
 
-    return source_package_name
+class NoDependentsFoundError(Exception):
+    """Raised when no dependents are found for a package."""
 
+    def __init__(self, package_name: str):
+        super().__init__(f"No dependents found for package: {package_name}")
+        self.package_name = package_name
+        self.exit_code = EXIT_NO_DEPENDENTS_FOUND
 
-def query_package_description(
-        package_name: str,
-        repository_paths: Dict[str, str],
-        metrics: RepoQueryMetrics,
-        verbose: bool = False
-    ) -> str:
-    """
-    Query the description for a given package.
 
-    Args:
-        package_name: The package name to find the description for
-        repository_paths: Dictionary mapping repository IDs to URLs
-        metrics: Metrics object to track repoquery calls
-        verbose: Whether to enable verbose logging
+class PackageNotFoundError(Exception):
+    """Raised when a package is not found in the repositories."""
 
-    Returns:
-        The package description with newlines removed
+    def __init__(self, package_name: str):
+        super().__init__(f"Package not found in repositories: {package_name}")
+        self.package_name = package_name
+        self.exit_code = EXIT_PACKAGE_NOT_FOUND
 
-    Raises:
-        RepoQueryError: If the query fails or returns invalid data
-    """
 
-    logging.debug(f"\n🔍 Querying description for package: {package_name}")
+class FilterError(Exception):
+    """Raised when a filter can't be loaded, or a filter coprocess stops answering."""
 
-    metrics.log_call("dnf repoquery --qf '%{description}'", package_name)
-    try:
-        stdout_content = dnf(f"repoquery {package_name} --qf %{{description}}", repository_paths, verbose)
-    except subprocess.CalledProcessError as error:
-        stderr = error.stderr.strip() if error.stderr else "Unknown error"
-        raise RepoQueryError(
-            f"Failed to query description for {package_name!r}: {stderr}"
-        )
+    def __init__(self, message: str, exit_code: int = EXIT_FILTER_ERROR):
+        super().__init__(message)
+        self.exit_code = exit_code
 
-    description = stdout_content.strip()
-    if description:
-        description = " ".join(description.splitlines())
 
-    logging.debug(f"\n   Description for {package_name}: {description}")
+class PackageFilter:
+    """
+    Decides which packages are kept in the results.
 
-    return description
+    Subclasses implement check for one way of running the filter. Filters that
+    answer many packages faster in one go than one at a time are pipelined, and
+    implement check_all as well. A daemon runs the filters of a query in the
+    working directory and environment of the client that sent it.
+    """
 
+    pipelined: bool = False
 
-def convert_to_source_packages(
-        dependents: Generator[str, None, None],
-        repository_paths: Dict[str, str],
-        metrics: RepoQueryMetrics,
-        source_cache: SourcePackageCache,
-        filter_cache: FilterCache,
-        max_results: int | None = None,
-        verbose: bool = False,
-        filter_command: str | None = None,
-        allow_missing: bool = False
-    ) -> Generator[str, None, None]:
-    """
-    Generator that converts a stream of binary package names into source package names.
+    def __init__(self, description: str, working_directory: str | None = None, environment: Dict[str, str] | None = None):
+        self.description = description
+        self._working_directory = working_directory
+        self._environment = environment
 
-    Args:
-        dependents: Generator yielding binary package names
-        repository_paths: Dictionary mapping repository IDs to URLs
-        max_results: Maximum number of unique source packages to yield (None for unlimited)
-        filter_command: Optional shell command to run on each source package
-        allow_missing: Whether to allow missing packages to be non-fatal
+    def check(self, package_name: str) -> bool:
+        """
+        Check whether a package passes the filter.
 
-    Yields:
-        Source package names (unique, up to max_results if specified)
+        Args:
+            package_name: The package name to check
 
-    Raises:
-        RepoQueryError: If any source package query fails
-    """
-    logging.debug("🔄 Converting binary packages to source packages")
+        Returns:
+            True if the package should be included, False otherwise
+        """
+        raise NotImplementedError
 
-    source_packages: Set[str] = set()
-    converted_count = 0
+    def check_all(self, package_names: List[str]) -> List[bool]:
+        """
+        Check whether several packages pass the filter.
 
-    for package in dependents:
-        if max_results is not None and converted_count >= max_results:
-            logging.debug(f"Reached max_results={max_results}, stopping conversion")
-            break
+        Args:
+            package_names: The package names to check
 
-        logging.debug(f"   Converting binary package: {package}")
-        source_package = query_source_package(
-            package, repository_paths, metrics, source_cache, verbose, allow_missing
-        )
+        Returns:
+            Whether each package should be included, in the same order
+        """
+        return [self.check(package_name) for package_name in package_names]
 
-        if not source_package:
-            logging.debug(f"   Skipping binary package {package} (no source package found)")
-            continue
+    def should_batch(self, filter_jobs: int) -> bool:
+        """
+        Check whether filtering packages in batches is worth it, rather than as they come.
 
-        if source_package not in source_packages:
-            source_packages.add(source_package)
+        Args:
+            filter_jobs: Maximum number of concurrent filter runs
 
-            if filter_command:
-                if not run_filter_command(source_package, filter_command, metrics, filter_cache, verbose):
-                    logging.debug(f"   Skipping source package {source_package} due to filter command")
-                    continue
+        Returns:
+            True if batches of packages should be filtered up front
+        """
+        return self.pipelined or filter_jobs > 1
 
-            converted_count += 1
-            logging.debug(f"   New source package found: {source_package}")
-            yield source_package
-        else:
-            logging.debug(f"   Source package already seen: {source_package}")
+    def close(self) -> None:
+        """Release the resources held by the filter."""
 
-    logging.debug(f"   Total unique source packages converted: {converted_count}")
+    def __str__(self) -> str:
+        return self.description
 
 
-def compute_transitive_closure(
-        root_package: str,
-        dependents_map: Dict[str, Dict[str, Any]],
-        max_results: int | None = None,
-        filter_function = None,
-    ) -> Dict[str, Dict[str, Any]]:
+class ShellFilter(PackageFilter):
+    """
+    Runs a shell command for each package, with the PACKAGE environment variable
+    set to the package name. The package passes if the command exits with 0.
     """
-    Compute the transitive closure of the dependency graph.
 
-    For each package, returns a dictionary containing the list of all packages that can be reached
-    from it through the dependency graph (in breadth-first order) and a partial flag indicating
-    whether the results are incomplete due to max_results being reached.
-    If filter_function is provided, it should take a package name and a list of current dependents
-    and return True if the package should be included, False if it should be filtered out.
-    Filtered packages are excluded from the graph but still traversed to find their dependents.
+    def __init__(self, command: str, working_directory: str | None = None, environment: Dict[str, str] | None = None):
+        super().__init__(command, working_directory, environment)
+        self._command = command
 
-    Args:
-        root_package: root package name to check for partial results
-        dependents_map: Dictionary mapping package names to their dependent packages
-        max_results: Maximum number of results to return (including the root package)
-        filter_function: Optional function that takes a package name and dependents list and returns True/False
+    def check(self, package_name: str) -> bool:
+        result = run_command(
+            self._command,
+            extra_environment={"PACKAGE": package_name},
+            environment=self._environment,
+            working_directory=self._working_directory
+        )
+        if result["return_code"] != 0:
+            logging.debug(f"   Filter command exited with {result['return_code']} for {package_name}")
+        return result["return_code"] == 0
 
-    Returns:
-        Dictionary mapping package names to dictionaries containing 'dependents' list and 'partial' flag
+
+class CoprocessFilter(PackageFilter):
     """
-    graph: Dict[str, Dict[str, Any]] = {}
+    Keeps one filter process running for all the packages.
 
-    # The root package gets all results but itself as dependents
-    max_root_dependents = max_results - 1 if max_results is not None else None
-    
-    for package, entry in dependents_map.items():
-        known_packages: Set[str] = set()
-        transitive_dependents: List[str] = []
-        queue = deque(entry["dependents"])
-        is_partial = entry["partial"]
-
-        # We stop reading from the queue once the root package has all the results the user asked for
-        # (But we still need to extend the queue for the remaining of the loop to know if we're missing out
-        # on any results because of the max_results limit)
-        root_hit_max_dependents = False
-        
-        while queue:
-            dependent = queue.popleft()
-
-            if dependent in known_packages:
-                continue
+    The process reads package names on stdin, one per line, and answers each with a
+    line saying "pass" or "fail" on stdout, in the same order. Batches of packages are
+    pipelined: all the names are written before the answers are read back. The
+    process is started on the first check and stopped when the filter is closed.
+    """
 
-            # If the root package has hit its dependent limit, we don't add this dependent to the results,
-            # but we still need to use the dependent to extend the queue so we can know if we're missing out
-            # on any results because of the max_results limit
-            if package == root_package and max_root_dependents is not None and len(transitive_dependents) >= max_root_dependents:
-                root_hit_max_dependents = True
-
-            if package != root_package or not root_hit_max_dependents:
-                # Mark this package as seen to prevent future cycles
-                known_packages.add(dependent)
-
-                # Apply optional filtering function
-                if filter_function is None or filter_function(dependent, transitive_dependents):
-                    transitive_dependents.append(dependent)
-
-            if dependent in dependents_map:
-                dependent_entry = dependents_map[dependent]
-                if dependent_entry["partial"]:
-                    is_partial = True
-
-                queue.extend(dependent_entry["dependents"])
-            
-            if root_hit_max_dependents:
-                # At this point the queue accurately reflects what work is left to do
-                # so we can use it to know if the results are complete for the root package
-                is_partial = bool(queue)
-                break
+    pipelined = True
 
-        if not max_results or len(graph.keys()) < max_results:
-            graph[package] = {
-                "dependents": transitive_dependents,
-                "partial": is_partial
-            }
+    def __init__(self, command: str, working_directory: str | None = None, environment: Dict[str, str] | None = None):
+        super().__init__(f"coprocess {command}", working_directory, environment)
+        self._command = command
+        self._process: subprocess.Popen | None = None
+        self._lock = threading.Lock()
 
-    return graph
+    def _start(self) -> subprocess.Popen:
+        """
+        Start the filter process, if it isn't running yet.
+
+        Returns:
+            The filter process
 
+        Raises:
+            FilterError: If the filter process exited
+        """
+        if self._process is None:
+            logging.debug(f"🚀 Starting filter coprocess: {self._command}")
+            self._process = subprocess.Popen(
+                self._command,
+                shell=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                cwd=self._working_directory,
+                env=self._environment
+            )
+        elif self._process.poll() is not None:
+            returncode = self._process.returncode
+            self._stop()
+            raise FilterError(f"Filter coprocess exited with {returncode}: {self._command}")
+        return self._process
 
-def build_dependents_list(
-        package_name: str,
-        repository_paths: Dict[str, str],
-        show_source_packages: bool,
-        source_cache: SourcePackageCache,
-        metrics: RepoQueryMetrics,
-        filter_cache: FilterCache,
-        dependency_cache: DependencyCache,
-        max_results: int | None = None,
-        verbose: bool = False,
-        keep_cycles: bool = False,
-        filter_command: str | None = None,
-        allow_missing: bool = False
-    ) -> List[str]:
+    def _stop(self) -> None:
+        """
+        Kill the filter process, so the next check starts a new one.
+
+        Used when the process fails partway through a batch: the answers it still
+        has to give would otherwise be read as the answers for other packages.
+        """
+        process = self._process
+        self._process = None
+        process.kill()
+        process.wait()
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def check(self, package_name: str) -> bool:
+        return self.check_all([package_name])[0]
+
+    def check_all(self, package_names: List[str]) -> List[bool]:
+        with self._lock:
+            process = self._start()
+
+            # Write from another thread, so neither process blocks the other on a full pipe
+            def write_requests() -> None:
+                try:
+                    for package_name in package_names:
+                        process.stdin.write(f"{package_name}\n")
+                    process.stdin.flush()
+                except OSError:
+                    # The process exited, which the reads below report
+                    pass
+
+            writer = threading.Thread(target=write_requests, name="filter-coprocess-writer", daemon=True)
+            writer.start()
+            try:
+                results: List[bool] = []
+                for package_name in package_names:
+                    answer = process.stdout.readline()
+                    if not answer:
+                        raise FilterError(f"Filter coprocess stopped answering (at {package_name}): {self._command}")
+                    answer = answer.strip()
+                    if answer not in ("pass", "fail"):
+                        raise FilterError(f"Filter coprocess answered \"{answer}\" for {package_name} instead of pass or fail: {self._command}")
+                    results.append(answer == "pass")
+            except OSError as error:
+                self._stop()
+                writer.join()
+                raise FilterError(f"Failed to talk to filter coprocess: {error}: {self._command}")
+            except FilterError:
+                # Killing the process also unblocks the writer, if it's stuck on a full pipe
+                self._stop()
+                writer.join()
+                raise
+            writer.join()
+
+        return results
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+
+class FunctionFilter(PackageFilter):
+    """
+    Calls a Python function in-process for each package.
+
+    The function is given as MODULE:FUNCTION, where MODULE is either an importable
+    module name or the path of a Python file. It is called with the package name and
+    its return value is taken as true (pass) or false (fail). With --filter-jobs, it is
+    called from several threads at once. A relative file path is taken from the working
+    directory, but the function runs in this process, with its environment.
+    """
+
+    def __init__(self, function_path: str, working_directory: str | None = None, environment: Dict[str, str] | None = None):
+        super().__init__(f"function {function_path}", working_directory, environment)
+        module_name, _, function_name = function_path.rpartition(":")
+        if not module_name or not function_name:
+            raise FilterError(f"Filter function should be given as MODULE:FUNCTION, not {function_path}", EXIT_INVALID_ARGUMENTS)
+
+        try:
+            if module_name.endswith(".py") or os.sep in module_name:
+                module_file = Path(working_directory or ".") / module_name
+                module_spec = importlib.util.spec_from_file_location(module_file.stem, module_file)
+                module = importlib.util.module_from_spec(module_spec)
+                module_spec.loader.exec_module(module)
+            else:
+                module = importlib.import_module(module_name)
+            self._function = getattr(module, function_name)
+        except (ImportError, OSError, AttributeError, SyntaxError) as error:
+            raise FilterError(f"Could not load filter function {function_path}: {error}", EXIT_INVALID_ARGUMENTS)
+
+        if not callable(self._function):
+            raise FilterError(f"Filter function {function_path} isn't callable", EXIT_INVALID_ARGUMENTS)
+
+    def check(self, package_name: str) -> bool:
+        return bool(self._function(package_name))
+
+
+def create_package_filter(
+        arguments: argparse.Namespace,
+        working_directory: str | None = None,
+        environment: Dict[str, str] | None = None
+    ) -> PackageFilter | None:
     """
-    Build a list of dependents for a given package.
+    Create the filter a query asks for, if any.
 
     Args:
-        package_name: The package to find dependents for
-        repository_paths: Dictionary mapping repository IDs to URLs
-        show_source_packages: Whether to convert to source package names
-        max_results: Maximum number of results to return
-        filter_command: Optional shell command to run on each dependent package
-        allow_missing: Whether to allow missing packages to be non-fatal
+        arguments: Parsed command line arguments
+        working_directory: Optional directory to run the filter in, instead of the current one
+        environment: Optional environment to run the filter in, instead of this process's
 
     Returns:
-        List of dependent package names (binary or source depending on show_source_packages)
+        The package filter, or None if packages aren't filtered
+
+    Raises:
+        FilterError: If the filter function can't be loaded
     """
-    logging.debug(f"🔄 Building dependents list for: {package_name}")
-    logging.debug(f"   Show source packages: {show_source_packages}")
-    logging.debug(f"   Max results: {max_results}")
-    logging.debug(f"   Filter command: {filter_command}")
+    if arguments.filter_coprocess:
+        return CoprocessFilter(arguments.filter_coprocess, working_directory, environment)
+    if arguments.filter_function:
+        return FunctionFilter(arguments.filter_function, working_directory, environment)
+    if arguments.filter_command and arguments.filter_command.strip():
+        return ShellFilter(arguments.filter_command, working_directory, environment)
+    return None
 
-    dependents = generate_direct_dependents(package_name, repository_paths, metrics, dependency_cache, verbose, cache_only=False)
 
-    if show_source_packages:
-        dependents = convert_to_source_packages(
-            dependents, repository_paths, metrics, source_cache, filter_cache,
-            max_results, verbose, filter_command, allow_missing
-        )
+def run_filter_command(package_name: str, package_filter: PackageFilter | None, metrics: RepoQueryMetrics, filter_cache: FilterCache, verbose: bool = False) -> bool:
+    """
+    Run a filter on a package to determine if it should be included.
 
-    collected_packages: List[str] = []
-    discovered_count = 0
-    is_partial = False
-    for dependent_package in dependents:
-        if max_results is not None and discovered_count >= max_results:
-            is_partial = True
-            break
+    Args:
+        package_name: The package name to check
+        package_filter: The filter to run
+        metrics: Metrics object to track filter command usage
+        filter_cache: Cache object to store filter results
+        verbose: Whether to enable verbose logging
 
-        if not keep_cycles and package_name == dependent_package:
-            continue
+    Returns:
+        True if the filter passes (package should be included), False otherwise
 
-        if filter_command:
-            if not run_filter_command(dependent_package, filter_command, metrics, filter_cache, verbose):
-                logging.debug(f"   Skipping dependent package {dependent_package} due to filter command")
-                continue
+    Raises:
+        FilterError: If a filter coprocess stops answering
+    """
+    if package_filter is None:
+        return True
 
-        discovered_count += 1
-        if max_results is None or discovered_count <= max_results:
-            collected_packages.append(dependent_package)
+    start_time = time.perf_counter()
+    cached_result = filter_cache.get(package_name)
+    cache_result = "miss" if cached_result is None else "hit"
+    metrics.record_span(f"filter cache {cache_result}", package_name, start_time, time.perf_counter() - start_time, trace=False)
 
-    logging.debug(f"   Total dependents collected: {len(collected_packages)} ({'partial' if is_partial else 'complete'})")
+    if cached_result is not None:
+        logging.debug(f"📋 Filter cache hit: Filter result for {package_name} → {'pass' if cached_result else 'fail'}")
+        return cached_result
 
-    if len(collected_packages) == 0:
-        raise NoDependentsFoundError(package_name)
+    logging.debug(f"🔍 Running filter command on package: {package_name}")
 
-    return collected_packages
+    start_time = time.perf_counter()
+    start_cpu_time = time.thread_time()
+    start_command_cpu_time = get_command_cpu_time()
+    try:
+        success = package_filter.check(package_name)
+        duration = time.perf_counter() - start_time
+        metrics.log_filter_call(package_name, success, duration)
+        metrics.record_span(
+            "filter", package_name, start_time, duration,
+            time.thread_time() - start_cpu_time, get_command_cpu_time() - start_command_cpu_time
+        )
 
+        filter_cache.set(package_name, success)
 
-def build_dependents_graph(
-        root_package: str,
-        repository_paths: Dict[str, str],
-        show_source_packages: bool,
-        source_cache: SourcePackageCache,
+        if success:
+            logging.debug(f"   ✅ Filter command succeeded for {package_name}")
+        else:
+            logging.debug(f"   ❌ Filter command failed for {package_name}")
+
+        return success
+
+    except FilterError:
+        raise
+    except Exception as e:
+        logging.debug(f"   💥 Filter command error for {package_name}: {e}")
+        duration = time.perf_counter() - start_time
+        metrics.log_filter_call(package_name, False, duration)
+        metrics.record_span(
+            "filter", package_name, start_time, duration,
+            time.thread_time() - start_cpu_time, get_command_cpu_time() - start_command_cpu_time
+        )
+        filter_cache.set(package_name, False)
+        return False
+
+
+def run_filter_commands(
+        package_names: Iterable[str],
+        package_filter: PackageFilter,
         metrics: RepoQueryMetrics,
         filter_cache: FilterCache,
-        dependency_cache: DependencyCache,
-        max_results: int | None = None,
-        keep_cycles: bool = False,
-        verbose: bool = False,
-        filter_command: str | None = None,
-        allow_missing: bool = False
-    ) -> Dict[str, Dict[str, Any]]:
+        filter_jobs: int,
+        verbose: bool = False
+    ) -> None:
     """
-    Build a transitive graph of reverse dependencies for the given package.
+    Run a filter on several packages at once.
+
+    Pipelined filters get all the packages in one go, others run on up to filter_jobs
+    packages concurrently. The results only go into the filter cache: callers go on
+    calling run_filter_command on the packages in their own order, and get the results
+    from the cache.
+
+    Args:
+        package_names: The package names to check
+        package_filter: The filter to run
+        metrics: Metrics object to track filter command usage
+        filter_cache: Cache object to store filter results
+        filter_jobs: Maximum number of concurrent filter commands
+        verbose: Whether to enable verbose logging
+    """
+    uncached_package_names = [
+        package_name for package_name in dict.fromkeys(package_names) if not filter_cache.has(package_name)
+    ]
+    if len(uncached_package_names) < 2:
+        return
+
+    if package_filter.pipelined:
+        logging.debug(f"🔍 Running filter on {len(uncached_package_names)} packages in one batch")
+        start_time = time.perf_counter()
+        start_cpu_time = time.thread_time()
+        results = package_filter.check_all(uncached_package_names)
+        batch_duration = time.perf_counter() - start_time
+        metrics.record_span(
+            "filter batch", f"{len(uncached_package_names)} packages", start_time,
+            batch_duration, time.thread_time() - start_cpu_time
+        )
+        duration = batch_duration / len(uncached_package_names)
+        for package_name, passed_filter in zip(uncached_package_names, results):
+            metrics.log_filter_call(package_name, passed_filter, duration)
+            filter_cache.set(package_name, passed_filter)
+        return
+
+    logging.debug(f"🔍 Running filter command on {len(uncached_package_names)} packages, {filter_jobs} at a time")
+
+    def filter_package(package_name: str) -> bool:
+        return run_filter_command(package_name, package_filter, metrics, filter_cache, verbose)
+
+    for _ in run_pipeline_stage(uncached_package_names, filter_package, filter_jobs, "filter"):
+        pass
 
-    Stops collecting dependents of the root package once max_results is reached.
-    From that point we fill in as much as we can of the graph without doing more
-    repoquery calls.
+
+def default_refresh_state_path() -> Path:
+    """
+    Get the default location of the file remembering which repositories are up to date in the dnf cache.
 
     Returns:
-        Dictionary mapping package names to dictionaries containing 'dependents' list and 'partial' flag
+        The path under $XDG_CACHE_HOME (or ~/.cache)
     """
-    logging.debug(f"🔄 Building dependents graph for: {root_package}")
-    logging.debug(f"   Show source packages: {show_source_packages}")
-    logging.debug(f"   Max results: {max_results}")
-    logging.debug(f"   Filter command: {filter_command}")
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    return Path(cache_home) / "find-package-dependents" / "refresh-state.json"
 
-    known_packages: Set[str] = {root_package}
-    queue = deque([root_package])
-    dependents_map: Dict[str, Dict[str, Any]] = {}
-    result_count = 0
 
-    result_limit_hit = False
-    while queue:
-        package = queue.popleft()
-        dependents_list: List[str] = []
+def load_refresh_state(path: Path) -> Dict[str, str]:
+    """
+    Load the repomd.xml checksums recorded when the repositories were last refreshed.
 
-        any_filtered_dependents = False
-        for dependent in generate_direct_dependents(
-                package, repository_paths, metrics, dependency_cache, verbose,
-                cache_only=result_limit_hit, max_results=max_results
-        ):
-            if show_source_packages:
-                dependent = query_source_package(
-                    dependent,
-                    repository_paths,
-                    metrics,
-                    source_cache,
-                    verbose,
-                    allow_missing
-                )
+    The state is only an optimization, so a missing or unreadable file counts as empty.
 
-            if not dependent:
-                continue
-            if not keep_cycles and dependent in known_packages:
-                continue
+    Args:
+        path: Path of the refresh state file
 
-            if dependent not in known_packages:
-                known_packages.add(dependent)
-                queue.append(dependent)
+    Returns:
+        Dictionary mapping repository URLs to the checksum of their repomd.xml
+    """
+    try:
+        with open(path) as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logging.warning(f"⚠️  Ignoring refresh state {path}: {error}")
+        return {}
 
-            dependent_is_filtered = filter_command and not run_filter_command(
-                dependent,
-                filter_command,
-                metrics,
-                filter_cache,
-                verbose
-            )
+    if not isinstance(state, dict):
+        logging.warning(f"⚠️  Ignoring refresh state {path}: not a JSON object")
+        return {}
 
-            if not dependent_is_filtered:
-                dependents_list.append(dependent)
+    return {url: checksum for url, checksum in state.items() if isinstance(checksum, str)}
 
-                if package == root_package and max_results is not None:
-                    result_count += 1
-                    if result_count >= max_results:
-                        result_limit_hit = True
-                        break
-            else:
-                any_filtered_dependents = True
 
-        dependents_map[package] = {"dependents": dependents_list, "partial": result_limit_hit or any_filtered_dependents}
+def save_refresh_state(path: Path, state: Dict[str, str]) -> None:
+    """
+    Save the repomd.xml checksums of the refreshed repositories.
 
-    for package, entry in dependents_map.items():
-        has_unknown_dependents = any(dependent not in dependents_map for dependent in entry["dependents"])
-        has_partial_dependents = any(not dependency_cache.has_all(dependent) for dependent in entry["dependents"])
-        entry["partial"] = entry["partial"] or has_unknown_dependents or has_partial_dependents
+    The file is replaced atomically, so concurrent runs never see a partial file.
 
-    def filter_function(package_name: str, dependents_list: List[str]) -> bool:
-        if max_results is not None and len(dependents_list) >= max_results:
-            return False
+    Args:
+        path: Path of the refresh state file
+        state: Dictionary mapping repository URLs to the checksum of their repomd.xml
+    """
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path.write_text(json.dumps(state, indent=2, sort_keys=True) + "\n")
+        temporary_path.replace(path)
+    except OSError as error:
+        logging.warning(f"⚠️  Could not save refresh state {path}: {error}")
+        temporary_path.unlink(missing_ok=True)
 
-        if not filter_command:
-            return True
 
-        return filter_cache.get(package_name) is not False
+def dnf_cache_directories() -> List[Path]:
+    """
+    Get the directories dnf may keep its repository cache in.
 
-    # We add 1 to max_results to make room for the root package
-    if max_results is not None:
-        max_results += 1
+    dnf runs as root cache under /var/cache. Unprivileged dnf 4 caches in a
+    /var/tmp/dnf-USER-* directory, and unprivileged dnf 5 under $XDG_CACHE_HOME.
 
-    dependents_graph = compute_transitive_closure(root_package, dependents_map, max_results, filter_function)
+    Returns:
+        The cache directories that exist
+    """
+    if os.geteuid() == 0:
+        candidates = [Path("/var/cache/dnf"), Path("/var/cache/libdnf5")]
+    else:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+        candidates = [
+            path for path in Path("/var/tmp").glob("dnf-*")
+            if path.is_dir() and path.stat().st_uid == os.geteuid()
+        ]
+        candidates.append(Path(cache_home) / "libdnf5")
 
-    if not dependents_graph.get(root_package):
-        raise NoDependentsFoundError(root_package)
+    return [path for path in candidates if path.is_dir()]
 
-    return dependents_graph
 
+def read_dnf_cached_index_checksums(repository_id: str) -> Set[str]:
+    """
+    Compute the checksums of the repomd.xml files dnf has cached for a repository.
+
+    dnf keeps each repository in a REPOID-HASH directory, REPOID being the
+    repo-ID name the repository is given on the dnf command line.
+
+    Args:
+        repository_id: The repository ID
+
+    Returns:
+        SHA-256 hex digests of the cached repomd.xml files (empty if the repository isn't cached)
+    """
+    directory_pattern = re.compile(re.escape(f"repo-{repository_id}") + r"-[0-9a-f]{16}")
+
+    checksums: Set[str] = set()
+    for cache_directory in dnf_cache_directories():
+        try:
+            repository_directories = [path for path in cache_directory.iterdir() if directory_pattern.fullmatch(path.name)]
+        except OSError:
+            continue
+        for repository_directory in repository_directories:
+            try:
+                checksums.add(sha256((repository_directory / "repodata" / "repomd.xml").read_bytes()).hexdigest())
+            except OSError:
+                continue
+
+    return checksums
 
-def max_result_type(value: str) -> int:
+
+def update_dnf_cache(
+        repository_paths: Dict[str, str],
+        verbose: bool = False,
+        refresh_state_path: Path | None = None,
+        jobs: int | None = None,
+        force: bool = False
+    ) -> None:
     """
-    Convert a string to an integer, failing if the value is not a positive integer.
+    Update dnf cache for the repositories that changed since they were last refreshed.
+    This allows subsequent repoquery calls to use --cacheonly for better performance.
+
+    The repomd.xml of each repository is checked first, and repositories whose
+    repomd.xml has the same checksum as when they were last refreshed, and as the
+    repomd.xml dnf still has in its cache, are skipped. The remaining repositories
+    are refreshed concurrently, one dnf process each.
+
+    Args:
+        repository_paths: Dictionary mapping repository IDs to URLs
+        verbose: Whether to enable verbose logging
+        refresh_state_path: File remembering the repomd.xml checksums of the last refresh,
+            or None to refresh every repository
+        jobs: Maximum number of repositories to check and refresh at once (default: all of them)
+        force: Whether to refresh every repository even if its repomd.xml is unchanged
+
+    Raises:
+        RepoQueryError: If the dnf cache update fails
     """
-    try:
-        result = int(value)
-    except ValueError:
-        result = -1
 
-    if result <= 0:
-        raise argparse.ArgumentTypeError(f"result limit must be positive whole number, got: {value}")
+    logging.debug("🔄 Updating dnf cache for all repositories...")
+
+    jobs = jobs or len(repository_paths)
+    refresh_state = load_refresh_state(refresh_state_path) if refresh_state_path is not None else {}
+
+    def check_repository(repository: Tuple[str, str]) -> Tuple[str | None, Set[str]]:
+        if refresh_state_path is None:
+            return None, set()
+        try:
+            checksum = fetch_repository_index_checksum(repository[1])
+        except RepoQueryError as error:
+            logging.debug(f"   Refreshing {repository[0]} unconditionally: {error}")
+            return None, set()
+        return checksum, read_dnf_cached_index_checksums(repository[0])
+
+    checksums: Dict[str, str | None] = {}
+    stale_repositories: List[Tuple[str, str]] = []
+    for (repository_id, repository_url), (checksum, cached_checksums) in run_pipeline_stage(repository_paths.items(), check_repository, jobs, "repomd"):
+        checksums[repository_url] = checksum
+        if not force and checksum is not None and refresh_state.get(repository_url) == checksum:
+            # The state outlives dnf's cache, which can be cleaned or live in another container
+            if checksum in cached_checksums:
+                logging.debug(f"⏭️  Skipping dnf cache update of {repository_id} (repomd.xml unchanged)")
+                continue
+            logging.debug(f"   Refreshing {repository_id}: the dnf cache is missing or holds another repomd.xml")
+        stale_repositories.append((repository_id, repository_url))
+
+    def refresh_repository(repository: Tuple[str, str]) -> str:
+        repository_id, repository_url = repository
+        logging.debug(f"🔄 Refreshing dnf cache of {repository_id}")
+        return dnf("makecache --refresh", {repository_id: repository_url}, verbose, cache_only=False)
 
-    return result
+    try:
+        for (repository_id, repository_url), result in run_pipeline_stage(stale_repositories, refresh_repository, jobs, "refresh"):
+            logging.debug(f"Cache update output for {repository_id}: {result}")
+            checksum = checksums[repository_url]
+            if checksum is not None:
+                refresh_state[repository_url] = checksum
+        logging.debug(f"✅ Dnf cache updated successfully ({len(stale_repositories)} of {len(repository_paths)} repositories refreshed)")
+    except subprocess.CalledProcessError as error:
+        stderr = error.stderr.strip() if error.stderr else "Unknown error"
+        raise RepoQueryError(f"Failed to update dnf cache: {stderr}", EXIT_CACHE_UPDATE_ERROR)
+    finally:
+        if refresh_state_path is not None and stale_repositories:
+            save_refresh_state(refresh_state_path, refresh_state)
 
 
-def parse_command_line_arguments() -> argparse.Namespace:
+def derive_repository_id_from_url(repository_url: str) -> str:
     """
-    Parse command line arguments for the package dependents finder.
+    Derive a unique repository key from a full repository URL.
+
+    The algorithm is:
+    - Uses hostname[_port] as fallback if no suitable path segment is found
+    - Picks the last path segment that isn't 'os' or known architectures
+    - Appends first 16 hex chars of SHA-256 for uniqueness
+
+    Args:
+        repository_url: The full repository URL to derive an ID from
 
     Returns:
-        argparse.Namespace: Parsed command line arguments
+        A unique repository identifier string
     """
-    parser = argparse.ArgumentParser(
-        description="Find reverse dependencies of an RPM package."
-    )
-    parser.add_argument(
-        "package_name",
-        help="Name of the package to inspect"
-    )
-    parser.add_argument(
-        "--base-url",
-        dest="base_url",
-        default="http://download.devel.redhat.com/rhel-10/nightly/RHEL-10/latest-RHEL-10",
-        help="Base URL for nightly repositories"
-    )
-    parser.add_argument(
-        "--repositories",
-        dest="repository_names",
-        default="BaseOS,AppStream,CRB",
-        help=(
-            "Comma-separated list of repository names (relative to base URL) "
-            "or full repository URLs.\\n"
-            "Examples:\n"
-            "  --repositories BaseOS,AppStream,CRB\n"
-            "  --repositories BaseOS,https://download.devel.redhat.com/rhel-10/nightly/RHEL-10/latest-RHEL-10/compose/RT/x86_64/os\n"
-        )
-    )
-    parser.add_argument(
-        "--arch",
-        choices=sorted(KNOWN_ARCHS),
-        dest="arch",
-        default="x86_64",
-        help="CPU architecture (for example: x86_64, s390x)"
-    )
-    parser.add_argument(
-        "--output-file",
-        dest="output_file",
-        type=Path,
-        help="Write output to this file instead of stdout"
-    )
-    parser.add_argument(
-        "--all",
-        action="store_true",
-        help="Include transitive reverse dependencies (default is direct only)"
-    )
-    parser.add_argument(
-        "--source-packages",
-        action="store_true",
-        help="Convert dependent package names to their source package names"
-    )
-    parser.add_argument(
-        "--max-results",
-        type=max_result_type,
-        help="Maximum number of results to return (limits both queries and output)"
-    )
-    parser.add_argument(
-        "--format",
-        choices=["json", "plain"],
-        default="plain",
-        help="Output format: json or plain (one per line)"
+    parsed_url = urlparse(repository_url)
+
+    segments = [segment for segment in parsed_url.path.strip("/").split("/") if segment]
+
+    component = None
+    for segment in reversed(segments):
+        if segment == "os" or segment in KNOWN_ARCHS:
+            continue
+        component = segment
+        break
+
+    if not component:
+        host = parsed_url.hostname or ""
+        component = f"{host}_{parsed_url.port}" if parsed_url.port else host
+
+    component_safe = re.sub(r"[^A-Za-z0-9_]+", "_", component)
+    digest = sha256(repository_url.encode("utf-8")).hexdigest()[:16]
+    return f"{component_safe}_{digest}"
+
+
+def get_signal_name(signal_num: int) -> str:
+    """
+    Get the name of a signal number.
+
+    Args:
+        signal_num: The signal number
+
+    Returns:
+        The signal name as a string
+    """
+    try:
+        return signal.Signals(signal_num).name
+    except ValueError:
+        return f"SIG{signal_num}"
+
+
+def quote_command(args):
+    """
+    Join a list of arguments into a command string, only quoting arguments
+    that would be semantically different if left unquoted.
+
+    An argument needs quoting if leaving it unquoted would cause the shell
+    to interpret it differently (split it into multiple arguments, perform
+    expansions, etc.).
+
+    Args:
+        args: List of string arguments
+
+    Returns:
+        String representing the command with minimal quoting
+    """
+    quoted_args = []
+
+    for arg in args:
+        if not arg:
+            quoted_args.append(shlex.quote(arg))
+            continue
+
+        try:
+            if shlex.split(arg) == [arg]:
+                quoted_args.append(arg)
+            else:
+                quoted_args.append(shlex.quote(arg))
+        except ValueError:
+            quoted_args.append(shlex.quote(arg))
+
+    return ' '.join(quoted_args)
+
+def run_command(
+        command: List[str] | str,
+        extra_environment: Dict[str, str] | None = None,
+        metrics: RepoQueryMetrics | None = None,
+        environment: Dict[str, str] | None = None,
+        working_directory: str | None = None
+    ) -> Dict[str, Any]:
+    """
+    Run a command and log output.
+
+    Args:
+        command: List of command arguments to execute (or string)
+        extra_environment: Optional dictionary of additional environment variables
+        metrics: Optional metrics object to record how long starting the command takes
+        environment: Optional environment to run the command in, instead of this process's
+        working_directory: Optional directory to run the command in, instead of the current one
+
+    Returns:
+        Dictionary containing 'return_code' and 'output' keys
+
+    Raises:
+        subprocess.CalledProcessError: If the command returns a non-zero exit code
+    """
+    if isinstance(command, list):
+        command_string = quote_command(command)
+    else:
+        command_string = command
+
+    logging.debug(f"\n        ❯ {command_string}")
+
+    if extra_environment:
+        environment = dict(os.environ if environment is None else environment)
+        environment.update(extra_environment)
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        command_string,
+        env=environment,
+        cwd=working_directory,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=True,
+        text=True
     )
-    parser.add_argument(
-        "-v", "--verbose",
-        action="store_true",
-        help="Enable debug logging"
+    if metrics is not None:
+        record_process_start(metrics, command, start_time)
+
+    # Read stderr on the side, so a chatty command doesn't block on a full pipe, and
+    # reap the command here rather than with communicate, to get the CPU time it used
+    stderr_chunks: List[str] = []
+
+    def read_stderr() -> None:
+        stderr_chunks.append(process.stderr.read())
+
+    stderr_reader = threading.Thread(target=read_stderr, name="stderr-reader", daemon=True)
+    stderr_reader.start()
+    stdout = process.stdout.read()
+    stderr_reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    stderr = "".join(stderr_chunks)
+    _command_cpu_times.total = get_command_cpu_time() + reap_process(process)
+
+    for line in stderr.splitlines():
+        if line.strip():
+            logging.debug(f"        {line.strip()}")
+
+    for line in stdout.splitlines():
+        if line.strip():
+            logging.debug(f"        {line.strip()}")
+
+    if process.returncode < 0:
+        signal_name = get_signal_name(abs(process.returncode))
+        logging.debug(f"        Process killed by signal {abs(process.returncode)} ({signal_name})")
+    else:
+        logging.debug(f"        Process exited with code {process.returncode}")
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, command,
+            stdout,
+            stderr
+        )
+
+    return {"return_code": process.returncode, "output": stdout}
+
+
+# The CPU time used by the commands each thread ran, read by get_command_cpu_time
+_command_cpu_times = threading.local()
+
+
+def get_command_cpu_time() -> float:
+    """
+    Get the CPU time used by the commands run so far by the current thread.
+
+    Callers time something by taking the difference before and after it.
+
+    Returns:
+        The user and system CPU time of the commands (and of the processes they waited for), in seconds
+    """
+    return getattr(_command_cpu_times, "total", 0.0)
+
+
+def reap_process(process: subprocess.Popen) -> float:
+    """
+    Wait for a process to exit, like Popen.wait, and get the CPU time it used.
+
+    Args:
+        process: The process, which nothing else waits for
+
+    Returns:
+        The user and system CPU time of the process (and of the processes it waited for), in seconds
+    """
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return usage.ru_utime + usage.ru_stime
+
+
+def record_process_start(metrics: RepoQueryMetrics, command: List[str] | str, start_time: float) -> None:
+    """
+    Record how long starting a command took, up to it being executed.
+
+    Args:
+        metrics: Metrics object to record the time with
+        command: The command that was started
+        start_time: When starting it began, from time.perf_counter()
+    """
+    program = command[0] if isinstance(command, list) else command.split(maxsplit=1)[0]
+    metrics.record_span("process start", program, start_time, time.perf_counter() - start_time)
+
+
+def stream_command(
+        command: List[str],
+        metrics: RepoQueryMetrics | None = None,
+        purpose: str | None = None,
+        package_name: str = ""
+    ) -> Generator[str, None, None]:
+    """
+    Generator that runs a command and yields its output lines as they arrive.
+
+    If the generator is closed before the output ends, the command is terminated,
+    so callers that have read enough don't wait for the rest.
+
+    Args:
+        command: List of command arguments to execute
+        metrics: Optional metrics object to record how long starting the command takes
+        purpose: If given with metrics, log the command as a call of this type and
+            time it from start until it exits or is terminated, leaving out what the
+            caller does with the lines afterwards
+        package_name: The package the command is about, for the logged call
+
+    Yields:
+        Output lines, without the line ending
+
+    Raises:
+        subprocess.CalledProcessError: If the command returns a non-zero exit code
+    """
+    logging.debug(f"\n        ❯ {quote_command(command)}")
+
+    timed = metrics is not None and purpose is not None
+    if timed:
+        metrics.log_call(purpose, package_name)
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1
     )
+    if metrics is not None:
+        record_process_start(metrics, command, start_time)
+
+    stderr_lines: List[str] = []
+    # Held while reaping the command, so it isn't signalled once its process ID is free
+    reap_lock = threading.Lock()
+
+    def watch_command() -> None:
+        # Read stderr on the side, so a chatty command doesn't block on a full pipe,
+        # then reap the command here, so its timing ends when it does. The command is
+        # only reaped once it has exited, so stop_command can signal it until then.
+        stderr_lines.extend(process.stderr)
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        with reap_lock:
+            command_cpu_time = reap_process(process)
+        if timed:
+            metrics.record_span(purpose, package_name, start_time, time.perf_counter() - start_time, command_cpu_time=command_cpu_time)
+
+    def stop_command(signal_number: int) -> None:
+        with reap_lock:
+            if process.returncode is None:
+                os.kill(process.pid, signal_number)
+
+    command_watcher = threading.Thread(target=watch_command, name="command-watcher", daemon=True)
+    command_watcher.start()
+
+    line_count = 0
+    finished = False
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            if line.strip():
+                logging.debug(f"        {line.strip()}")
+            line_count += 1
+            yield line
+        finished = True
+    finally:
+        if not finished and process.returncode is None:
+            logging.debug(f"        🛑 Stopping the command after {line_count} lines of output")
+            stop_command(signal.SIGTERM)
+        # Nothing reads the output anymore, so whatever still writes it gets SIGPIPE
+        process.stdout.close()
+        command_watcher.join(timeout=10)
+        if command_watcher.is_alive():
+            stop_command(signal.SIGKILL)
+            command_watcher.join()
+        process.stderr.close()
+
+    for line in stderr_lines:
+        if line.strip():
+            logging.debug(f"        {line.strip()}")
+
+    if process.returncode < 0:
+        signal_name = get_signal_name(abs(process.returncode))
+        logging.debug(f"        Process killed by signal {abs(process.returncode)} ({signal_name})")
+    else:
+        logging.debug(f"        Process exited with code {process.returncode}")
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, None, "".join(stderr_lines))
+
+
+def build_dnf_command(command: str, repository_paths: Dict[str, str], verbose: bool = False, cache_only: bool = True) -> List[str]:
+    """
+    Build the full command line of a dnf command, with the repository setup.
+
+    Args:
+        command: The dnf command as a string (e.g., "repoquery --whatdepends package")
+        repository_paths: Dictionary mapping repository IDs to URLs
+        verbose: Whether to enable verbose logging
+        cache_only: Whether to use --cacheonly flag (default: True)
+
+    Returns:
+        The command arguments
+    """
+    command_parts = shlex.split(command)
+    full_command = ["dnf"] + command_parts
+
+    full_command.extend(["--disablerepo=*"])
+    if not verbose:
+        full_command.append("--quiet")
+    if cache_only:
+        full_command.append("--cacheonly")
+    for repository_id, repository_url in repository_paths.items():
+        full_command.append(f"--repofrompath=repo-{repository_id},{repository_url}")
+    for repository_id in repository_paths:
+        full_command.append(f"--enablerepo=repo-{repository_id}")
+
+    return full_command
+
+
+def dnf(
+        command: str,
+        repository_paths: Dict[str, str],
+        verbose: bool = False,
+        cache_only: bool = True,
+        metrics: RepoQueryMetrics | None = None
+    ) -> str:
+    """
+    Execute a dnf command with repository setup and return stdout content.
+
+    This function factors out the repeated pattern of setting up dnf commands
+    with repository configuration and executing them.
+
+    Args:
+        command: The dnf command as a string (e.g., "repoquery --whatdepends package")
+        repository_paths: Dictionary mapping repository IDs to URLs
+        verbose: Whether to enable verbose logging
+        cache_only: Whether to use --cacheonly flag (default: True)
+        metrics: Optional metrics object to record how long starting dnf takes
+
+    Returns:
+        The stdout content as a string (stripped)
+
+    Raises:
+        subprocess.CalledProcessError: If the command returns a non-zero exit code
+    """
+    result = run_command(build_dnf_command(command, repository_paths, verbose, cache_only), metrics=metrics)
+    return result["output"].strip()
+
+
+def parse_dependency_names(dependency: str) -> List[str]:
+    """
+    Extract the capability names referenced by a dependency string.
+
+    Plain dependencies are returned as is. Rich (boolean) dependencies such as
+    "(foo >= 1.0 if bar)" are broken down into the capabilities they mention,
+    dropping operators, keywords and versions.
+
+    Args:
+        dependency: The dependency string as found in repository metadata
+
+    Returns:
+        List of capability names
+    """
+    if not dependency.startswith("("):
+        return [dependency]
+
+    names: List[str] = []
+    skip_version = False
+    for token in re.findall(r"[^\s()]+(?:\([^\s()]*\))*", dependency):
+        if skip_version:
+            skip_version = False
+            continue
+
+        if token in ("<", "<=", "=", "==", ">=", ">", "<>"):
+            skip_version = True
+            continue
+
+        if token in RICH_DEPENDENCY_KEYWORDS:
+            continue
+
+        names.append(token)
+
+    return names
+
+
+def open_repository_file(url: str) -> BinaryIO:
+    """
+    Open a file from a repository for streaming, decompressing it on the fly.
+
+    The compression format is picked from the file extension (.gz, .xz, .bz2, .zst).
+    Reading zstd compressed files requires the python zstandard module.
+
+    Args:
+        url: The URL of the file (http://, https:// or file://)
+
+    Returns:
+        A binary file object yielding the uncompressed content
+
+    Raises:
+        RepoQueryError: If the file uses a compression format that can't be read
+    """
+    logging.debug(f"   Opening repository file: {url}")
+    stream = urllib.request.urlopen(url)
+
+    if url.endswith(".gz"):
+        return gzip.GzipFile(fileobj=stream)
+    if url.endswith(".xz"):
+        return lzma.LZMAFile(stream)
+    if url.endswith(".bz2"):
+        return bz2.BZ2File(stream)
+    if url.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            stream.close()
+            raise RepoQueryError(f"Reading {url} requires the python zstandard module")
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+
+    return stream
+
+
+def fetch_repository_metadata(repository_url: str) -> Dict[str, Any]:
+    """
+    Download and parse the repodata/repomd.xml index of a repository.
+
+    Args:
+        repository_url: The repository URL
+
+    Returns:
+        Dictionary containing the 'revision' of the repository and a 'data' dictionary
+        mapping metadata types (e.g. 'primary') to their 'location' URL and 'checksum'
+
+    Raises:
+        RepoQueryError: If repomd.xml can't be downloaded or parsed
+    """
+    repomd_url = f"{repository_url.rstrip('/')}/repodata/repomd.xml"
+    namespaces = REPOSITORY_METADATA_NAMESPACES
+
+    try:
+        with urllib.request.urlopen(repomd_url) as stream:
+            repomd = ElementTree.parse(stream).getroot()
+    except (OSError, ElementTree.ParseError) as error:
+        raise RepoQueryError(f"Failed to load repository metadata from {repomd_url}: {error}")
+
+    data: Dict[str, Dict[str, str]] = {}
+    for data_element in repomd.iterfind("repo:data", namespaces):
+        location = data_element.find("repo:location", namespaces)
+        if location is None:
+            continue
+        data[data_element.get("type")] = {
+            "location": f"{repository_url.rstrip('/')}/{location.get('href')}",
+            "checksum": data_element.findtext("repo:checksum", "", namespaces),
+        }
+
+    return {
+        "revision": repomd.findtext("repo:revision", "", namespaces),
+        "data": data,
+    }
+
+
+def fetch_repository_index_checksum(repository_url: str) -> str:
+    """
+    Compute the checksum of the repodata/repomd.xml index of a repository.
+
+    repomd.xml lists the checksums of all the other metadata files, so its own
+    checksum changes whenever anything in the repository does.
+
+    Args:
+        repository_url: The repository URL
+
+    Returns:
+        SHA-256 hex digest of repomd.xml
+
+    Raises:
+        RepoQueryError: If repomd.xml can't be downloaded
+    """
+    repomd_url = f"{repository_url.rstrip('/')}/repodata/repomd.xml"
+
+    try:
+        with urllib.request.urlopen(repomd_url) as stream:
+            return sha256(stream.read()).hexdigest()
+    except OSError as error:
+        raise RepoQueryError(f"Failed to load repository metadata from {repomd_url}: {error}")
+
+
+def read_primary_packages(repository_id: str, repository_url: str) -> Generator[Dict[str, Any], None, None]:
+    """
+    Generator that streams the packages of the primary metadata of a repository.
+
+    Args:
+        repository_id: The repository ID
+        repository_url: The repository URL
+
+    Yields:
+        The packages, as parsed by parse_primary_package
+
+    Raises:
+        RepoQueryError: If the metadata can't be downloaded or parsed
+    """
+    logging.debug(f"🔄 Loading repository metadata for {repository_id}")
+
+    metadata = fetch_repository_metadata(repository_url)
+    primary = metadata["data"].get("primary")
+    if primary is None:
+        raise RepoQueryError(f"Repository {repository_url} has no primary metadata")
+
+    package_tag = f"{{{REPOSITORY_METADATA_NAMESPACES['common']}}}package"
+    package_count = 0
+    try:
+        with open_repository_file(primary["location"]) as stream:
+            context = ElementTree.iterparse(stream, events=("start", "end"))
+            _, root = next(context)
+            for event, element in context:
+                if event == "end" and element.tag == package_tag:
+                    yield parse_primary_package(element)
+                    package_count += 1
+                    root.clear()
+    except (OSError, EOFError, lzma.LZMAError, ElementTree.ParseError) as error:
+        raise RepoQueryError(f"Failed to load {primary['location']}: {error}")
+
+    logging.debug(f"   Loaded {package_count} packages from {repository_id} (revision {metadata['revision']})")
+
+
+def parse_primary_package(element: ElementTree.Element) -> Dict[str, Any]:
+    """
+    Parse a <package> element from primary metadata.
+
+    Args:
+        element: The parsed <package> element
+
+    Returns:
+        Dictionary containing the package 'name', its 'identity' (NEVRA and package
+        checksum), 'description', 'source_rpm', the capabilities it 'provides' and the
+        capabilities of its 'dependencies' of every type in DEPENDENCY_TYPES
+    """
+    namespaces = REPOSITORY_METADATA_NAMESPACES
+    name = sys.intern(element.findtext("common:name", "", namespaces))
+    arch = element.findtext("common:arch", "", namespaces)
+    version = element.find("common:version", namespaces)
+    package_format = element.find("common:format", namespaces)
+
+    evr = ""
+    if version is not None:
+        evr = f"{version.get('epoch', '0')}:{version.get('ver')}-{version.get('rel')}"
+
+    package: Dict[str, Any] = {
+        "name": name,
+        "identity": f"{name}-{evr}.{arch} {element.findtext('common:checksum', '', namespaces)}",
+        "description": element.findtext("common:description", "", namespaces).strip(),
+        "source_rpm": "",
+        "provides": [],
+        "dependencies": [],
+    }
+
+    if package_format is None:
+        return package
+
+    source_rpm = package_format.findtext("rpm:sourcerpm", "", namespaces).strip()
+    if not source_rpm and arch == "src" and version is not None:
+        # A source package is its own source package
+        source_rpm = f"{name}-{version.get('ver')}-{version.get('rel')}.src.rpm"
+    package["source_rpm"] = source_rpm
+
+    for entry in package_format.iterfind("rpm:provides/rpm:entry", namespaces):
+        package["provides"].append(sys.intern(entry.get("name", "")))
+    for file_element in package_format.iterfind("common:file", namespaces):
+        if file_element.text:
+            package["provides"].append(sys.intern(file_element.text))
+
+    for dependency_type in DEPENDENCY_TYPES:
+        for entry in package_format.iterfind(f"rpm:{dependency_type}/rpm:entry", namespaces):
+            for capability in parse_dependency_names(entry.get("name", "")):
+                if capability.startswith("rpmlib("):
+                    continue
+                package["dependencies"].append(sys.intern(capability))
+
+    return package
+
+
+def compute_repository_key(repository_paths: Dict[str, str], query_engine_name: str) -> str:
+    """
+    Compute a fingerprint of a repository set for keying persistent cache entries.
+
+    The fingerprint covers the repository IDs and URLs, the revision and primary
+    metadata checksum from each repomd.xml, and the query engine (engines can
+    disagree on edge cases), so it changes whenever any repository is updated.
+
+    Args:
+        repository_paths: Dictionary mapping repository IDs to URLs
+        query_engine_name: The query engine answering queries
+
+    Returns:
+        Hex digest identifying the repository set
+
+    Raises:
+        RepoQueryError: If the metadata of a repository can't be loaded
+    """
+    fingerprint: List[Any] = [query_engine_name]
+    for repository_id, repository_url in sorted(repository_paths.items()):
+        metadata = fetch_repository_metadata(repository_url)
+        primary = metadata["data"].get("primary", {})
+        fingerprint.append([repository_id, repository_url, metadata["revision"], primary.get("checksum", "")])
+
+    return sha256(json.dumps(fingerprint).encode("utf-8")).hexdigest()
+
+
+def open_persistent_cache(
+        path: Path,
+        repository_paths: Dict[str, str],
+        query_engine_name: str,
+        no_refresh: bool = False
+    ) -> PersistentCacheStore | None:
+    """
+    Open the persistent cache for the given repository set.
+
+    The persistent cache is only an optimization, so if it can't be used a warning
+    is logged and the script carries on without it.
+
+    Entries are keyed by the repomd.xml of the repositories as they are now, but the
+    dnf engine answers from dnf's local cache, which is only known to match them once
+    it's been refreshed. So the dnf engine doesn't use the persistent cache with --no-refresh,
+    or results from an older compose would be stored as results of the current one.
+
+    Args:
+        path: Path of the SQLite database
+        repository_paths: Dictionary mapping repository IDs to URLs
+        query_engine_name: The query engine answering queries
+        no_refresh: Whether the dnf cache was left as it was (see --no-refresh)
+
+    Returns:
+        The persistent store, or None if it can't be used
+    """
+    if query_engine_name == "dnf" and no_refresh:
+        logging.warning("⚠️  Not using persistent cache: with --no-refresh, the dnf cache may not match the repositories")
+        return None
+
+    logging.debug(f"🔄 Opening persistent cache: {path}")
+
+    try:
+        repository_key = compute_repository_key(repository_paths, query_engine_name)
+        return PersistentCacheStore(path, repository_key)
+    except RepoQueryError as error:
+        logging.warning(f"⚠️  Not using persistent cache: {error}")
+    except sqlite3.Error as error:
+        logging.warning(f"⚠️  Not using persistent cache {path}: {error}")
+
+    return None
+
+
+class QueryEngine:
+    """
+    Answers the repository queries needed to walk reverse dependencies.
+
+    Subclasses implement the three query kinds the script makes:
+    - whatdepends: names of packages depending on a package
+    - source_rpm: the source RPM file name a binary package was built from
+    - description: the description of a package
+
+    Each query is logged and timed with the metrics object under the engine's own call type.
+    Engines that can run queries concurrently also act on the prefetch hints, which
+    announce queries the caller is going to make soon.
+    """
+
+    call_types: Dict[str, str] = {}
+
+    # Whether whatdepends_batch answers several packages with fewer queries than one each
+    batches_whatdepends: bool = False
+
+    def __init__(self, repository_paths: Dict[str, str], metrics: RepoQueryMetrics, verbose: bool = False):
+        self._repository_paths = repository_paths
+        self._metrics = metrics
+        self._verbose = verbose
+
+    @property
+    def metrics(self) -> RepoQueryMetrics:
+        """The metrics object the engine logs and times its queries with."""
+        return self._metrics
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        """
+        Find the packages that depend on a package.
+
+        Args:
+            package_name: The package (or capability) to find dependents for
+
+        Returns:
+            Dependent package names, possibly with duplicates and blank entries
+        """
+        raise NotImplementedError
+
+    def whatdepends_batch(self, package_names: List[str]) -> Dict[str, List[str]]:
+        """
+        Find the packages that depend on several packages at once.
+
+        Engines that pay a fixed cost per query override this to answer the
+        whole batch with fewer queries.
+
+        Args:
+            package_names: The packages (or capabilities) to find dependents for
+
+        Returns:
+            Dictionary mapping each package name to what whatdepends would return for it
+        """
+        return {package_name: list(self.whatdepends(package_name)) for package_name in package_names}
+
+    def source_rpm(self, package_name: str) -> str:
+        """
+        Find the source RPM a binary package was built from.
+
+        Args:
+            package_name: The binary package name
+
+        Returns:
+            The source RPM file name (one per line if ambiguous), or '' if the package wasn't found
+        """
+        raise NotImplementedError
+
+    def source_rpms(self, package_names: List[str]) -> Dict[str, str]:
+        """
+        Find the source RPMs of several binary packages at once.
+
+        Engines that pay a fixed cost per query override this to answer the
+        whole batch with a single query.
+
+        Args:
+            package_names: The binary package names
+
+        Returns:
+            Dictionary mapping each package name to what source_rpm would return for it
+        """
+        return {package_name: self.source_rpm(package_name) for package_name in package_names}
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        """
+        Find the source RPMs of every binary package in the repositories.
+
+        Returns:
+            Dictionary mapping each package name to its source RPM file names (one per line if ambiguous)
+        """
+        raise NotImplementedError
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        """
+        Find the direct dependents of every package in the repositories.
+
+        Returns:
+            Dictionary mapping each package name to its sorted dependents
+        """
+        raise NotImplementedError
+
+    def description(self, package_name: str) -> str:
+        """
+        Find the description of a package.
+
+        Args:
+            package_name: The package name
+
+        Returns:
+            The raw package description, or '' if the package wasn't found
+        """
+        raise NotImplementedError
+
+    def descriptions(self, package_names: List[str]) -> Dict[str, str]:
+        """
+        Find the descriptions of several packages at once.
+
+        Engines that pay a fixed cost per query override this to answer the
+        whole batch with a single query.
+
+        Args:
+            package_names: The package names
+
+        Returns:
+            Dictionary mapping each package name to what description would return for it
+        """
+        return {package_name: self.description(package_name) for package_name in package_names}
+
+    def prefetch_whatdepends(self, package_names: List[str], prefetch_source_rpms: bool = False) -> None:
+        """
+        Announce whatdepends queries that are going to be made soon.
+
+        Args:
+            package_names: The packages whose dependents are going to be queried
+            prefetch_source_rpms: Whether the source RPMs of the dependents are going to be queried too
+        """
+
+    def prefetch_source_rpms(self, package_names: List[str]) -> None:
+        """
+        Announce source_rpm queries that are going to be made soon.
+
+        Args:
+            package_names: The binary packages whose source RPMs are going to be queried
+        """
+
+    def close(self) -> None:
+        """
+        Release any resources held by the engine.
+        """
+
+
+class DnfQueryEngine(QueryEngine):
+    """
+    Answers repository queries by running one dnf repoquery process per query.
+
+    Prefetch hints for several packages are answered with one batched
+    whatdepends query, plus one query for the provides of the packages, and the
+    dependents are attributed to each package by matching the dependencies of
+    the dependents against those provides.
+    """
+
+    call_types = {
+        "whatdepends": "dnf repoquery --whatdepends",
+        "whatdepends_batch": "dnf repoquery --whatdepends (batched) --qf '%{name} %{requires} ...'",
+        "provides": "dnf repoquery --qf '%{name} %{provides}'",
+        "source_rpm": "dnf repoquery --qf '%{sourcerpm}'",
+        "source_rpms": "dnf repoquery --qf '%{name} %{sourcerpm}'",
+        "source_rpm_map": "dnf repoquery --all --qf '%{name} %{sourcerpm}'",
+        "dependents_map": "dnf repoquery --all --qf '%{name} %{provides} %{requires} ...'",
+        "files_map": "dnf repoquery --all --qf '%{name} %{files}'",
+        "description": "dnf repoquery --qf '%{description}'",
+        "descriptions": "dnf repoquery --qf '%{name} %{description}'",
+    }
+
+    batches_whatdepends = True
+
+    def __init__(self, repository_paths: Dict[str, str], metrics: RepoQueryMetrics, verbose: bool = False):
+        super().__init__(repository_paths, metrics, verbose)
+        self._prefetched_dependents: Dict[str, List[str]] = {}
+
+    def _query_records(self, command: str, fields: List[str]) -> List[List[str]]:
+        """
+        Run a repoquery that prints several (possibly multi-line) fields per package.
+
+        Args:
+            command: The repoquery command, without --qf
+            fields: The query format tags to print for each package, e.g. 'name'
+
+        Returns:
+            A list of field values for each package found
+
+        Raises:
+            subprocess.CalledProcessError: If the command fails
+        """
+        query_format = QUERY_FIELD_SEPARATOR.join(f"%{{{field}}}" for field in fields) + QUERY_RECORD_SEPARATOR
+        stdout_content = dnf(f"{command} --qf '{query_format}'", self._repository_paths, self._verbose, metrics=self._metrics)
+
+        records = []
+        for record in stdout_content.split(QUERY_RECORD_SEPARATOR):
+            values = [value.strip() for value in record.split(QUERY_FIELD_SEPARATOR)]
+            if not values[0] or len(values) > len(fields):
+                continue
+
+            # The separators count as whitespace, so the empty fields at the end of
+            # the last record get stripped along with the rest of the output
+            records.append(values + [""] * (len(fields) - len(values)))
+        return records
+
+    def _capability_names(self, dependencies: str) -> List[str]:
+        """
+        Extract the capability names from a list of dependencies as printed by repoquery.
+
+        Args:
+            dependencies: The dependencies, one per line (e.g. 'libc.so.6()(64bit)' or 'bash >= 5.0')
+
+        Returns:
+            List of capability names
+        """
+        names: List[str] = []
+        for dependency in dependencies.splitlines():
+            dependency = dependency.strip()
+            if not dependency or dependency == "(none)":
+                continue
+            if dependency.startswith("("):
+                names.extend(parse_dependency_names(dependency))
+            else:
+                names.append(dependency.split()[0])
+        return names
+
+    def _versioned_capability_names(self, dependencies: str) -> List[str]:
+        """
+        Extract the capability names of the dependencies that only match some versions of them.
+
+        Those are the dependencies with a version (e.g. 'bash >= 5.0'), and rich
+        dependencies, which may also only hold under some condition.
+
+        Args:
+            dependencies: The dependencies, one per line, as printed by repoquery
+
+        Returns:
+            List of capability names
+        """
+        names: List[str] = []
+        for dependency in dependencies.splitlines():
+            dependency = dependency.strip()
+            if dependency.startswith("("):
+                names.extend(parse_dependency_names(dependency))
+            elif len(dependency.split()) > 1:
+                names.append(dependency.split()[0])
+        return names
+
+    def _whatdepends_batch(self, package_names: List[str]) -> Dict[str, List[str]] | None:
+        """
+        Find the direct dependents of several packages with one whatdepends query.
+
+        Versions are ignored when matching dependencies against provides, which is
+        what tells the dependents of the packages apart. So a dependent that matches
+        several of the packages, some of them only through versioned or rich
+        dependencies, can't be told apart: dnf may only count it for some of them.
+
+        Args:
+            package_names: The packages to find the dependents of
+
+        Returns:
+            Dictionary mapping each package name to its sorted dependents, or None if
+            some dependent couldn't be attributed to any of the packages, or couldn't
+            be attributed for sure
+
+        Raises:
+            subprocess.CalledProcessError: If a query fails
+        """
+        with self._metrics.time_call(self.call_types["whatdepends_batch"], ",".join(package_names)):
+            dependent_records = self._query_records(
+                f"repoquery --whatdepends {','.join(package_names)}",
+                ["name"] + DEPENDENCY_TYPES
+            )
+
+        dependencies: Dict[str, Set[str]] = {}
+        versioned_dependencies: Dict[str, Set[str]] = {}
+        for dependent_name, *dependency_fields in dependent_records:
+            capabilities = dependencies.setdefault(dependent_name, set())
+            versioned_capabilities = versioned_dependencies.setdefault(dependent_name, set())
+            for dependency_field in dependency_fields:
+                capabilities.update(self._capability_names(dependency_field))
+                versioned_capabilities.update(self._versioned_capability_names(dependency_field))
+        if not dependencies:
+            return {package_name: [] for package_name in package_names}
+
+        # File dependencies are matched against the files of the packages, so
+        # only list those when some dependent has one
+        needs_files = any(capability.startswith("/") for capabilities in dependencies.values() for capability in capabilities)
+        fields = ["name", "provides"] + (["files"] if needs_files else [])
+
+        with self._metrics.time_call(self.call_types["provides"], " ".join(package_names)):
+            provide_records = self._query_records(f"repoquery {' '.join(package_names)}", fields)
+
+        provides: Dict[str, Set[str]] = {}
+        for package_name, *provide_fields in provide_records:
+            capabilities = provides.setdefault(package_name, {package_name})
+            for provide_field in provide_fields:
+                capabilities.update(self._capability_names(provide_field))
+
+        dependents: Dict[str, List[str]] = {}
+        attribution_counts: Dict[str, int] = {}
+        versioned_attributions: Set[str] = set()
+        for package_name in package_names:
+            # Like dnf, fall back to treating the name as a capability if no package has it
+            capabilities = provides.get(package_name, {package_name})
+            package_dependents = sorted(
+                dependent_name for dependent_name, dependent_capabilities in dependencies.items()
+                if not capabilities.isdisjoint(dependent_capabilities)
+            )
+            dependents[package_name] = package_dependents
+            for dependent_name in package_dependents:
+                attribution_counts[dependent_name] = attribution_counts.get(dependent_name, 0) + 1
+
+                # Only matching through versioned dependencies may be wrong about the versions
+                unversioned_capabilities = dependencies[dependent_name] - versioned_dependencies[dependent_name]
+                if capabilities.isdisjoint(unversioned_capabilities):
+                    versioned_attributions.add(dependent_name)
+
+        if len(attribution_counts) != len(dependencies):
+            return None
+
+        # A dependent that only matches one package depends on it, since dnf found it,
+        # but one that matches several may not depend on those it only matches by name
+        if any(attribution_counts[dependent_name] > 1 for dependent_name in versioned_attributions):
+            return None
+
+        return dependents
+
+    def prefetch_whatdepends(self, package_names: List[str], prefetch_source_rpms: bool = False) -> None:
+        package_names = [package_name for package_name in dict.fromkeys(package_names) if package_name not in self._prefetched_dependents]
+
+        # A single package is just as well off with its own query
+        if len(package_names) < 2:
+            return
+
+        for start in range(0, len(package_names), WHATDEPENDS_QUERY_BATCH_SIZE):
+            batch = package_names[start:start + WHATDEPENDS_QUERY_BATCH_SIZE]
+            try:
+                dependents = self._whatdepends_batch(batch)
+            except subprocess.CalledProcessError:
+                # The queries for the individual packages will report what's wrong
+                dependents = None
+
+            if dependents is None:
+                logging.debug(f"   Couldn't attribute batched dependents of {len(batch)} packages, querying them one by one")
+                continue
+
+            self._prefetched_dependents.update(dependents)
+
+    def whatdepends_batch(self, package_names: List[str]) -> Dict[str, List[str]]:
+        self.prefetch_whatdepends(package_names)
+        return {package_name: list(self.whatdepends(package_name)) for package_name in package_names}
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        prefetched_dependents = self._prefetched_dependents.pop(package_name, None)
+        if prefetched_dependents is not None:
+            return prefetched_dependents
+
+        return self._stream_whatdepends(package_name)
+
+    def _stream_whatdepends(self, package_name: str) -> Generator[str, None, None]:
+        """
+        Generator that yields the dependents of a package as dnf prints them.
+
+        Closing the generator early stops dnf.
+
+        Args:
+            package_name: The package to find the dependents of
+
+        Yields:
+            Names of the packages depending on the package
+
+        Raises:
+            RepoQueryError: If the dnf repoquery call fails
+        """
+        command = build_dnf_command(f"repoquery --whatdepends {package_name} --qf '%{{name}}\\n'", self._repository_paths, self._verbose)
+        try:
+            yield from stream_command(command, self._metrics, self.call_types["whatdepends"], package_name)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(
+                f"Failed to query reverse dependencies for {package_name!r}: {stderr}"
+            )
+
+    def source_rpm(self, package_name: str) -> str:
+        try:
+            with self._metrics.time_call(self.call_types["source_rpm"], package_name):
+                stdout_content = dnf(f"repoquery {package_name} --qf '%{{sourcerpm}}\\n'", self._repository_paths, self._verbose, metrics=self._metrics)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(
+                f"Failed to query source package for {package_name!r}: {stderr}"
+            )
+
+        return stdout_content.strip()
+
+    def source_rpms(self, package_names: List[str]) -> Dict[str, str]:
+        if not package_names:
+            return {}
+
+        try:
+            with self._metrics.time_call(self.call_types["source_rpms"], " ".join(package_names)):
+                stdout_content = dnf(f"repoquery {' '.join(package_names)} --qf '%{{name}} %{{sourcerpm}}\\n'", self._repository_paths, self._verbose, metrics=self._metrics)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(
+                f"Failed to query source packages for {len(package_names)} packages: {stderr}"
+            )
+
+        source_rpms = self._parse_source_rpm_lines(stdout_content)
+        return {package_name: source_rpms.get(package_name, "") for package_name in package_names}
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        try:
+            with self._metrics.time_call(self.call_types["source_rpm_map"], "--all"):
+                stdout_content = dnf("repoquery --all --qf '%{name} %{sourcerpm}\\n'", self._repository_paths, self._verbose, metrics=self._metrics)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(f"Failed to query source packages of all packages: {stderr}")
+
+        return self._parse_source_rpm_lines(stdout_content)
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        try:
+            with self._metrics.time_call(self.call_types["dependents_map"], "--all"):
+                package_records = self._query_records("repoquery --all", ["name", "provides"] + DEPENDENCY_TYPES)
+
+            # File dependencies are matched against the files of the packages, so
+            # only list those (which is slow) when some package has one
+            needs_files = any(
+                capability.startswith("/")
+                for _, _, *dependency_fields in package_records
+                for dependency_field in dependency_fields
+                for capability in self._capability_names(dependency_field)
+            )
+            file_records: List[List[str]] = []
+            if needs_files:
+                with self._metrics.time_call(self.call_types["files_map"], "--all"):
+                    file_records = self._query_records("repoquery --all", ["name", "files"])
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(f"Failed to query dependencies of all packages: {stderr}")
+
+        providers: Dict[str, Set[str]] = {}
+        for package_name, provide_field, *_ in package_records + file_records:
+            providers.setdefault(package_name, set()).add(package_name)
+            for capability in self._capability_names(provide_field):
+                providers.setdefault(capability, set()).add(package_name)
+
+        dependents: Dict[str, Set[str]] = {package_name: set() for package_name, *_ in package_records}
+        for dependent_name, _, *dependency_fields in package_records:
+            for dependency_field in dependency_fields:
+                for capability in self._capability_names(dependency_field):
+                    for package_name in providers.get(capability, ()):
+                        dependents[package_name].add(dependent_name)
+
+        return {package_name: sorted(package_dependents) for package_name, package_dependents in dependents.items()}
+
+    def _parse_source_rpm_lines(self, stdout_content: str) -> Dict[str, str]:
+        """
+        Parse the output of a repoquery with --qf '%{name} %{sourcerpm}'.
+
+        Args:
+            stdout_content: The repoquery output
+
+        Returns:
+            Dictionary mapping each package name to its source RPM file names (one per line if ambiguous)
+        """
+        source_rpms: Dict[str, Set[str]] = {}
+        for line in stdout_content.splitlines():
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            package_name, source_rpm = fields
+            source_rpms.setdefault(package_name, set()).add(source_rpm)
+
+        return {package_name: "\n".join(sorted(rpms)) for package_name, rpms in source_rpms.items()}
+
+    def description(self, package_name: str) -> str:
+        try:
+            with self._metrics.time_call(self.call_types["description"], package_name):
+                stdout_content = dnf(f"repoquery {package_name} --qf %{{description}}", self._repository_paths, self._verbose, metrics=self._metrics)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(
+                f"Failed to query description for {package_name!r}: {stderr}"
+            )
+
+        return stdout_content.strip()
+
+    def descriptions(self, package_names: List[str]) -> Dict[str, str]:
+        if not package_names:
+            return {}
+
+        # Descriptions span several lines, so separate the fields and records with
+        # control characters that don't show up in them
+        query_format = f"%{{name}}{QUERY_FIELD_SEPARATOR}%{{description}}{QUERY_RECORD_SEPARATOR}"
+        try:
+            with self._metrics.time_call(self.call_types["descriptions"], " ".join(package_names)):
+                stdout_content = dnf(f"repoquery {' '.join(package_names)} --qf '{query_format}'", self._repository_paths, self._verbose, metrics=self._metrics)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.strip() if error.stderr else "Unknown error"
+            raise RepoQueryError(
+                f"Failed to query descriptions for {len(package_names)} packages: {stderr}"
+            )
+
+        descriptions: Dict[str, Set[str]] = {}
+        for record in stdout_content.split(QUERY_RECORD_SEPARATOR):
+            package_name, separator, description = record.partition(QUERY_FIELD_SEPARATOR)
+            if not separator:
+                continue
+            description = description.strip()
+            if description:
+                descriptions.setdefault(package_name.strip(), set()).add(description)
+
+        return {package_name: "\n".join(sorted(descriptions.get(package_name, ()))) for package_name in package_names}
+
+
+class RepodataQueryEngine(QueryEngine):
+    """
+    Answers repository queries from an in-memory index of the repository metadata.
+
+    The primary metadata of every repository is streamed once, when the engine is
+    created, and indexed by provided capability, dependency, source RPM and description.
+    Queries never leave the process afterward.
+
+    Dependencies are matched to provides by capability name only, and only the file
+    provides listed in the primary metadata are known, so results can be slightly
+    wider than what dnf reports for versioned or file dependencies.
+    """
+
+    call_types = {
+        "whatdepends": "repodata --whatdepends",
+        "source_rpm": "repodata sourcerpm",
+        "source_rpm_map": "repodata sourcerpm --all",
+        "dependents_map": "repodata --whatdepends --all",
+        "description": "repodata description",
+    }
+
+    def __init__(self, repository_paths: Dict[str, str], metrics: RepoQueryMetrics, verbose: bool = False):
+        super().__init__(repository_paths, metrics, verbose)
+        self._provides: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._source_rpms: Dict[str, Set[str]] = {}
+        self._descriptions: Dict[str, Set[str]] = {}
+
+        for repository_id, repository_url in repository_paths.items():
+            self._load_repository(repository_id, repository_url)
+
+        logging.debug(f"✅ Indexed {len(self._provides)} packages from {len(repository_paths)} repositories")
+
+    def _load_repository(self, repository_id: str, repository_url: str) -> None:
+        """
+        Stream the primary metadata of a repository into the index.
+
+        Args:
+            repository_id: The repository ID
+            repository_url: The repository URL
+
+        Raises:
+            RepoQueryError: If the metadata can't be downloaded or parsed
+        """
+        for package in read_primary_packages(repository_id, repository_url):
+            self._add_package(package)
+
+    def _add_package(self, package: Dict[str, Any]) -> None:
+        """
+        Add a package from primary metadata to the index.
+
+        Args:
+            package: The package, as parsed by parse_primary_package
+        """
+        name = package["name"]
+        provides = self._provides.setdefault(name, {name})
+        if package["description"]:
+            self._descriptions.setdefault(name, set()).add(package["description"])
+        if package["source_rpm"]:
+            self._source_rpms.setdefault(name, set()).add(package["source_rpm"])
+
+        provides.update(package["provides"])
+        for capability in package["dependencies"]:
+            self._dependents.setdefault(capability, set()).add(name)
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        with self._metrics.time_call(self.call_types["whatdepends"], package_name):
+            # Like dnf, fall back to treating the name as a capability if no package has it
+            capabilities = self._provides.get(package_name, {package_name})
+            dependents: Set[str] = set()
+            for capability in capabilities:
+                dependents.update(self._dependents.get(capability, ()))
+
+            return sorted(dependents)
+
+    def source_rpm(self, package_name: str) -> str:
+        with self._metrics.time_call(self.call_types["source_rpm"], package_name):
+            return "\n".join(sorted(self._source_rpms.get(package_name, ())))
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        with self._metrics.time_call(self.call_types["source_rpm_map"], "--all"):
+            return {package_name: "\n".join(sorted(source_rpms)) for package_name, source_rpms in self._source_rpms.items()}
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        with self._metrics.time_call(self.call_types["dependents_map"], "--all"):
+            dependents_map: Dict[str, List[str]] = {}
+            for package_name, capabilities in self._provides.items():
+                dependents: Set[str] = set()
+                for capability in capabilities:
+                    dependents.update(self._dependents.get(capability, ()))
+                dependents_map[package_name] = sorted(dependents)
+            return dependents_map
+
+    def description(self, package_name: str) -> str:
+        with self._metrics.time_call(self.call_types["description"], package_name):
+            return "\n".join(sorted(self._descriptions.get(package_name, ())))
+
+
+class LibsolvQueryEngine(QueryEngine):
+    """
+    Answers repository queries from a libsolv pool loaded once at startup.
+
+    The primary metadata of every repository is loaded into a single long-lived pool,
+    so queries are answered by libsolv's provides/dependency index with no subprocess.
+    Dependencies are matched the way dnf matches them, including versions and rich
+    dependencies. Requires the libsolv python bindings (python3-solv).
+    """
+
+    call_types = {
+        "whatdepends": "libsolv --whatdepends",
+        "source_rpm": "libsolv sourcerpm",
+        "source_rpm_map": "libsolv sourcerpm --all",
+        "dependents_map": "libsolv --whatdepends --all",
+        "description": "libsolv description",
+    }
+
+    def __init__(self, repository_paths: Dict[str, str], metrics: RepoQueryMetrics, verbose: bool = False):
+        super().__init__(repository_paths, metrics, verbose)
+
+        try:
+            import solv
+        except ImportError:
+            raise RepoQueryError("The libsolv query engine requires the libsolv python bindings (python3-solv)")
+
+        self._solv = solv
+        self._dependency_keys = [
+            solv.SOLVABLE_REQUIRES,
+            solv.SOLVABLE_RECOMMENDS,
+            solv.SOLVABLE_SUGGESTS,
+            solv.SOLVABLE_SUPPLEMENTS,
+            solv.SOLVABLE_ENHANCES,
+        ]
+        self._pool = solv.Pool()
+        # libsolv pools aren't safe to query from several threads at once
+        self._lock = threading.Lock()
+
+        with tempfile.TemporaryDirectory(prefix="find-package-dependents-") as download_directory:
+            for repository_id, repository_url in repository_paths.items():
+                self._load_repository(repository_id, repository_url, download_directory)
+
+        self._pool.addfileprovides()
+        self._pool.createwhatprovides()
+
+        logging.debug(f"✅ Loaded {sum(repository.nsolvables for repository in self._pool.repos)} packages from {len(repository_paths)} repositories")
+
+    def _load_repository(self, repository_id: str, repository_url: str, download_directory: str) -> None:
+        """
+        Load the primary metadata of a repository into the pool.
+
+        libsolv reads metadata from files, so the primary metadata is downloaded
+        to a temporary file first.
+
+        Args:
+            repository_id: The repository ID
+            repository_url: The repository URL
+            download_directory: Directory to download metadata into
+
+        Raises:
+            RepoQueryError: If the metadata can't be downloaded or loaded
+        """
+        logging.debug(f"🔄 Loading repository metadata for {repository_id}")
+
+        metadata = fetch_repository_metadata(repository_url)
+        primary = metadata["data"].get("primary")
+        if primary is None:
+            raise RepoQueryError(f"Repository {repository_url} has no primary metadata")
+
+        # Keep the file extension, libsolv picks the decompressor from it
+        primary_path = os.path.join(download_directory, f"{repository_id}-{os.path.basename(primary['location'])}")
+        try:
+            with urllib.request.urlopen(primary["location"]) as response, open(primary_path, "wb") as primary_file:
+                shutil.copyfileobj(response, primary_file)
+        except OSError as error:
+            raise RepoQueryError(f"Failed to load {primary['location']}: {error}")
+
+        repository = self._pool.add_repo(repository_id)
+        primary_file = self._solv.xfopen(primary_path)
+        if primary_file is None or not repository.add_rpmmd(primary_file, None):
+            raise RepoQueryError(f"Failed to load {primary['location']}: {self._pool.errstr}")
+        primary_file.close()
+
+        logging.debug(f"   Loaded {repository.nsolvables} packages from {repository_id} (revision {metadata['revision']})")
+
+    def _find_packages(self, package_name: str) -> List[Any]:
+        """
+        Find the solvables with the given package name.
+
+        Args:
+            package_name: The package name
+
+        Returns:
+            List of matching solvables
+        """
+        selection = self._pool.select(package_name, self._solv.Selection.SELECTION_NAME)
+        return selection.solvables()
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        dependents: Set[str] = set()
+        with self._metrics.time_call(self.call_types["whatdepends"], package_name), self._lock:
+            packages = self._find_packages(package_name)
+            for dependency_key in self._dependency_keys:
+                if packages:
+                    for package in packages:
+                        dependents.update(dependent.name for dependent in self._pool.whatmatchessolvable(dependency_key, package))
+                else:
+                    # Like dnf, fall back to treating the name as a capability if no package has it
+                    dependency = self._pool.Dep(package_name)
+                    dependents.update(dependent.name for dependent in self._pool.whatmatchesdep(dependency_key, dependency))
+
+        return sorted(dependents)
+
+    def _source_rpm_of(self, package: Any) -> str:
+        """
+        Find the source RPM of a solvable.
+
+        Args:
+            package: The solvable
+
+        Returns:
+            The source RPM file name, or '' if it isn't known
+        """
+        if package.arch in ("src", "nosrc"):
+            # A source package is its own source package
+            version_release = package.evr.split(":", 1)[-1]
+            return f"{package.name}-{version_release}.src.rpm"
+
+        return package.lookup_sourcepkg() or ""
+
+    def source_rpm(self, package_name: str) -> str:
+        source_rpms: Set[str] = set()
+        with self._metrics.time_call(self.call_types["source_rpm"], package_name), self._lock:
+            for package in self._find_packages(package_name):
+                source_rpm = self._source_rpm_of(package)
+                if source_rpm:
+                    source_rpms.add(source_rpm)
+
+        return "\n".join(sorted(source_rpms))
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        source_rpms: Dict[str, Set[str]] = {}
+        with self._metrics.time_call(self.call_types["source_rpm_map"], "--all"), self._lock:
+            for package in self._pool.solvables_iter():
+                source_rpm = self._source_rpm_of(package)
+                if source_rpm:
+                    source_rpms.setdefault(package.name, set()).add(source_rpm)
+
+        return {package_name: "\n".join(sorted(rpms)) for package_name, rpms in source_rpms.items()}
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        dependents: Dict[str, Set[str]] = {}
+        with self._metrics.time_call(self.call_types["dependents_map"], "--all"), self._lock:
+            for package in self._pool.solvables_iter():
+                package_dependents = dependents.setdefault(package.name, set())
+                for dependency_key in self._dependency_keys:
+                    package_dependents.update(dependent.name for dependent in self._pool.whatmatchessolvable(dependency_key, package))
+
+        return {package_name: sorted(package_dependents) for package_name, package_dependents in dependents.items()}
+
+    def description(self, package_name: str) -> str:
+        with self._metrics.time_call(self.call_types["description"], package_name), self._lock:
+            descriptions = {package.lookup_str(self._solv.SOLVABLE_DESCRIPTION) for package in self._find_packages(package_name)}
+        return "\n".join(sorted(description.strip() for description in descriptions if description))
+
+    def close(self) -> None:
+        with self._lock:
+            self._pool.free()
+
+
+# The query engine used by worker processes, inherited from the parent when the pool forks
+_worker_query_engine: QueryEngine | None = None
+
+
+def initialize_query_worker() -> None:
+    """
+    Set up a query worker process.
+
+    Interrupts are left to the parent process, which shuts the pool down.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_query(query_engine: QueryEngine, query_kind: str, package_name: Any) -> Any:
+    """
+    Run a query of the given kind with a query engine.
+
+    Args:
+        query_engine: The query engine to run the query with
+        query_kind: One of 'whatdepends', 'whatdepends_batch', 'source_rpm', 'source_rpms', 'source_rpm_map', 'dependents_map', 'description' or 'descriptions'
+        package_name: The package to query (a tuple of packages for 'whatdepends_batch', 'source_rpms' and 'descriptions')
+
+    Returns:
+        The query result
+    """
+    if query_kind == "whatdepends":
+        return list(query_engine.whatdepends(package_name))
+
+    if query_kind == "whatdepends_batch":
+        return query_engine.whatdepends_batch(list(package_name))
+
+    if query_kind == "source_rpm":
+        return query_engine.source_rpm(package_name)
+
+    if query_kind == "source_rpms":
+        return query_engine.source_rpms(list(package_name))
+
+    if query_kind == "source_rpm_map":
+        return query_engine.source_rpm_map()
+
+    if query_kind == "dependents_map":
+        return query_engine.dependents_map()
+
+    if query_kind == "description":
+        return query_engine.description(package_name)
+
+    if query_kind == "descriptions":
+        return query_engine.descriptions(list(package_name))
+
+    return None
+
+
+def run_measured_query(query_engine: QueryEngine, query_kind: str, package_name: Any) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Run a query of the given kind with a query engine, and collect the timings it recorded.
+
+    Args:
+        query_engine: The query engine to run the query with
+        query_kind: One of 'whatdepends', 'whatdepends_batch', 'source_rpm', 'source_rpms', 'source_rpm_map', 'dependents_map', 'description' or 'descriptions'
+        package_name: The package to query (a tuple of packages for 'whatdepends_batch', 'source_rpms' and 'descriptions')
+
+    Returns:
+        The query result, and the timings recorded with the engine's metrics since they were last collected
+    """
+    result = run_query(query_engine, query_kind, package_name)
+    return result, query_engine.metrics.take_measurements()
+
+
+def run_worker_query(query_kind: str, package_name: Any) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Run a query with the query engine of a worker process.
+
+    Args:
+        query_kind: One of 'whatdepends', 'whatdepends_batch', 'source_rpm', 'source_rpms', 'source_rpm_map', 'dependents_map', 'description' or 'descriptions'
+        package_name: The package to query (a tuple of packages for 'whatdepends_batch', 'source_rpms' and 'descriptions')
+
+    Returns:
+        The query result, and the timings the worker recorded for it
+    """
+    return run_measured_query(_worker_query_engine, query_kind, package_name)
+
+
+class WorkerPoolQueryEngine(QueryEngine):
+    """
+    Answers repository queries from a pool of long-lived workers.
+
+    By default the workers are processes forked from the process that set up the
+    wrapped query engine, so in-process engines load the repository metadata once
+    and every worker starts with it already loaded. Engines whose queries already
+    run in subprocesses can use a bounded pool of threads instead.
+
+    Prefetch hints fan queries out across the workers; the results are kept until
+    the matching query consumes them, so callers see the same answers, in the same
+    order, as with a serial engine. The calls are logged here, when they're handed
+    to the workers, so the wrapped engine should log to metrics of its own. The
+    workers time the queries, and pass the timings on with the results.
+    """
+
+    def __init__(
+            self,
+            query_engine: QueryEngine,
+            repository_paths: Dict[str, str],
+            metrics: RepoQueryMetrics,
+            jobs: int,
+            verbose: bool = False,
+            use_threads: bool = False
+        ):
+        global _worker_query_engine
+        super().__init__(repository_paths, metrics, verbose)
+
+        self._query_engine = query_engine
+        self.call_types = query_engine.call_types
+        self._jobs = jobs
+        self._pending: Dict[tuple, concurrent.futures.Future] = {}
+        self._prefetched_source_rpms: Set[str] = set()
+        self._lock = threading.RLock()
+
+        if use_threads:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="query-worker")
+            logging.debug(f"✅ Started pool of {jobs} query threads")
+            return
+
+        _worker_query_engine = query_engine
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=initialize_query_worker
+        )
+
+        # Start every worker now, before the caller has any threads of its own
+        for future in [self._executor.submit(run_worker_query, "ping", "") for _ in range(jobs)]:
+            future.result()
+
+        logging.debug(f"✅ Started {jobs} query workers")
+
+    def _run_query(self, query_kind: str, package_name: Any) -> concurrent.futures.Future:
+        """
+        Start a query on the workers.
+
+        Args:
+            query_kind: One of 'whatdepends', 'whatdepends_batch', 'source_rpm', 'source_rpms', 'source_rpm_map', 'dependents_map', 'description' or 'descriptions'
+            package_name: The package to query (a tuple of packages for 'whatdepends_batch', 'source_rpms' and 'descriptions')
+
+        Returns:
+            The future for the query result
+        """
+        if isinstance(self._executor, concurrent.futures.ThreadPoolExecutor):
+            measured_future = self._executor.submit(run_measured_query, self._query_engine, query_kind, package_name)
+        else:
+            measured_future = self._executor.submit(run_worker_query, query_kind, package_name)
+
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        measured_future.add_done_callback(lambda finished_future: self._hand_over_result(finished_future, future))
+        return future
+
+    def _hand_over_result(self, measured_future: concurrent.futures.Future, future: concurrent.futures.Future) -> None:
+        """
+        Pass the result of a query a worker finished on, after taking the timings out of it.
+
+        Args:
+            measured_future: The finished future for the query result and timings
+            future: The future to pass the query result on to
+        """
+        if measured_future.cancelled():
+            future.cancel()
+            return
+
+        error = measured_future.exception()
+        if error is not None:
+            future.set_exception(error)
+            return
+
+        result, measurements = measured_future.result()
+        self._metrics.add_measurements(measurements)
+        future.set_result(result)
+
+    def _submit(self, query_kind: str, package_name: str) -> concurrent.futures.Future:
+        """
+        Hand a query to the workers unless it's already pending.
+
+        Args:
+            query_kind: One of 'whatdepends', 'source_rpm' or 'description'
+            package_name: The package to query
+
+        Returns:
+            The future for the query result
+        """
+        with self._lock:
+            future = self._pending.get((query_kind, package_name))
+            if future is None:
+                self._metrics.log_call(self.call_types[query_kind], package_name)
+                future = self._run_query(query_kind, package_name)
+                self._pending[(query_kind, package_name)] = future
+            return future
+
+    def _collect(self, query_kind: str, package_name: str) -> Any:
+        """
+        Wait for a query result and forget about it.
+
+        Args:
+            query_kind: One of 'whatdepends', 'source_rpm' or 'description'
+            package_name: The package to query
+
+        Returns:
+            The query result
+        """
+        future = self._submit(query_kind, package_name)
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self._pending.pop((query_kind, package_name), None)
+
+    def _prefetch_dependent_source_rpms(self, future: concurrent.futures.Future) -> None:
+        """
+        Queue source RPM queries for the result of a whatdepends query.
+
+        Args:
+            future: The finished whatdepends query
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self.prefetch_source_rpms([dependent.strip() for dependent in future.result() if dependent.strip()])
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        return self._collect("whatdepends", package_name)
+
+    def source_rpm(self, package_name: str) -> str:
+        return self._collect("source_rpm", package_name)
+
+    def _run_batch(self, query_kind: str, single_query_kind: str, package_names: List[str]) -> Dict[str, Any]:
+        """
+        Run a batch query, split evenly across the workers.
+
+        Args:
+            query_kind: The batch query kind, 'source_rpms' or 'descriptions'
+            single_query_kind: The matching query kind for one package, used for logging
+                the calls if the wrapped engine answers batches one package at a time
+            package_names: The packages to query
+
+        Returns:
+            Dictionary mapping each package name to its query result
+        """
+        chunk_size = max(1, -(-len(package_names) // self._jobs))
+        futures = []
+        for start in range(0, len(package_names), chunk_size):
+            chunk = tuple(package_names[start:start + chunk_size])
+            with self._lock:
+                if query_kind in self.call_types:
+                    self._metrics.log_call(self.call_types[query_kind], " ".join(chunk))
+                else:
+                    for package_name in chunk:
+                        self._metrics.log_call(self.call_types[single_query_kind], package_name)
+            futures.append(self._run_query(query_kind, chunk))
+
+        results: Dict[str, Any] = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def source_rpms(self, package_names: List[str]) -> Dict[str, str]:
+        return self._run_batch("source_rpms", "source_rpm", package_names)
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        self._metrics.log_call(self.call_types["source_rpm_map"], "--all")
+        return self._run_query("source_rpm_map", None).result()
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        self._metrics.log_call(self.call_types["dependents_map"], "--all")
+        return self._run_query("dependents_map", None).result()
+
+    def description(self, package_name: str) -> str:
+        return self._collect("description", package_name)
+
+    def descriptions(self, package_names: List[str]) -> Dict[str, str]:
+        return self._run_batch("descriptions", "description", package_names)
+
+    def _submit_whatdepends_batch(self, package_names: List[str]) -> List[concurrent.futures.Future]:
+        """
+        Hand the whatdepends queries of several packages to the workers as one batch query.
+
+        Args:
+            package_names: The packages to query, none of them pending already
+
+        Returns:
+            The futures for the whatdepends query result of each package
+        """
+        with self._lock:
+            self._metrics.log_call(self.call_types["whatdepends_batch"], " ".join(package_names))
+            batch_future = self._run_query("whatdepends_batch", tuple(package_names))
+            futures: List[concurrent.futures.Future] = []
+            for package_name in package_names:
+                future: concurrent.futures.Future = concurrent.futures.Future()
+                self._pending[("whatdepends", package_name)] = future
+                futures.append(future)
+
+        def hand_over_dependents(finished_future: concurrent.futures.Future) -> None:
+            error = None if finished_future.cancelled() else finished_future.exception()
+            for package_name, future in zip(package_names, futures):
+                if finished_future.cancelled():
+                    future.cancel()
+                elif error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(finished_future.result()[package_name])
+
+        batch_future.add_done_callback(hand_over_dependents)
+        return futures
+
+    def prefetch_whatdepends(self, package_names: List[str], prefetch_source_rpms: bool = False) -> None:
+        futures: List[concurrent.futures.Future] = []
+        if self._query_engine.batches_whatdepends:
+            # Split the level into one batch query per worker, rather than a query per package
+            with self._lock:
+                package_names = [
+                    package_name for package_name in dict.fromkeys(package_names)
+                    if ("whatdepends", package_name) not in self._pending
+                ]
+            chunk_size = max(1, -(-len(package_names) // self._jobs))
+            for start in range(0, len(package_names), chunk_size):
+                chunk = package_names[start:start + chunk_size]
+                if len(chunk) == 1:
+                    futures.append(self._submit("whatdepends", chunk[0]))
+                else:
+                    futures.extend(self._submit_whatdepends_batch(chunk))
+        else:
+            futures = [self._submit("whatdepends", package_name) for package_name in package_names]
+
+        if prefetch_source_rpms:
+            for future in futures:
+                future.add_done_callback(self._prefetch_dependent_source_rpms)
+
+    def prefetch_source_rpms(self, package_names: List[str]) -> None:
+        with self._lock:
+            for package_name in package_names:
+                # Results are consumed once, later lookups come from the source package cache
+                if package_name in self._prefetched_source_rpms:
+                    continue
+                self._prefetched_source_rpms.add(package_name)
+                self._submit("source_rpm", package_name)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._query_engine.close()
+
+
+class ComposeChanges:
+    """
+    The packages that differ between two composes, found from their primary metadata.
+
+    Packages are compared by name: a name is unchanged if the same NEVRAs, with the
+    same package checksums, have it in both composes. For the packages that changed,
+    the capabilities they depend on in the new compose are indexed, so the dependents
+    of an unchanged package can be worked out from its dependents in the old compose.
+    """
+
+    def __init__(self, old_repository_paths: Dict[str, str], new_repository_paths: Dict[str, str]):
+        old_identities = self._load_identities(old_repository_paths)
+
+        new_identities: Dict[str, Set[str]] = {}
+        new_dependencies: Dict[str, Set[str]] = {}
+        self._provides: Dict[str, Set[str]] = {}
+        for repository_id, repository_url in new_repository_paths.items():
+            for package in read_primary_packages(repository_id, repository_url):
+                name = package["name"]
+                new_identities.setdefault(name, set()).add(package["identity"])
+                new_dependencies.setdefault(name, set()).update(package["dependencies"])
+                self._provides.setdefault(name, {name}).update(package["provides"])
+
+        self._changed_packages: Set[str] = {
+            name for name in old_identities.keys() | new_identities.keys()
+            if old_identities.get(name) != new_identities.get(name)
+        }
+
+        self._changed_dependents: Dict[str, Set[str]] = {}
+        for name in self._changed_packages:
+            for capability in new_dependencies.get(name, ()):
+                self._changed_dependents.setdefault(capability, set()).add(name)
+
+        logging.debug(
+            f"✅ {len(self._changed_packages)} of {len(old_identities.keys() | new_identities.keys())} "
+            f"package names changed between the composes"
+        )
+
+    @staticmethod
+    def _load_identities(repository_paths: Dict[str, str]) -> Dict[str, Set[str]]:
+        """
+        Load the identities of the packages of a compose.
+
+        Args:
+            repository_paths: Dictionary mapping repository IDs to URLs
+
+        Returns:
+            Dictionary mapping each package name to the identities (NEVRA and checksum) of its packages
+        """
+        identities: Dict[str, Set[str]] = {}
+        for repository_id, repository_url in repository_paths.items():
+            for package in read_primary_packages(repository_id, repository_url):
+                identities.setdefault(package["name"], set()).add(package["identity"])
+        return identities
+
+    def is_changed(self, package_name: str) -> bool:
+        """
+        Check if a package was added, removed or rebuilt between the composes.
+
+        Args:
+            package_name: The package name
+
+        Returns:
+            True if the package changed, False otherwise
+        """
+        return package_name in self._changed_packages
+
+    def changed_dependents(self, package_name: str) -> Set[str]:
+        """
+        Find the changed packages that depend on a package in the new compose.
+
+        Args:
+            package_name: The package (or capability) to find changed dependents for
+
+        Returns:
+            The names of the changed packages depending on it
+        """
+        dependents: Set[str] = set()
+        for capability in self._provides.get(package_name, {package_name}):
+            dependents.update(self._changed_dependents.get(capability, ()))
+        return dependents
+
+
+class IncrementalQueryEngine(QueryEngine):
+    """
+    Answers queries about a compose from the answers already found for an older compose.
+
+    Only packages that changed between the composes are queried in the new compose.
+    The dependents of an unchanged package are its dependents in the old compose that
+    are unchanged too, plus the changed packages that depend on it now. Packages the
+    old compose wasn't queried for are queried in the new compose as well.
+    """
+
+    call_types = {
+        "whatdepends": "incremental --whatdepends",
+    }
+
+    def __init__(
+            self,
+            query_engine: QueryEngine,
+            old_dependency_cache: DependencyCache,
+            changes: ComposeChanges,
+            verbose: bool = False
+        ):
+        super().__init__({}, query_engine.metrics, verbose)
+        self._query_engine = query_engine
+        self._old_dependency_cache = old_dependency_cache
+        self._changes = changes
+
+    def _is_derivable(self, package_name: str) -> bool:
+        """
+        Check if the dependents of a package can be worked out without querying the new compose.
+
+        Args:
+            package_name: The package name
+
+        Returns:
+            True if the package is unchanged and its dependents in the old compose are known
+        """
+        return not self._changes.is_changed(package_name) and self._old_dependency_cache.has_all(package_name)
+
+    def whatdepends(self, package_name: str) -> Iterable[str]:
+        if not self._is_derivable(package_name):
+            return self._query_engine.whatdepends(package_name)
+
+        with self._metrics.time_call(self.call_types["whatdepends"], package_name):
+            dependents = {
+                dependent for dependent in self._old_dependency_cache.get(package_name)
+                if not self._changes.is_changed(dependent)
+            }
+            dependents.update(self._changes.changed_dependents(package_name))
+            return sorted(dependents)
+
+    def source_rpm(self, package_name: str) -> str:
+        return self._query_engine.source_rpm(package_name)
+
+    def source_rpms(self, package_names: List[str]) -> Dict[str, str]:
+        return self._query_engine.source_rpms(package_names)
+
+    def source_rpm_map(self) -> Dict[str, str]:
+        return self._query_engine.source_rpm_map()
+
+    def dependents_map(self) -> Dict[str, List[str]]:
+        return self._query_engine.dependents_map()
+
+    def description(self, package_name: str) -> str:
+        return self._query_engine.description(package_name)
+
+    def descriptions(self, package_names: List[str]) -> Dict[str, str]:
+        return self._query_engine.descriptions(package_names)
+
+    def prefetch_whatdepends(self, package_names: List[str], prefetch_source_rpms: bool = False) -> None:
+        self._query_engine.prefetch_whatdepends(
+            [package_name for package_name in package_names if not self._is_derivable(package_name)],
+            prefetch_source_rpms
+        )
+
+    def prefetch_source_rpms(self, package_names: List[str]) -> None:
+        self._query_engine.prefetch_source_rpms(package_names)
+
+
+def create_query_engine(
+        engine_name: str,
+        repository_paths: Dict[str, str],
+        metrics: RepoQueryMetrics,
+        verbose: bool = False,
+        jobs: int = 1
+    ) -> QueryEngine:
+    """
+    Create the query engine selected on the command line.
+
+    Args:
+        engine_name: One of QUERY_ENGINES
+        repository_paths: Dictionary mapping repository IDs to URLs
+        metrics: Metrics object to track repository queries
+        verbose: Whether to enable verbose logging
+        jobs: Number of worker processes to spread queries across
+
+    Returns:
+        The query engine
+
+    Raises:
+        RepoQueryError: If the engine fails to load the repositories
+    """
+    logging.debug(f"🔄 Setting up {engine_name} query engine")
+
+    # With workers, the worker pool logs the calls as it hands them out
+    engine_metrics = metrics if jobs == 1 else RepoQueryMetrics(metrics.tracing)
+
+    if engine_name == "repodata":
+        query_engine = RepodataQueryEngine(repository_paths, engine_metrics, verbose)
+    elif engine_name == "libsolv":
+        query_engine = LibsolvQueryEngine(repository_paths, engine_metrics, verbose)
+    else:
+        query_engine = DnfQueryEngine(repository_paths, engine_metrics, verbose)
+
+    if jobs > 1:
+        # dnf queries already run in processes of their own, so threads are enough to run them concurrently
+        use_threads = isinstance(query_engine, DnfQueryEngine)
+        logging.debug(f"🔄 Starting {jobs} query {'threads' if use_threads else 'workers'}")
+        query_engine = WorkerPoolQueryEngine(query_engine, repository_paths, metrics, jobs, verbose, use_threads)
+
+    return query_engine
+
+
+def generate_direct_dependents(
+        package_name: str,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        dependency_cache: DependencyCache,
+        verbose: bool = False,
+        cache_only: bool = False,
+        max_results: int | None = None
+    ) -> Generator[str, None, None]:
+    """
+    Generator that yields direct dependents one at a time.
+
+    Args:
+        package_name: The package to find direct dependents for
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        dependency_cache: Cache object to store dependency results
+        verbose: Whether to enable verbose logging
+        cache_only: If True, only return cached results and never make repoquery calls
+        max_results: Maximum number of dependents to yield (None for unlimited)
+
+    Yields:
+        Package names that directly depend on the given package
+
+    Raises:
+        RepoQueryError: If the dnf repoquery call fails
+    """
+    logging.debug(f"\n🔍 Finding direct dependents for package: {package_name}")
+
+    start_time = time.perf_counter()
+    if (not cache_only and dependency_cache.has_all(package_name)) or (cache_only and dependency_cache.has(package_name)):
+        cached_dependents = dependency_cache.get(package_name)
+        metrics.record_span("dependency cache hit", package_name, start_time, time.perf_counter() - start_time, trace=False)
+        logging.debug(f"📋 Dependency cache hit: Dependents for {package_name} → {len(cached_dependents)} dependents")
+        count = 0
+        for dependent_name in cached_dependents:
+            if max_results is not None and count >= max_results:
+                break
+            yield dependent_name
+            count += 1
+        return
+
+    metrics.record_span("dependency cache miss", package_name, start_time, time.perf_counter() - start_time, trace=False)
+
+    if cache_only:
+        logging.debug(f"📋 CACHE ONLY MODE: No sufficient cached dependents for {package_name}, skipping repoquery call")
+        return
+
+    dependent_names = query_engine.whatdepends(package_name)
+
+    seen: Set[str] = set()
+    dependents_found = 0
+    dependents_list: List[str] = []
+    is_partial = False
+    count = 0
+
+    try:
+        for line in dependent_names:
+            if max_results is not None and count > max_results:
+                is_partial = True
+                break
+
+            dependent_name = line.strip()
+            if dependent_name and dependent_name not in seen:
+                seen.add(dependent_name)
+                dependents_found += 1
+                dependents_list.append(dependent_name)
+                logging.debug(f"\n   Found dependent: {dependent_name}")
+
+                if max_results is None or count <= max_results:
+                    # Keep the partial results cached as they come in, in case we don't get to read them all
+                    if dependents_found == 1:
+                        dependency_cache.set(package_name, dependents_list, partial=True)
+                    else:
+                        dependency_cache.add_dependent(package_name, dependent_name)
+                    yield dependent_name
+                    count += 1
+    finally:
+        # Stop the query if it's still running, whether we've read enough or our caller has
+        if hasattr(dependent_names, "close"):
+            dependent_names.close()
+
+    dependency_cache.set(package_name, dependents_list, is_partial)
+    logging.debug(f"\n   Total direct dependents found for {package_name}: {len(dependents_list)} ({'partial' if is_partial else 'complete'})")
+
+
+def query_source_package(
+        package_name: str,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        verbose: bool = False,
+        allow_missing: bool = False
+    ) -> str:
+    """
+    Query the source package name for a given binary package.
+
+    Args:
+        package_name: The binary package name to find the source package for
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        verbose: Whether to enable verbose logging
+        allow_missing: Whether to allow missing packages to be non-fatal
+
+    Returns:
+        The source package name, or empty string if package not found and allow_missing is True
+
+    Raises:
+        RepoQueryError: If the query fails or returns invalid data
+        PackageNotFoundError: If the package is not found and allow_missing is False
+    """
+    start_time = time.perf_counter()
+    cached_source_package = source_cache.get(package_name)
+    cache_result = "miss" if cached_source_package is None else "hit"
+    metrics.record_span(f"source cache {cache_result}", package_name, start_time, time.perf_counter() - start_time, trace=False)
+
+    if cached_source_package == '':
+        logging.debug(f"\n📋 Source cache hit: Package {package_name} → not found")
+        if allow_missing:
+            return ''
+        raise PackageNotFoundError(package_name)
+
+    if cached_source_package:
+        logging.debug(f"\n📋 Source cache hit: Source package for {package_name} → {cached_source_package}")
+        return cached_source_package
+
+    logging.debug(f"\n🔍 Querying source package for binary package: {package_name}")
+
+    source_rpm = query_engine.source_rpm(package_name)
+    if not source_rpm:
+        source_cache.set(package_name, '')
+        if allow_missing:
+            logging.debug(f"   Package {package_name} not found, but continuing due to --allow-missing")
+            return ''
+        raise PackageNotFoundError(package_name)
+
+    source_package_name = parse_source_package_name(package_name, source_rpm)
+    logging.debug(f"\n   Source package for {package_name}: {source_package_name}")
+
+    source_cache.set(package_name, source_package_name)
+
+    return source_package_name
+
+
+def parse_source_package_name(package_name: str, source_rpm: str) -> str:
+    """
+    Extract the source package name from a source RPM file name.
+
+    Args:
+        package_name: The binary package the source RPM belongs to (for error messages)
+        source_rpm: The source RPM file name (e.g. 'bash-5.2.26-4.el10.src.rpm')
+
+    Returns:
+        The source package name
+
+    Raises:
+        RepoQueryError: If the source RPM file name has an unexpected format
+    """
+    m = re.match(r'^(?P<name>.*)-[^-]+-[^-]+\.src\.rpm$', source_rpm)
+    if not m:
+        raise RepoQueryError(
+            f"Unexpected source-RPM format for {package_name!r}: {source_rpm!r}"
+        )
+
+    return m.group("name")
+
+
+def query_source_packages(
+        package_names: Iterable[str],
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        verbose: bool = False
+    ) -> None:
+    """
+    Resolve the source packages of many binary packages in batches and cache them.
+
+    Packages that are already cached are skipped. Packages that aren't found are
+    cached as not found, so query_source_package applies the usual allow_missing
+    handling when they're looked up.
+
+    Args:
+        package_names: The binary package names
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        verbose: Whether to enable verbose logging
+
+    Raises:
+        RepoQueryError: If a query fails or returns invalid data
+    """
+    uncached_package_names = [
+        package_name for package_name in dict.fromkeys(package_names)
+        if package_name and not source_cache.has(package_name)
+    ]
+    if not uncached_package_names:
+        return
+
+    logging.debug(f"\n🔍 Querying source packages for {len(uncached_package_names)} binary packages")
+
+    for start in range(0, len(uncached_package_names), SOURCE_QUERY_BATCH_SIZE):
+        batch = uncached_package_names[start:start + SOURCE_QUERY_BATCH_SIZE]
+        source_rpms = query_engine.source_rpms(batch)
+        for package_name in batch:
+            source_rpm = source_rpms.get(package_name, "").strip()
+            if not source_rpm:
+                source_cache.set(package_name, '')
+                continue
+
+            source_cache.set(package_name, parse_source_package_name(package_name, source_rpm))
+
+
+def preload_source_packages(
+        query_engine: QueryEngine,
+        source_cache: SourcePackageCache
+    ) -> None:
+    """
+    Fill the source package cache with the source packages of every package in the repositories.
+
+    Afterwards source package lookups never query the repositories: packages that
+    aren't in the map are treated as not found.
+
+    Args:
+        query_engine: Query engine to answer repository queries
+        source_cache: Cache object to store source package mappings
+
+    Raises:
+        RepoQueryError: If the query fails
+    """
+    logging.debug("🔄 Preloading source packages of all packages...")
+
+    source_packages: Dict[str, str] = {}
+    for package_name, source_rpm in query_engine.source_rpm_map().items():
+        source_package_names: Set[str] = set()
+        for line in source_rpm.splitlines():
+            try:
+                source_package_names.add(parse_source_package_name(package_name, line.strip()))
+            except RepoQueryError as error:
+                logging.debug(f"   Skipping {package_name}: {error}")
+
+        if not source_package_names:
+            continue
+
+        # Several builds of a package normally come from the same source package
+        if len(source_package_names) > 1:
+            logging.debug(f"   Package {package_name} has several source packages: {', '.join(sorted(source_package_names))}")
+        source_packages[package_name] = min(source_package_names)
+
+    source_cache.preload(source_packages)
+
+
+def query_package_description(
+        package_name: str,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        description_cache: DescriptionCache,
+        verbose: bool = False
+    ) -> str:
+    """
+    Query the description for a given package.
+
+    Args:
+        package_name: The package name to find the description for
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        description_cache: Cache object to store package descriptions
+        verbose: Whether to enable verbose logging
+
+    Returns:
+        The package description with newlines removed
+
+    Raises:
+        RepoQueryError: If the query fails or returns invalid data
+    """
+    start_time = time.perf_counter()
+    cached_description = description_cache.get(package_name)
+    cache_result = "miss" if cached_description is None else "hit"
+    metrics.record_span(f"description cache {cache_result}", package_name, start_time, time.perf_counter() - start_time, trace=False)
+
+    if cached_description is not None:
+        logging.debug(f"\n📋 Description cache hit: {package_name}")
+        return cached_description
+
+    logging.debug(f"\n🔍 Querying description for package: {package_name}")
+
+    description = query_engine.description(package_name)
+    if description:
+        description = " ".join(description.splitlines())
+
+    logging.debug(f"\n   Description for {package_name}: {description}")
+
+    description_cache.set(package_name, description)
+
+    return description
+
+
+def query_package_descriptions(
+        package_names: Iterable[str],
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        description_cache: DescriptionCache,
+        verbose: bool = False
+    ) -> None:
+    """
+    Fetch the descriptions of many packages in batches and cache them.
+
+    Packages that are already cached are skipped.
+
+    Args:
+        package_names: The package names
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        description_cache: Cache object to store package descriptions
+        verbose: Whether to enable verbose logging
+
+    Raises:
+        RepoQueryError: If a query fails
+    """
+    uncached_package_names = [
+        package_name for package_name in dict.fromkeys(package_names)
+        if not description_cache.has(package_name)
+    ]
+    if not uncached_package_names:
+        return
+
+    logging.debug(f"\n🔍 Querying descriptions for {len(uncached_package_names)} packages")
+
+    for start in range(0, len(uncached_package_names), DESCRIPTION_QUERY_BATCH_SIZE):
+        batch = uncached_package_names[start:start + DESCRIPTION_QUERY_BATCH_SIZE]
+        descriptions = query_engine.descriptions(batch)
+        for package_name in batch:
+            description = descriptions.get(package_name, "")
+            description_cache.set(package_name, " ".join(description.splitlines()))
+
+
+def stream_in_background(items: Iterable[Any], buffer_size: int) -> Generator[Any, None, None]:
+    """
+    Generator that iterates over items in a background thread.
+
+    Items are handed over through a bounded queue, so the producer runs ahead of
+    the consumer by at most buffer_size items. Exceptions raised by the producer are
+    re-raised in the consumer. If the consumer stops early, the producer is stopped
+    (and closed, if it's a generator) as well.
+
+    Args:
+        items: The items to iterate over
+        buffer_size: Maximum number of items waiting to be consumed
+
+    Yields:
+        The items, in order
+    """
+    handoff: queue.Queue = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    finished = object()
+
+    def hand_over(entry: Any) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not hand_over((item, None)):
+                    return
+            hand_over((finished, None))
+        except BaseException as error:
+            hand_over((None, error))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = handoff.get()
+            if error is not None:
+                raise error
+            if item is finished:
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def run_pipeline_stage(
+        items: Iterable[Any],
+        function: Callable[[Any], Any],
+        jobs: int,
+        stage_name: str
+    ) -> Generator[tuple, None, None]:
+    """
+    Generator that applies a function to a stream of items with bounded concurrency.
+
+    Up to jobs calls run at once, in a pool of threads. New items are only pulled
+    from the input when a slot frees up, which is what applies back-pressure on
+    the stages before this one. Results come out in input order, so the output is
+    the same as calling the function on each item in turn. Exceptions are raised
+    when the result of the failing item is reached.
+
+    Args:
+        items: The items to process
+        function: The function to apply to each item
+        jobs: Maximum number of concurrent calls (1 runs everything inline)
+        stage_name: Name of the stage, used for the worker threads
+
+    Yields:
+        (item, result) tuples, in input order
+    """
+    if jobs <= 1:
+        for item in items:
+            yield item, function(item)
+        return
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix=stage_name)
+    pending: deque = deque()
+    try:
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= jobs:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def convert_to_source_packages(
+        dependents: Generator[str, None, None],
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        max_results: int | None = None,
+        verbose: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        source_jobs: int = 1,
+        filter_jobs: int = 1
+    ) -> Generator[str, None, None]:
+    """
+    Generator that converts a stream of binary package names into source package names.
+
+    The conversion runs as a pipeline: source package lookups and filter commands
+    each run with their own concurrency limit, and work on the next packages while
+    earlier results are being consumed. Results come out in the same order either way.
+
+    Args:
+        dependents: Generator yielding binary package names
+        query_engine: Query engine to answer repository queries
+        max_results: Maximum number of unique source packages to yield (None for unlimited)
+        package_filter: Optional filter to run on each source package
+        allow_missing: Whether to allow missing packages to be non-fatal
+        source_jobs: Maximum number of concurrent source package lookups
+        filter_jobs: Maximum number of concurrent filter commands
+
+    Yields:
+        Source package names (unique, up to max_results if specified)
+
+    Raises:
+        RepoQueryError: If any source package query fails
+    """
+    logging.debug("🔄 Converting binary packages to source packages")
+
+    def look_up_source_package(package: str) -> str:
+        logging.debug(f"   Converting binary package: {package}")
+        return query_source_package(
+            package, query_engine, metrics, source_cache, verbose, allow_missing
+        )
+
+    source_packages: Set[str] = set()
+
+    def generate_new_source_packages() -> Generator[str, None, None]:
+        for package, source_package in run_pipeline_stage(dependents, look_up_source_package, source_jobs, "source-lookup"):
+            if not source_package:
+                logging.debug(f"   Skipping binary package {package} (no source package found)")
+                continue
+
+            if source_package in source_packages:
+                logging.debug(f"   Source package already seen: {source_package}")
+                continue
+
+            source_packages.add(source_package)
+            yield source_package
+
+    def passes_filter(source_package: str) -> bool:
+        if not package_filter:
+            return True
+        return run_filter_command(source_package, package_filter, metrics, filter_cache, verbose)
+
+    filtered_source_packages = run_pipeline_stage(generate_new_source_packages(), passes_filter, filter_jobs, "filter")
+    converted_count = 0
+    try:
+        # Check the limit before pulling the next package, so no lookups are made past it
+        while max_results is None or converted_count < max_results:
+            next_result = next(filtered_source_packages, None)
+            if next_result is None:
+                break
+
+            source_package, passed_filter = next_result
+            if not passed_filter:
+                logging.debug(f"   Skipping source package {source_package} due to filter command")
+                continue
+
+            converted_count += 1
+            logging.debug(f"   New source package found: {source_package}")
+            yield source_package
+        else:
+            logging.debug(f"Reached max_results={max_results}, stopping conversion")
+    finally:
+        filtered_source_packages.close()
+
+    logging.debug(f"   Total unique source packages converted: {converted_count}")
+
+
+def compute_transitive_closure(
+        root_package: int,
+        dependents_map: Dict[int, DependentsRecord],
+        package_ids: PackageIds,
+        max_results: int | None = None,
+        filter_function = None,
+    ) -> TransitiveClosure:
+    """
+    Compute the transitive closure of the dependency graph.
+
+    For each package, finds all packages that can be reached from it through the dependency
+    graph (in breadth-first order) and a partial flag indicating whether the results are
+    incomplete due to max_results being reached.
+    If filter_function is provided, it should take a package ID and the array of current dependents
+    and return True if the package should be included, False if it should be filtered out.
+    Filtered packages are excluded from the graph but still traversed to find their dependents.
+
+    The graph is first collapsed into strongly connected components, and which packages each
+    component reaches (and whether any of them is partial) is worked out once per component,
+    from the components of its dependents. Each package's breadth-first walk then stops as
+    soon as it has seen every package it can reach.
+
+    Args:
+        root_package: root package ID to check for partial results
+        dependents_map: Dictionary mapping package IDs to their dependent packages
+        package_ids: Table of the package IDs
+        max_results: Maximum number of results to return (including the root package)
+        filter_function: Optional function that takes a package ID and dependents array and returns True/False
+
+    Returns:
+        The transitive dependents and partial flag of each package
+    """
+    graph = TransitiveClosure(package_ids)
+
+    # The root package gets all results but itself as dependents
+    max_root_dependents = max_results - 1 if max_results is not None else None
+
+    components = find_strongly_connected_components(dependents_map)
+    component_indexes = {package: index for index, component in enumerate(components) for package in component}
+    package_bits = {package: 1 << position for position, package in enumerate(component_indexes)}
+
+    # Packages reachable from each component as a bitset, and whether any of them is partial,
+    # worked out from the components of the dependents, which come later in topological order
+    component_members = [0] * len(components)
+    component_has_partial_members = [False] * len(components)
+    reachable_packages = [0] * len(components)
+    reaches_partial_packages = [False] * len(components)
+    for index in reversed(range(len(components))):
+        component = components[index]
+        for member in component:
+            component_members[index] |= package_bits[member]
+            if member in dependents_map and dependents_map[member].partial:
+                component_has_partial_members[index] = True
+
+        # Packages in a cycle reach each other, and themselves
+        first_member = component[0]
+        if len(component) > 1 or (first_member in dependents_map and first_member in dependents_map[first_member].dependents):
+            reachable_packages[index] = component_members[index]
+            reaches_partial_packages[index] = component_has_partial_members[index]
+
+        for member in component:
+            if member not in dependents_map:
+                continue
+            for dependent in dependents_map[member].dependents:
+                dependent_index = component_indexes[dependent]
+                if dependent_index == index:
+                    continue
+                reachable_packages[index] |= component_members[dependent_index] | reachable_packages[dependent_index]
+                if component_has_partial_members[dependent_index] or reaches_partial_packages[dependent_index]:
+                    reaches_partial_packages[index] = True
+
+    for package, entry in dependents_map.items():
+        if max_results and len(graph) >= max_results:
+            break
+
+        component_index = component_indexes[package]
+        transitive_dependents, is_partial = collect_transitive_dependents(
+            package,
+            dependents_map,
+            entry.partial or reaches_partial_packages[component_index],
+            filter_function,
+            max_root_dependents if package == root_package else None,
+            reachable_packages[component_index].bit_count()
+        )
+        graph.add(package, transitive_dependents, is_partial)
+
+    return graph
+
+
+def collect_transitive_dependents(
+        package: int,
+        dependents_map: Dict[int, DependentsRecord],
+        is_partial: bool,
+        filter_function = None,
+        max_dependents: int | None = None,
+        reachable_count: int | None = None
+    ) -> Tuple[array, bool]:
+    """
+    Collect the packages that can be reached from a package, in breadth-first order.
+
+    Args:
+        package: The package ID
+        dependents_map: Dictionary mapping package IDs to their dependent packages
+        is_partial: Whether the dependents are partial, unless they get cut short at max_dependents
+        filter_function: Optional function that takes a package ID and dependents array and returns True/False
+        max_dependents: Maximum number of dependents to collect (for the root package)
+        reachable_count: Number of packages reachable from the package, if known, so the walk can
+            stop as soon as it has seen them all
+
+    Returns:
+        The transitive dependents, and whether they are partial
+    """
+    known_packages: Set[int] = set()
+    transitive_dependents = array("i")
+    queue = deque(dependents_map[package].dependents)
+    unseen_count = reachable_count if reachable_count is not None else float("inf")
+
+    # We stop reading from the queue once the root package has all the results the user asked for
+    # (But we still need to extend the queue for the remaining of the loop to know if we're missing out
+    # on any results because of the max_results limit)
+    limit_dependents = max_dependents is not None
+    hit_max_dependents = False
+
+    while queue and (unseen_count or limit_dependents):
+        dependent = queue.popleft()
+
+        if dependent in known_packages:
+            continue
+
+        # If the root package has hit its dependent limit, we don't add this dependent to the results,
+        # but we still need to use the dependent to extend the queue so we can know if we're missing out
+        # on any results because of the max_results limit
+        if limit_dependents and len(transitive_dependents) >= max_dependents:
+            hit_max_dependents = True
+
+        if not hit_max_dependents:
+            # Mark this package as seen to prevent future cycles
+            known_packages.add(dependent)
+            unseen_count -= 1
+
+            # Apply optional filtering function
+            if filter_function is None or filter_function(dependent, transitive_dependents):
+                transitive_dependents.append(dependent)
+
+        if dependent in dependents_map:
+            queue.extend(dependents_map[dependent].dependents)
+
+        if hit_max_dependents:
+            # At this point the queue accurately reflects what work is left to do
+            # so we can use it to know if the results are complete for the root package
+            is_partial = bool(queue)
+            break
+
+    return transitive_dependents, is_partial
+
+
+def generate_dependents(
+        package_name: str,
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        max_results: int | None = None,
+        verbose: bool = False,
+        keep_cycles: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        source_jobs: int = 1,
+        filter_jobs: int = 1
+    ) -> Generator[str, None, None]:
+    """
+    Generator that yields the dependents of a given package as they are found.
+
+    If source_jobs or filter_jobs is more than 1, the whatdepends query, the source
+    package lookups and the filter commands run as overlapping pipeline stages.
+
+    Args:
+        package_name: The package to find dependents for
+        query_engine: Query engine to answer repository queries
+        show_source_packages: Whether to convert to source package names
+        max_results: Maximum number of results to return
+        package_filter: Optional filter to run on each dependent package
+        allow_missing: Whether to allow missing packages to be non-fatal
+        source_jobs: Maximum number of concurrent source package lookups
+        filter_jobs: Maximum number of concurrent filter commands
+
+    Yields:
+        Dependent package names (binary or source depending on show_source_packages)
+    """
+    logging.debug(f"🔄 Building dependents list for: {package_name}")
+    logging.debug(f"   Show source packages: {show_source_packages}")
+    logging.debug(f"   Max results: {max_results}")
+    logging.debug(f"   Filter command: {package_filter}")
+
+    # Without a result limit every dependent gets looked up, so resolve them all to
+    # source packages in batches up front instead of one query per dependent
+    batch_source_packages = show_source_packages and max_results is None
+
+    query_engine.prefetch_whatdepends([package_name], prefetch_source_rpms=show_source_packages and not batch_source_packages)
+    dependents = generate_direct_dependents(package_name, query_engine, metrics, dependency_cache, verbose, cache_only=False)
+
+    if batch_source_packages:
+        dependents = list(dependents)
+        query_source_packages(dependents, query_engine, metrics, source_cache, verbose)
+
+    if source_jobs > 1 or filter_jobs > 1:
+        dependents = stream_in_background(dependents, PIPELINE_BUFFER_SIZE)
+
+    if show_source_packages:
+        dependents = convert_to_source_packages(
+            dependents, query_engine, metrics, source_cache, filter_cache,
+            max_results, verbose, package_filter, allow_missing,
+            source_jobs, filter_jobs
+        )
+    elif package_filter and filter_jobs > 1:
+        def prefilter(dependent_package: str) -> None:
+            if keep_cycles or package_name != dependent_package:
+                run_filter_command(dependent_package, package_filter, metrics, filter_cache, verbose)
+
+        # Run the filter command on upcoming dependents concurrently,
+        # the loop below picks the results up from the filter cache
+        dependents = (dependent_package for dependent_package, _ in run_pipeline_stage(dependents, prefilter, filter_jobs, "filter"))
+
+    discovered_count = 0
+    is_partial = False
+    for dependent_package in dependents:
+        if max_results is not None and discovered_count >= max_results:
+            is_partial = True
+            break
+
+        if not keep_cycles and package_name == dependent_package:
+            continue
+
+        if package_filter:
+            if not run_filter_command(dependent_package, package_filter, metrics, filter_cache, verbose):
+                logging.debug(f"   Skipping dependent package {dependent_package} due to filter command")
+                continue
+
+        discovered_count += 1
+        if max_results is None or discovered_count <= max_results:
+            yield dependent_package
+
+    logging.debug(f"   Total dependents collected: {discovered_count} ({'partial' if is_partial else 'complete'})")
+
+
+def build_dependents_list(
+        package_name: str,
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        max_results: int | None = None,
+        verbose: bool = False,
+        keep_cycles: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        source_jobs: int = 1,
+        filter_jobs: int = 1
+    ) -> List[str]:
+    """
+    Build a list of dependents for a given package (see generate_dependents).
+
+    Returns:
+        List of dependent package names (binary or source depending on show_source_packages)
+
+    Raises:
+        NoDependentsFoundError: If the package has no dependents
+    """
+    collected_packages = list(generate_dependents(
+        package_name, query_engine, show_source_packages, source_cache, metrics, filter_cache, dependency_cache,
+        max_results, verbose, keep_cycles, package_filter, allow_missing, source_jobs, filter_jobs
+    ))
+
+    if len(collected_packages) == 0:
+        raise NoDependentsFoundError(package_name)
+
+    return collected_packages
+
+
+def build_dependents_graph(
+        root_package: str,
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        max_results: int | None = None,
+        keep_cycles: bool = False,
+        verbose: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        filter_jobs: int = 1
+    ) -> TransitiveClosure:
+    """
+    Build a transitive graph of reverse dependencies for the given package.
+
+    Stops collecting dependents of the root package once max_results is reached.
+    From that point we fill in as much as we can of the graph without doing more
+    repoquery calls.
+
+    Returns:
+        The transitive dependents and partial flag of each package of the graph
+    """
+    logging.debug(f"🔄 Building dependents graph for: {root_package}")
+    logging.debug(f"   Show source packages: {show_source_packages}")
+    logging.debug(f"   Max results: {max_results}")
+    logging.debug(f"   Filter command: {package_filter}")
+
+    dependents_map = walk_dependents_graph(
+        [root_package], query_engine, show_source_packages, source_cache, metrics, filter_cache, dependency_cache,
+        max_results, keep_cycles, verbose, package_filter, allow_missing, filter_jobs
+    )
+
+    # We add 1 to max_results to make room for the root package
+    if max_results is not None:
+        max_results += 1
+
+    package_ids = dependency_cache.package_ids
+    filter_function = create_closure_filter_function(package_ids, filter_cache, max_results, package_filter)
+
+    root_package_id = package_ids.intern(root_package)
+    dependents_graph = compute_transitive_closure(root_package_id, dependents_map, package_ids, max_results, filter_function)
+
+    if root_package_id not in dependents_graph:
+        raise NoDependentsFoundError(root_package)
+
+    metrics.log_closure_sizes(dependents_graph.dependents_counts())
+
+    return dependents_graph
+
+
+def create_closure_filter_function(
+        package_ids: PackageIds,
+        filter_cache: FilterCache,
+        max_results: int | None = None,
+        package_filter: PackageFilter | None = None
+    ) -> Callable[[int, array], bool]:
+    """
+    Create the filter function for compute_transitive_closure, from the filter results of the walk.
+
+    Args:
+        package_ids: Table of the package IDs
+        filter_cache: Cache object holding the filter results
+        max_results: Maximum number of packages in the graph, which also limits the dependents of each package
+        package_filter: The filter used in the walk, if any
+
+    Returns:
+        Function that takes a package ID and dependents array and returns whether to add the package
+    """
+    def filter_function(package_id: int, dependents_list: array) -> bool:
+        if max_results is not None and len(dependents_list) >= max_results:
+            return False
+
+        if not package_filter:
+            return True
+
+        return filter_cache.get(package_ids.name(package_id)) is not False
+
+    return filter_function
+
+
+def stream_dependents_graph(
+        root_package: str,
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        write_packages: Callable[[List[Tuple[int, array, bool]]], None],
+        max_results: int | None = None,
+        keep_cycles: bool = False,
+        verbose: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        filter_jobs: int = 1
+    ) -> Dict[int, bool]:
+    """
+    Build the same graph as build_dependents_graph, handing packages over while the graph is walked.
+
+    After each level of the walk, the packages that can't reach any package still to
+    be walked have their final transitive dependents, and are handed over to
+    write_packages. Their partial flags can still change when the walk finishes, so
+    the packages whose flag changed after they were handed over are returned.
+
+    Returns:
+        Dictionary mapping the IDs of the packages whose partial flag changed to their final flag
+
+    Raises:
+        NoDependentsFoundError: If the root package isn't in the graph
+    """
+    logging.debug(f"🔄 Streaming dependents graph for: {root_package}")
+    logging.debug(f"   Show source packages: {show_source_packages}")
+    logging.debug(f"   Max results: {max_results}")
+    logging.debug(f"   Filter command: {package_filter}")
+
+    package_ids = dependency_cache.package_ids
+    root_package_id = package_ids.intern(root_package)
+
+    # Like compute_transitive_closure, the graph has room for max_results packages besides the root
+    graph_size = max_results + 1 if max_results is not None else None
+    filter_function = create_closure_filter_function(package_ids, filter_cache, graph_size, package_filter)
+
+    handed_over_partial_flags: Dict[int, bool] = {}
+    tracker = FinishedPackageTracker()
+
+    def hand_over_finished_packages(dependents_map: Dict[int, DependentsRecord], queue: Iterable[int]) -> None:
+        finished_packages: List[Tuple[int, array, bool]] = []
+        for package in tracker.add_level(dependents_map, queue):
+            # Like compute_transitive_closure, the graph only has the first graph_size packages walked
+            if graph_size is not None and tracker.walk_position(package) >= graph_size:
+                continue
+
+            transitive_dependents, is_partial = collect_transitive_dependents(
+                package,
+                dependents_map,
+                tracker.dependents_partial(package),
+                filter_function,
+                max_results if package == root_package_id else None,
+                tracker.reachable_count(package)
+            )
+            handed_over_partial_flags[package] = is_partial
+            finished_packages.append((package, transitive_dependents, is_partial))
+
+        if finished_packages:
+            logging.debug(f"   Handing over {len(finished_packages)} finished packages")
+            metrics.log_closure_sizes(len(transitive_dependents) for _, transitive_dependents, _ in finished_packages)
+            write_packages(finished_packages)
+
+    dependents_map = walk_dependents_graph(
+        [root_package], query_engine, show_source_packages, source_cache, metrics, filter_cache, dependency_cache,
+        max_results, keep_cycles, verbose, package_filter, allow_missing, filter_jobs,
+        on_level_walked=hand_over_finished_packages
+    )
+
+    if root_package_id not in dependents_map:
+        raise NoDependentsFoundError(root_package)
+
+    # The walk only settles the partial flags at the very end
+    partial_packages = find_packages_reaching(
+        [package for package, entry in dependents_map.items() if entry.partial], dependents_map
+    )
+    changed_partial_flags: Dict[int, bool] = {}
+    for package, handed_over_partial in handed_over_partial_flags.items():
+        if package == root_package_id and max_results is not None:
+            # The root package's flag may come from where its dependents got cut short instead
+            _, is_partial = collect_transitive_dependents(
+                package, dependents_map, package in partial_packages, filter_function, max_results
+            )
+        else:
+            is_partial = package in partial_packages
+        if is_partial != handed_over_partial:
+            changed_partial_flags[package] = is_partial
+
+    return changed_partial_flags
+
+
+def find_packages_reaching(target_packages: Iterable[int], dependents_map: Dict[int, DependentsRecord]) -> Set[int]:
+    """
+    Find the packages of a dependents graph that can reach any of the target packages.
+
+    Args:
+        target_packages: The target package IDs
+        dependents_map: Dictionary mapping package IDs to their direct dependents
+
+    Returns:
+        The IDs of the target packages and the packages that reach them
+    """
+    dependers: Dict[int, List[int]] = {}
+    for package, entry in dependents_map.items():
+        for dependent in entry.dependents:
+            dependers.setdefault(dependent, []).append(package)
+
+    reaching_packages = set(target_packages)
+    queue = deque(reaching_packages)
+    while queue:
+        package = queue.popleft()
+        for depender in dependers.get(package, ()):
+            if depender not in reaching_packages:
+                reaching_packages.add(depender)
+                queue.append(depender)
+
+    return reaching_packages
+
+
+def walk_dependents_graph(
+        root_packages: List[str],
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        max_results: int | None = None,
+        keep_cycles: bool = False,
+        verbose: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        filter_jobs: int = 1,
+        on_level_walked: Callable[[Dict[int, DependentsRecord], Iterable[int]], None] | None = None
+    ) -> Dict[int, DependentsRecord]:
+    """
+    Walk the reverse dependencies of the root packages breadth first, one level at a time.
+
+    Every package is visited once, however many roots reach it. Stops collecting
+    dependents of the root packages once max_results is reached. From that point we
+    fill in as much as we can of the graph without doing more repoquery calls.
+
+    Without keep_cycles, each package only lists the dependents it was the first to
+    reach, and filtered out dependents aren't listed (but are still walked).
+
+    If filter_jobs is more than 1, the filter command runs concurrently on the new
+    dependents of a whole level before the level is walked.
+
+    If on_level_walked is given, it's called after each level with the dependents map
+    so far and the packages of the next level.
+
+    Returns:
+        Dictionary mapping package IDs (from the dependency cache's table), in the order
+        they were visited, to their direct dependents and partial flag
+    """
+    package_ids = dependency_cache.package_ids
+    root_package_set = set(map(package_ids.intern, root_packages))
+    known_packages: Set[int] = set(root_package_set)
+    queue = deque(dict.fromkeys(map(package_ids.intern, root_packages)))
+    dependents_map: Dict[int, DependentsRecord] = {}
+    result_count = 0
+
+    result_limit_hit = False
+    while queue:
+        # The root package is the only one whose dependents may stop being read early
+        # (at max_results), so it's the only one that can't have all its dependents
+        # resolved to source packages in batches up front
+        lazy_root_package = show_source_packages and max_results is not None and queue[0] in root_package_set
+
+        # Filtering a whole level at once needs all its dependents up front
+        prefilter_level = package_filter and package_filter.should_batch(filter_jobs) and not lazy_root_package
+
+        # Hand the whole frontier to the query engine at once, so engines that can run
+        # queries concurrently get a full level of the graph to work on
+        if not result_limit_hit:
+            query_engine.prefetch_whatdepends(
+                [package_name for package_name in package_ids.names(queue) if not dependency_cache.has_all(package_name)],
+                prefetch_source_rpms=lazy_root_package
+            )
+
+        level_dependents: Dict[int, List[str]] = {}
+        if (show_source_packages or prefilter_level) and not lazy_root_package:
+            for package in queue:
+                level_dependents[package] = list(generate_direct_dependents(
+                    package_ids.name(package), query_engine, metrics, dependency_cache, verbose,
+                    cache_only=result_limit_hit, max_results=max_results
+                ))
+
+        if show_source_packages and not lazy_root_package:
+            query_source_packages(
+                (dependent for dependents in level_dependents.values() for dependent in dependents),
+                query_engine, metrics, source_cache, verbose
+            )
+
+        if prefilter_level:
+            new_dependents: List[str] = []
+            for dependents in level_dependents.values():
+                for dependent in dependents:
+                    if show_source_packages:
+                        dependent = query_source_package(dependent, query_engine, metrics, source_cache, verbose, allow_missing)
+                    if dependent and (keep_cycles or package_ids.intern(dependent) not in known_packages):
+                        new_dependents.append(dependent)
+            run_filter_commands(new_dependents, package_filter, metrics, filter_cache, filter_jobs, verbose)
+
+        for _ in range(len(queue)):
+            package = queue.popleft()
+            dependents_list = DependentsRecord()
+
+            direct_dependents = level_dependents.get(package)
+            if direct_dependents is None:
+                direct_dependents = generate_direct_dependents(
+                    package_ids.name(package), query_engine, metrics, dependency_cache, verbose,
+                    cache_only=result_limit_hit, max_results=max_results
+                )
+
+                # The dependents of a root package that may stop being read early are
+                # filtered as they come in instead, a few ahead of the loop below
+                if package_filter and filter_jobs > 1:
+                    def prefilter(dependent: str) -> None:
+                        if show_source_packages:
+                            dependent = query_source_package(dependent, query_engine, metrics, source_cache, verbose, allow_missing)
+                        if dependent:
+                            run_filter_command(dependent, package_filter, metrics, filter_cache, verbose)
+
+                    direct_dependents = (
+                        dependent for dependent, _ in run_pipeline_stage(direct_dependents, prefilter, filter_jobs, "filter")
+                    )
+
+            any_filtered_dependents = False
+            for dependent in direct_dependents:
+                if show_source_packages:
+                    dependent = query_source_package(
+                        dependent,
+                        query_engine,
+                        metrics,
+                        source_cache,
+                        verbose,
+                        allow_missing
+                    )
+
+                if not dependent:
+                    continue
+                dependent_id = package_ids.intern(dependent)
+                if not keep_cycles and dependent_id in known_packages:
+                    continue
+
+                if dependent_id not in known_packages:
+                    known_packages.add(dependent_id)
+                    queue.append(dependent_id)
+
+                dependent_is_filtered = package_filter and not run_filter_command(
+                    dependent,
+                    package_filter,
+                    metrics,
+                    filter_cache,
+                    verbose
+                )
+
+                if not dependent_is_filtered:
+                    dependents_list.dependents.append(dependent_id)
+
+                    if package in root_package_set and max_results is not None:
+                        result_count += 1
+                        if result_count >= max_results:
+                            result_limit_hit = True
+                            break
+                else:
+                    any_filtered_dependents = True
+
+            dependents_list.partial = result_limit_hit or any_filtered_dependents
+            dependents_map[package] = dependents_list
+
+        if on_level_walked is not None:
+            on_level_walked(dependents_map, queue)
+
+    for package, entry in dependents_map.items():
+        has_unknown_dependents = any(dependent not in dependents_map for dependent in entry.dependents)
+        has_partial_dependents = any(not dependency_cache.has_all(dependent) for dependent in package_ids.names(entry.dependents))
+        entry.partial = entry.partial or has_unknown_dependents or has_partial_dependents
+
+    metrics.log_graph(len(dependents_map), sum(len(entry.dependents) for entry in dependents_map.values()))
+
+    return dependents_map
+
+
+def find_strongly_connected_components(dependents_map: Dict[int, DependentsRecord]) -> List[List[int]]:
+    """
+    Find the strongly connected components (sets of packages that depend on each other) of a dependents graph.
+
+    Args:
+        dependents_map: Dictionary mapping package IDs to their direct dependents
+
+    Returns:
+        The components in topological order: a component comes before the components of its dependents
+    """
+    index: Dict[int, int] = {}
+    low_link: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    components: List[List[int]] = []
+
+    # Tarjan's algorithm, with an explicit stack of (package, remaining dependents) instead of recursion
+    for start_package in dependents_map:
+        if start_package in index:
+            continue
+
+        index[start_package] = low_link[start_package] = len(index)
+        stack.append(start_package)
+        on_stack.add(start_package)
+        work = [(start_package, iter(dependents_map[start_package].dependents))]
+
+        while work:
+            package, dependents = work[-1]
+            for dependent in dependents:
+                if dependent not in index:
+                    index[dependent] = low_link[dependent] = len(index)
+                    stack.append(dependent)
+                    on_stack.add(dependent)
+                    dependent_entry = dependents_map.get(dependent)
+                    work.append((dependent, iter(dependent_entry.dependents if dependent_entry else ())))
+                    break
+                if dependent in on_stack:
+                    low_link[package] = min(low_link[package], index[dependent])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[package])
+
+                if low_link[package] == index[package]:
+                    component: List[int] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == package:
+                            break
+                    components.append(component)
+
+    # Tarjan's algorithm finds components after all the components they lead to
+    components.reverse()
+    return components
+
+
+def compute_reaching_roots(
+        root_packages: List[int],
+        dependents_map: Dict[int, DependentsRecord],
+        keep_cycles: bool = False
+    ) -> Dict[int, List[int]]:
+    """
+    Find which root packages reach each package of a dependents graph.
+
+    The graph is collapsed into strongly connected components, and the roots are
+    propagated once through the components in topological order, as bitsets.
+
+    Args:
+        root_packages: The root package IDs
+        dependents_map: Dictionary mapping package IDs to their complete direct dependents
+            (as walked with keep_cycles)
+        keep_cycles: Whether a root that depends on itself through a cycle counts as reaching itself
+
+    Returns:
+        Dictionary mapping each package reached by at least one root (through at least one
+        dependency) to the roots that reach it, in the order of root_packages
+    """
+    root_bits = {root_package: 1 << position for position, root_package in enumerate(root_packages)}
+    incoming_roots: Dict[int, int] = {}
+    reaching_roots: Dict[int, int] = {}
+
+    for component in find_strongly_connected_components(dependents_map):
+        members = set(component)
+        roots = 0
+        for member in component:
+            roots |= incoming_roots.pop(member, 0)
+
+        # Packages in a cycle reach each other, and themselves
+        is_cycle = len(component) > 1 or any(
+            member in dependents_map and member in dependents_map[member].dependents for member in component
+        )
+        if is_cycle:
+            for member in component:
+                roots |= root_bits.get(member, 0)
+
+        for member in component:
+            if roots:
+                reaching_roots[member] = roots
+
+            outgoing_roots = roots | root_bits.get(member, 0)
+            if not outgoing_roots or member not in dependents_map:
+                continue
+            for dependent in dependents_map[member].dependents:
+                if dependent not in members:
+                    incoming_roots[dependent] = incoming_roots.get(dependent, 0) | outgoing_roots
+
+    reaching_root_lists: Dict[int, List[int]] = {}
+    for package, roots in reaching_roots.items():
+        if not keep_cycles and package in root_bits:
+            roots &= ~root_bits[package]
+        if roots:
+            reaching_root_lists[package] = [root_package for root_package in root_packages if roots & root_bits[root_package]]
+
+    return reaching_root_lists
+
+
+def build_blast_radius(
+        root_packages: List[str],
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        keep_cycles: bool = False,
+        verbose: bool = False,
+        package_filter: PackageFilter | None = None,
+        allow_missing: bool = False,
+        filter_jobs: int = 1
+    ) -> List[Dict[str, Any]]:
+    """
+    Find every package that transitively depends on any of the root packages.
+
+    The reverse dependencies of all the roots are walked together, so each package
+    is queried once and the cost grows with the size of the union, not with the
+    sum of the closures of the roots.
+
+    Returns:
+        List of dictionaries containing the 'package' and the 'roots' that reach it, in breadth-first order
+
+    Raises:
+        NoDependentsFoundError: If none of the root packages has dependents
+    """
+    logging.debug(f"🔄 Building blast radius for: {', '.join(root_packages)}")
+    logging.debug(f"   Show source packages: {show_source_packages}")
+    logging.debug(f"   Filter command: {package_filter}")
+
+    # Every dependency is needed to know all the roots that reach a package, so walk
+    # with cycles kept, and filter once the roots are known
+    dependents_map = walk_dependents_graph(
+        root_packages, query_engine, show_source_packages, source_cache, metrics, filter_cache, dependency_cache,
+        keep_cycles=True, verbose=verbose, allow_missing=allow_missing
+    )
+    package_ids = dependency_cache.package_ids
+    reaching_roots = compute_reaching_roots(list(map(package_ids.intern, root_packages)), dependents_map, keep_cycles)
+
+    if package_filter and package_filter.should_batch(filter_jobs):
+        run_filter_commands(
+            (package_ids.name(package_id) for package_id in dependents_map if package_id in reaching_roots),
+            package_filter, metrics, filter_cache, filter_jobs, verbose
+        )
+
+    affected_packages: List[Dict[str, Any]] = []
+    for package_id in dependents_map:
+        if package_id not in reaching_roots:
+            continue
+        package = package_ids.name(package_id)
+        if package_filter and not run_filter_command(package, package_filter, metrics, filter_cache, verbose):
+            logging.debug(f"   Skipping affected package {package} due to filter command")
+            continue
+        affected_packages.append({"package": package, "roots": package_ids.names(reaching_roots[package_id])})
+
+    if not affected_packages:
+        raise NoDependentsFoundError(", ".join(root_packages))
+
+    metrics.log_closure_sizes([len(affected_packages)])
+
+    return affected_packages
+
+
+def count_transitive_dependents(dependents_map: Dict[int, DependentsRecord]) -> Dict[int, int]:
+    """
+    Count the transitive dependents of every package of a dependents graph.
+
+    The graph is collapsed into strongly connected components, and the packages each
+    component reaches are worked out once per component, from the components of its
+    dependents, in reverse topological order. The set of a component is dropped as
+    soon as every component depending on it has used it.
+
+    Args:
+        dependents_map: Dictionary mapping package IDs to their direct dependents
+
+    Returns:
+        Dictionary mapping each package ID to the number of packages that transitively
+        depend on it, not counting itself
+    """
+    components = find_strongly_connected_components(dependents_map)
+    component_indexes = {package: index for index, component in enumerate(components) for package in component}
+    package_bits = {package: 1 << position for position, package in enumerate(component_indexes)}
+
+    # The components of the dependents of each component, and how many components
+    # still need to use the set of packages each component reaches
+    dependent_components: List[Set[int]] = []
+    remaining_uses = [0] * len(components)
+    for index, component in enumerate(components):
+        indexes = {
+            component_indexes[dependent]
+            for member in component if member in dependents_map
+            for dependent in dependents_map[member].dependents
+        }
+        indexes.discard(index)
+        dependent_components.append(indexes)
+        for dependent_index in indexes:
+            remaining_uses[dependent_index] += 1
+
+    # Packages reachable from each component, including its own members, as a bitset
+    closures: Dict[int, int] = {}
+    dependents_counts: Dict[int, int] = {}
+    for index in reversed(range(len(components))):
+        component = components[index]
+        members = 0
+        for member in component:
+            members |= package_bits[member]
+
+        # Packages in a cycle reach each other, and themselves
+        first_member = component[0]
+        is_cycle = len(component) > 1 or (first_member in dependents_map and first_member in dependents_map[first_member].dependents)
+        reachable_packages = members if is_cycle else 0
+
+        for dependent_index in dependent_components[index]:
+            reachable_packages |= closures[dependent_index]
+            remaining_uses[dependent_index] -= 1
+            if remaining_uses[dependent_index] == 0:
+                del closures[dependent_index]
+
+        if remaining_uses[index] > 0:
+            closures[index] = reachable_packages | members
+
+        dependents_count = reachable_packages.bit_count() - (1 if is_cycle else 0)
+        for member in component:
+            dependents_counts[member] = dependents_count
+
+    return dependents_counts
+
+
+def rank_packages_by_impact(
+        query_engine: QueryEngine,
+        show_source_packages: bool,
+        source_cache: SourcePackageCache,
+        metrics: RepoQueryMetrics,
+        top_count: int
+    ) -> List[Dict[str, Any]]:
+    """
+    Rank every package in the repositories by the number of packages that transitively depend on it.
+
+    The direct dependents of every package are found with one query, and the
+    transitive dependents are counted for the whole graph at once (see
+    count_transitive_dependents), instead of walking the graph of each package.
+
+    With show_source_packages, the graph is collapsed onto source packages first:
+    a source package depends on another if any of its binary packages depends on
+    any of the other's. Packages whose source package isn't known are left out.
+
+    Args:
+        query_engine: Query engine to answer repository queries
+        show_source_packages: Whether to rank source packages instead of binary packages
+        source_cache: Cache object holding the source package of every package (preloaded)
+        metrics: Metrics object to track repoquery calls
+        top_count: Number of packages to rank
+
+    Returns:
+        List of dictionaries containing the 'package' and its number of 'transitive_dependents',
+        most depended on first
+
+    Raises:
+        RepoQueryError: If the query fails
+    """
+    logging.debug("🔄 Finding the direct dependents of every package")
+    package_dependents = query_engine.dependents_map()
+
+    if show_source_packages:
+        source_dependents: Dict[str, Set[str]] = {}
+        for package_name, dependents in package_dependents.items():
+            source_package_name = source_cache.get(package_name)
+            if not source_package_name:
+                continue
+            dependent_source_packages = source_dependents.setdefault(source_package_name, set())
+            for dependent in dependents:
+                dependent_source_package_name = source_cache.get(dependent)
+                if dependent_source_package_name and dependent_source_package_name != source_package_name:
+                    dependent_source_packages.add(dependent_source_package_name)
+        package_dependents = {package_name: sorted(dependents) for package_name, dependents in source_dependents.items()}
+
+    package_ids = PackageIds()
+    dependents_map = {
+        package_ids.intern(package_name): DependentsRecord(map(package_ids.intern, dependents))
+        for package_name, dependents in package_dependents.items()
+    }
+    metrics.log_graph(len(dependents_map), sum(len(entry.dependents) for entry in dependents_map.values()))
+
+    logging.debug(f"🔄 Counting the transitive dependents of {len(dependents_map)} packages")
+    dependents_counts = count_transitive_dependents(dependents_map)
+    metrics.log_closure_sizes(dependents_counts.values())
+
+    ranking = sorted(dependents_counts.items(), key=lambda item: (-item[1], package_ids.name(item[0])))[:top_count]
+    return [{"package": package_ids.name(package_id), "transitive_dependents": count} for package_id, count in ranking]
+
+
+def positive_int_type(what: str) -> Callable[[str], int]:
+    """
+    Create an argument type converting a string to an integer, failing if the value is not a positive integer.
+
+    Args:
+        what: What the value is, for the error message (e.g. 'job count')
+
+    Returns:
+        The argument type function
+    """
+    def convert(value: str) -> int:
+        try:
+            result = int(value)
+        except ValueError:
+            result = -1
+
+        if result <= 0:
+            raise argparse.ArgumentTypeError(f"{what} must be positive whole number, got: {value}")
+
+        return result
+
+    return convert
+
+
+def parse_command_line_arguments(argv: List[str] | None = None) -> argparse.Namespace:
+    """
+    Parse command line arguments for the package dependents finder.
+
+    Args:
+        argv: The arguments to parse (defaults to the process command line)
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Find reverse dependencies of an RPM package."
+    )
+    parser.add_argument(
+        "package_names",
+        nargs="*",
+        metavar="package_name",
+        help="Name of the package to inspect (not used with --serve). Several packages can be "
+             "given, their dependents are written as one line of JSON per package"
+    )
+    parser.add_argument(
+        "--rank-all",
+        action="store_true",
+        help="Instead of inspecting packages, rank every package in the repositories by how many packages "
+             "transitively depend on it, from a single graph of the whole repositories. "
+             "With --source-packages, source packages are ranked"
+    )
+    parser.add_argument(
+        "--top",
+        type=positive_int_type("result limit"),
+        metavar="N",
+        help=f"Number of packages --rank-all lists (default: {DEFAULT_RANK_COUNT})"
+    )
+    parser.add_argument(
+        "--union",
+        action="store_true",
+        help="Treat the packages as one set of changed packages: list every package that transitively "
+             "depends on any of them, with the packages it's reached from"
+    )
+    parser.add_argument(
+        "--packages-from",
+        type=Path,
+        metavar="FILE",
+        help="Also inspect the packages listed in this file, one per line ('-' reads standard input). "
+             "Text after '#' is ignored"
+    )
+    parser.add_argument(
+        "--base-url",
+        dest="base_url",
+        default="http://download.devel.redhat.com/rhel-10/nightly/RHEL-10/latest-RHEL-10",
+        help="Base URL for nightly repositories"
+    )
+    parser.add_argument(
+        "--compare-base-url",
+        metavar="URL",
+        help="Base URL of an older compose to compare with: only the dependents each package gained "
+             "(+) or lost (-) since that compose are listed. The older compose is walked first, and "
+             "only the packages that changed since (by NEVRA and checksum) are queried in the newer "
+             "one. Every dependency is followed, as with --show-cycles"
+    )
+    parser.add_argument(
+        "--repositories",
+        dest="repository_names",
+        default="BaseOS,AppStream,CRB",
+        help=(
+            "Comma-separated list of repository names (relative to base URL) "
+            "or full repository URLs.\\n"
+            "Examples:\n"
+            "  --repositories BaseOS,AppStream,CRB\n"
+            "  --repositories BaseOS,https://download.devel.redhat.com/rhel-10/nightly/RHEL-10/latest-RHEL-10/compose/RT/x86_64/os\n"
+        )
+    )
+    parser.add_argument(
+        "--arch",
+        choices=sorted(KNOWN_ARCHS),
+        dest="arch",
+        default="x86_64",
+        help="CPU architecture (for example: x86_64, s390x)"
+    )
+    parser.add_argument(
+        "--output-file",
+        dest="output_file",
+        type=Path,
+        help="Write output to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Include transitive reverse dependencies (default is direct only)"
+    )
+    parser.add_argument(
+        "--source-packages",
+        action="store_true",
+        help="Convert dependent package names to their source package names"
+    )
+    parser.add_argument(
+        "--max-results",
+        type=positive_int_type("result limit"),
+        help="Maximum number of results to return (limits both queries and output)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "ndjson", "plain"],
+        default="plain",
+        help="Output format: json, ndjson (one JSON object per line, written as results are found) "
+             "or plain (one per line)"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Enable debug logging"
+    )
+
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Skip dnf cache update and use existing cache only"
+    )
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Refresh the dnf cache of every repository, even those whose repomd.xml is unchanged "
+             "since they were last refreshed and still in the dnf cache"
+    )
+    parser.add_argument(
+        "--refresh-state",
+        type=Path,
+        metavar="FILE",
+        default=default_refresh_state_path(),
+        help="File remembering the repomd.xml checksum of each repository when it was last refreshed, "
+             "so unchanged repositories are not refreshed again (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--refresh-jobs",
+        type=positive_int_type("job count"),
+        help="Number of repositories to refresh concurrently (default: all of them)"
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print detailed statistics about repoquery calls, their timings and cache usage"
+    )
+    parser.add_argument(
+        "--stats-format",
+        choices=["text", "json", "prometheus"],
+        default="text",
+        help="Format of the --stats statistics: text, json or prometheus (the text exposition format, "
+             "for the node_exporter textfile collector). Implies --stats"
+    )
+    parser.add_argument(
+        "--stats-file",
+        type=Path,
+        metavar="FILE",
+        help="Write the --stats statistics to this file instead of stderr. The file is replaced "
+             "in one go, so collectors never see it half written. Implies --stats"
+    )
+    parser.add_argument(
+        "--stats-details",
+        action="store_true",
+        help="List the cached result of every package in the --stats statistics. Implies --stats"
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=Path,
+        metavar="FILE",
+        help="Write a trace of the repository queries, filter runs and process starts to this file, "
+             "in the Chrome trace event format (open it in Perfetto or chrome://tracing). "
+             "With --serve, the trace covers every query and is written when the daemon stops"
+    )
+    parser.add_argument(
+        "--show-cycles",
+        action="store_true",
+        help="Show cycles in dependency graph"
+    )
+    parser.add_argument(
+        "--filter-command",
+        help="Optional shell command to run on each dependent package to filter results. "
+             "The command receives PACKAGE environment variable set to the package name. "
+             "If the command returns a non-zero exit code, the package is pruned from output. "
+             "Example: --filter-command 'echo $PACKAGE | grep -q \"^kernel$\"'"
+    )
+    parser.add_argument(
+        "--filter-coprocess",
+        metavar="COMMAND",
+        help="Shell command to start once and keep running to filter results, instead of running "
+             "--filter-command for each package. The command reads package names on stdin, one per line, "
+             "and answers each with a 'pass' or 'fail' line on stdout, in order"
+    )
+    parser.add_argument(
+        "--filter-function",
+        metavar="MODULE:FUNCTION",
+        help="Python function to call in-process to filter results, instead of running --filter-command "
+             "for each package. MODULE is a module name or the path of a Python file, and the function "
+             "is called with the package name and returns whether to keep the package"
+    )
+    parser.add_argument(
+        "--describe",
+        action="store_true",
+        help="Include package descriptions in output. For plain format, descriptions are appended to package names. "
+             "For JSON format, descriptions are added as a 'description' field to each package object."
+    )
+    parser.add_argument(
+        "--log-file",
+        type=Path,
+        help="Redirect all log output to this file instead of stderr"
+    )
+    parser.add_argument(
+        "--query-engine",
+        choices=QUERY_ENGINES,
+        default="dnf",
+        help="How to query the repositories: 'dnf' runs a dnf repoquery process per query, "
+             "'repodata' loads the repository metadata once and answers queries in-process, "
+             "'libsolv' loads the repositories once into a libsolv pool (requires python3-solv)"
+    )
+    parser.add_argument(
+        "--source-jobs",
+        type=positive_int_type("job count"),
+        default=1,
+        help="Number of source package lookups to run concurrently when converting direct dependents "
+             "to source packages. The lookups overlap with the whatdepends query and the filter command"
+    )
+    parser.add_argument(
+        "--filter-jobs",
+        type=positive_int_type("job count"),
+        default=1,
+        help="Number of --filter-command runs to run concurrently. Without --all, they overlap with "
+             "the whatdepends query; with --all and --union, the dependents of a whole level of the "
+             "graph are filtered at once"
+    )
+    parser.add_argument(
+        "--persistent-cache",
+        type=Path,
+        metavar="FILE",
+        help="SQLite database to keep query and filter results in between runs. "
+             "Entries are tied to the repomd.xml revisions of the repositories, so they "
+             "stop being used when a compose changes. The file can be shared by concurrent runs. "
+             "Not used by the dnf query engine with --no-refresh"
+    )
+    parser.add_argument(
+        "--preload-source-map",
+        action="store_true",
+        help="With --source-packages (or --serve), look up the source packages of every package in the "
+             "repositories with a single query up front instead of one query per dependent"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=positive_int_type("job count"),
+        default=1,
+        help="Number of repository queries to run concurrently. In-process query engines use long-lived "
+             "worker processes, the dnf engine uses threads driving dnf processes. "
+             "Each level of the dependents graph is handed to the workers at once: split into one "
+             "query per package for in-process engines, and into one batched query per worker for dnf"
+    )
+    parser.add_argument(
+        "--allow-missing",
+        action="store_true",
+        help="Allow missing packages to be non-fatal to operation. "
+             "If a package is not found in repositories, continue with empty results instead of exiting with error."
+    )
+    parser.add_argument(
+        "--serve",
+        type=Path,
+        metavar="SOCKET",
+        help="Load the repositories and caches once and answer queries from --connect clients on this "
+             "Unix socket until interrupted. Statistics cover everything the daemon has done"
+    )
+    parser.add_argument(
+        "--connect",
+        type=Path,
+        metavar="SOCKET",
+        help="Forward the query to a --serve daemon on this Unix socket instead of running it. "
+             "The repository options must match the daemon's"
+    )
+    arguments = parser.parse_args(argv)
+
+    if arguments.serve and arguments.connect:
+        parser.error("--serve and --connect can't be used together")
+    if arguments.connect and arguments.trace_file:
+        parser.error("--trace-file can't be used with --connect, start the daemon with it instead")
+    if arguments.connect and arguments.stats_file:
+        parser.error("--stats-file can't be used with --connect")
+    if sum(1 for option in (arguments.filter_command, arguments.filter_coprocess, arguments.filter_function) if option) > 1:
+        parser.error("--filter-command, --filter-coprocess and --filter-function can't be used together")
+    if arguments.union and arguments.max_results is not None:
+        parser.error("--max-results can't be used with --union")
+    if arguments.no_refresh and arguments.force_refresh:
+        parser.error("--no-refresh and --force-refresh can't be used together")
+    if arguments.compare_base_url:
+        for option, used in (
+            ("--serve", arguments.serve),
+            ("--connect", arguments.connect),
+            ("--union", arguments.union),
+            ("--max-results", arguments.max_results is not None),
+            ("--describe", arguments.describe),
+            ("--format ndjson", arguments.format == "ndjson"),
+        ):
+            if used:
+                parser.error(f"{option} can't be used with --compare-base-url")
+        arguments.show_cycles = True
+    if arguments.top is not None and not arguments.rank_all:
+        parser.error("--top can only be used with --rank-all")
+    if arguments.rank_all:
+        for option, used in (
+            ("package names", arguments.package_names),
+            ("--packages-from", arguments.packages_from),
+            ("--serve", arguments.serve),
+            ("--connect", arguments.connect),
+            ("--all", arguments.all),
+            ("--union", arguments.union),
+            ("--compare-base-url", arguments.compare_base_url),
+            ("--max-results", arguments.max_results is not None),
+            ("--describe", arguments.describe),
+            ("--filter-command, --filter-coprocess and --filter-function", arguments.filter_command or arguments.filter_coprocess or arguments.filter_function),
+            ("--format ndjson", arguments.format == "ndjson"),
+        ):
+            if used:
+                parser.error(f"{option} can't be used with --rank-all")
+        if arguments.top is None:
+            arguments.top = DEFAULT_RANK_COUNT
+    elif not arguments.package_names and not arguments.packages_from and not arguments.serve:
+        parser.error("the following arguments are required: package_name")
+
+    arguments.package_name = arguments.package_names[0] if arguments.package_names else None
+    arguments.stats = arguments.stats or arguments.stats_format != "text" or arguments.stats_file is not None or arguments.stats_details
+
+    return arguments
+
+
+def read_package_names(arguments: argparse.Namespace) -> List[str]:
+    """
+    Collect the packages to inspect from the command line and the --packages-from file.
+
+    Args:
+        arguments: Parsed command line arguments
+
+    Returns:
+        The package names, without duplicates
+
+    Raises:
+        OSError: If the --packages-from file can't be read
+    """
+    package_names = list(arguments.package_names)
+
+    if arguments.packages_from:
+        if str(arguments.packages_from) == "-":
+            text = sys.stdin.read()
+        else:
+            text = arguments.packages_from.read_text()
+
+        for line in text.splitlines():
+            package_name = line.split("#", 1)[0].strip()
+            if package_name:
+                package_names.append(package_name)
+
+    return list(dict.fromkeys(package_names))
+
+
+def set_package_names(arguments: argparse.Namespace, package_names: List[str]) -> int:
+    """
+    Check the packages to inspect and store them in the arguments.
+
+    Args:
+        arguments: Parsed command line arguments
+        package_names: The packages to inspect
+
+    Returns:
+        EXIT_SUCCESS, or EXIT_INVALID_ARGUMENTS if the packages can't be inspected
+    """
+    if not package_names:
+        logging.error("No packages to inspect")
+        return EXIT_INVALID_ARGUMENTS
+
+    if len(package_names) > 1 and arguments.format not in ("json", "ndjson") and not arguments.union:
+        logging.error("Several packages can only be inspected with --format json or ndjson (or --union)")
+        return EXIT_INVALID_ARGUMENTS
+
+    arguments.package_names = package_names
+    arguments.package_name = package_names[0]
+    return EXIT_SUCCESS
+
+
+def answers_per_package(arguments: argparse.Namespace) -> bool:
+    """
+    Check if a query is answered with one line of JSON per package (see answer_queries).
+
+    Args:
+        arguments: Parsed command line arguments, with the packages set
+
+    Returns:
+        True for several packages not inspected as a --union, False otherwise
+    """
+    return len(arguments.package_names) > 1 and not arguments.union
+
+
+def log_query(arguments: argparse.Namespace) -> None:
+    """
+    Log information about a query answered with one output document.
+
+    Args:
+        arguments: Parsed command line arguments, with the packages set
+    """
+    log_operation(
+        ", ".join(arguments.package_names) if arguments.union else arguments.package_name,
+        arguments.all or arguments.union,
+        arguments.source_packages,
+        arguments.max_results,
+        arguments.package_filter,
+        arguments.output_file
+    )
+
+
+def build_repository_paths(
+        base_url: str,
+        repository_names: str,
+        arch: str
+    ) -> Dict[str, str]:
+    """
+    Build repository paths from base URL and repository names.
+
+    Args:
+        base_url: Base URL for the repositories
+        repository_names: Comma-separated list of repository names or full URLs
+        arch: CPU architecture (e.g., 'x86_64', 'aarch64')
+
+    Returns:
+        Dictionary mapping repository IDs to their full URLs
+
+    Raises:
+        SystemExit: If no valid repositories are provided
+    """
+    repositories = [
+        repo.strip() for repo in repository_names.split(",")
+        if repo.strip()
+    ]
+    if not repositories:
+        logging.error("At least one repository alias or URL must be provided")
+        sys.exit(EXIT_INVALID_ARGUMENTS)
+
+    base = base_url.rstrip("/")
+    paths: Dict[str, str] = {}
+    for repository in repositories:
+        if repository.startswith(("http://", "https://", "file://")):
+            repository_url = repository.rstrip("/")
+            repository_id = derive_repository_id_from_url(repository_url)
+            paths[repository_id] = repository_url
+            continue
+
+        repository_id = repository
+        repository_url = f"{base}/compose/{repository}/{arch}/os/"
+        paths[repository_id] = repository_url
+
+        repository_id = repository + "-sources"
+        repository_url = f"{base}/compose/{repository}/source/tree/"
+        paths[repository_id] = repository_url
+    return paths
+
+
+def set_up_logging(verbose: bool, log_file: Path | None) -> None:
+    """
+    Set up logging configuration.
+
+    Args:
+        verbose: Whether to enable debug logging
+        log_file: Optional file path to redirect logs to
+    """
+    level = logging.DEBUG if verbose else logging.INFO
+
+    if log_file:
+        logger = logging.getLogger()
+        logger.setLevel(level)
+
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(level)
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(file_handler)
+
+        stderr_handler = logging.StreamHandler(sys.stderr)
+        stderr_handler.setLevel(logging.ERROR)
+        stderr_handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(stderr_handler)
+    else:
+        logging.basicConfig(format="%(message)s", level=level)
+
+
+def log_operation(
+        package_name: str,
+        all_dependents: bool,
+        source_packages: bool,
+        max_results: int | None,
+        package_filter: PackageFilter | None,
+        output_file: Path | None
+    ) -> None:
+    """
+    Log information about the operation being performed.
+
+    Args:
+        package_name: Name of the package to inspect
+        all_dependents: Whether to include transitive dependencies
+        source_packages: Whether to convert to source package names
+        max_results: Maximum number of results to return
+        package_filter: Optional filter for the packages
+        output_file: Optional output file path
+    """
+    operation = "transitive" if all_dependents else "direct"
+    package_type = "as source packages" if source_packages else ""
+    max_info = f" (max {max_results})" if max_results else ""
+    filter_info = f" with filter: {package_filter}" if package_filter else ""
+    output_info = f" to \"{output_file}\"" if output_file else ""
+
+    logging.info(
+        f"\n🔍 Finding {operation} reverse dependencies of \"{package_name}\" "
+        f"{package_type}{max_info}{filter_info}{output_info}\n"
+    )
+
+
+def set_up_repositories_and_cache(
+        base_url: str,
+        repository_names: str,
+        arch: str,
+        no_refresh: bool,
+        verbose: bool,
+        query_engine_name: str = "dnf",
+        refresh_state_path: Path | None = None,
+        refresh_jobs: int | None = None,
+        force_refresh: bool = False
+    ) -> Dict[str, str]:
+    """
+    Set up repositories and update dnf cache if needed.
+
+    Args:
+        base_url: Base URL for nightly repositories
+        repository_names: Comma-separated list of repository names
+        arch: CPU architecture
+        no_refresh: Whether to skip dnf cache update
+        verbose: Whether to enable verbose logging
+        query_engine_name: The query engine that will be used (only dnf uses the dnf cache)
+        refresh_state_path: File remembering which repositories are up to date in the dnf cache
+        refresh_jobs: Maximum number of repositories to refresh at once (default: all of them)
+        force_refresh: Whether to refresh repositories even if they are unchanged
+
+    Returns:
+        Dictionary mapping repository IDs to URLs
+    """
+    repositories = build_repository_paths(base_url, repository_names, arch)
+
+    if query_engine_name != "dnf":
+        logging.debug(f"⏭️  Skipping dnf cache update (not used by the {query_engine_name} query engine)")
+    elif not no_refresh:
+        update_dnf_cache(repositories, verbose, refresh_state_path, refresh_jobs, force_refresh)
+    else:
+        logging.info("⏭️  Skipping dnf cache update (using existing cache)")
+
+    return repositories
+
+
+def collect_package_descriptions(
+        arguments: argparse.Namespace,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        description_cache: DescriptionCache,
+        dependents_data: Iterable[Dict[str, Any]] | List[str]
+    ) -> Dict[str, str]:
+    """
+    Collect package descriptions for all relevant packages.
+
+    The descriptions are fetched in batches up front.
+
+    Args:
+        arguments: Parsed command line arguments
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        description_cache: Cache object to store package descriptions
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+
+    Returns:
+        Dictionary mapping package names to their descriptions
+    """
+    package_descriptions = {}
+
+    if arguments.union or arguments.all:
+        all_packages = set()
+        for package_entry in dependents_data:
+            all_packages.add(package_entry["package"])
+            all_packages.update(package_entry.get("dependents", ()))
+
+        query_package_descriptions(sorted(all_packages), query_engine, metrics, description_cache, arguments.verbose)
+        for package in all_packages:
+            description = query_package_description(
+                package, query_engine, metrics, description_cache, arguments.verbose
+            )
+            package_descriptions[package] = description
+    else:
+        all_packages_to_describe = [arguments.package_name] + dependents_data
+        query_package_descriptions(all_packages_to_describe, query_engine, metrics, description_cache, arguments.verbose)
+        for package in all_packages_to_describe:
+            description = query_package_description(
+                package, query_engine, metrics, description_cache, arguments.verbose
+            )
+            package_descriptions[package] = description
+
+    return package_descriptions
+
+
+def write_dependents_output(
+        arguments: argparse.Namespace,
+        dependents_data: Iterable[Dict[str, Any]] | List[str],
+        package_descriptions: Dict[str, str] | None
+    ) -> None:
+    """
+    Write the output in the requested format.
+
+    Args:
+        arguments: Parsed command line arguments
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+    """
+    if arguments.format == "json":
+        write_json_output(arguments, dependents_data, package_descriptions, arguments.output_file)
+    else:
+        write_output(generate_plain_output(arguments, dependents_data, package_descriptions), arguments.output_file)
+
+
+def write_json_output(
+        arguments: argparse.Namespace,
+        dependents_data: Iterable[Dict[str, Any]] | List[str],
+        package_descriptions: Dict[str, str] | None,
+        output_file: Path | None
+    ) -> None:
+    """
+    Write JSON formatted output to file or stdout, one package object at a time.
+
+    The text is the same as json.dumps(build_json_output(...), indent=2) would give,
+    but neither all of it nor all the package objects are held in memory at once.
+
+    Args:
+        arguments: Parsed command line arguments
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+        output_file: Optional output file path
+    """
+    logging.debug("\n✅ Final output:")
+    with contextlib.ExitStack() as stack:
+        if output_file:
+            output_stream = stack.enter_context(open(output_file, "w"))
+        else:
+            output_stream = sys.stdout
+
+        separator = "[\n  "
+        for package_obj in generate_json_objects(arguments, dependents_data, package_descriptions):
+            package_text = json.dumps(package_obj, indent=2).replace("\n", "\n  ")
+            logging.debug(package_text)
+            output_stream.write(separator + package_text)
+            separator = ",\n  "
+        output_stream.write("[]" if separator == "[\n  " else "\n]")
+
+        if not output_file:
+            output_stream.write("\n")
+
+
+def build_json_output(
+        arguments: argparse.Namespace,
+        dependents_data: Iterable[Dict[str, Any]] | List[str],
+        package_descriptions: Dict[str, str] | None
+    ) -> List[Dict[str, Any]]:
+    """
+    Build the array of package objects that makes up the JSON output.
+
+    Args:
+        arguments: Parsed command line arguments
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+
+    Returns:
+        List of package objects
+    """
+    return list(generate_json_objects(arguments, dependents_data, package_descriptions))
+
+
+def generate_json_objects(
+        arguments: argparse.Namespace,
+        dependents_data: Iterable[Dict[str, Any]] | List[str],
+        package_descriptions: Dict[str, str] | None
+    ) -> Generator[Dict[str, Any], None, None]:
+    """
+    Generator that yields the package objects that make up the JSON output.
+
+    Args:
+        arguments: Parsed command line arguments
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+
+    Yields:
+        Package objects
+    """
+    if arguments.union:
+        for package_entry in dependents_data:
+            package_obj = {"package": package_entry["package"]}
+            if arguments.describe and package_descriptions:
+                description = package_descriptions.get(package_entry["package"])
+                if description:
+                    package_obj["description"] = description
+            package_obj["roots"] = package_entry["roots"]
+            yield package_obj
+    elif arguments.all:
+        for package_entry in dependents_data:
+            package_obj = {"package": package_entry["package"]}
+            if arguments.describe and package_descriptions:
+                description = package_descriptions.get(package_entry["package"])
+                if description:
+                    package_obj["description"] = description
+            package_obj["dependents"] = package_entry["dependents"]
+            if "partial" in package_entry:
+                package_obj["partial"] = package_entry["partial"]
+            yield package_obj
+    else:
+        package_obj = {"package": arguments.package_name, "dependents": dependents_data}
+        if arguments.describe and package_descriptions:
+            description = package_descriptions.get(arguments.package_name)
+            if description:
+                package_obj["description"] = description
+        yield package_obj
+
+
+def generate_plain_output(
+        arguments: argparse.Namespace,
+        dependents_data: Iterable[Dict[str, Any]] | List[str],
+        package_descriptions: Dict[str, str] | None
+    ) -> str:
+    """
+    Generate plain text formatted output.
+
+    Args:
+        arguments: Parsed command line arguments
+        dependents_data: Either package dictionaries (for --all and --union) or a list of strings (for direct only)
+        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+
+    Returns:
+        Plain text formatted string
+    """
+    if arguments.union:
+        collected_packages = [package_entry["package"] for package_entry in dependents_data]
+    elif arguments.all:
+        # Find the root package entry
+        root_package_entry = None
+        for package_entry in dependents_data:
+            if package_entry["package"] == arguments.package_name:
+                root_package_entry = package_entry
+                break
+
+        if root_package_entry:
+            collected_packages = root_package_entry["dependents"]
+        else:
+            collected_packages = []
+    else:
+        collected_packages = dependents_data
+
+    if arguments.describe and package_descriptions:
+        output_lines = []
+        for package in collected_packages:
+            description = package_descriptions.get(package)
+            if description:
+                output_lines.append(f"{package}: {description}")
+            else:
+                output_lines.append(package)
+        return "\n".join(output_lines)
+    else:
+        return "\n".join(collected_packages)
+
+
+def write_output(output_data: str, output_file: Path | None) -> None:
+    """
+    Write output to file or stdout.
+
+    Args:
+        output_data: The formatted output data
+        output_file: Optional output file path
+    """
+    logging.debug(f"\n✅ Final output:\n{output_data}\n")
+    if output_file:
+        output_file.write_text(output_data)
+    else:
+        print(output_data)
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format a duration for the statistics, in a unit that suits its size.
+
+    Args:
+        seconds: The duration in seconds
+
+    Returns:
+        The formatted duration, e.g. '1.25s', '12.3ms' or '45µs'
+    """
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds * 1000000:.0f}µs"
+
+
+def collect_statistics(
+        arguments: argparse.Namespace,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> Dict[str, Any]:
+    """
+    Collect statistics about the operation, from the metrics and the caches.
+
+    Args:
+        arguments: Parsed command line arguments of the query
+        metrics: Metrics object containing operation statistics
+        source_cache: Cache object containing source package cache statistics
+        filter_cache: Cache object containing filter cache statistics
+        dependency_cache: Cache object containing dependency cache statistics
+        description_cache: Cache object containing description cache statistics
+        persistent_store: Persistent store backing the caches, if any
+
+    Returns:
+        Dictionary containing the statistics, with the cached result of every package
+        only if --stats-details is used
+    """
+    stats = metrics.get_stats()
+    latencies = stats["latencies"]
+
+    caches = {
+        "source": source_cache.get_stats(arguments.stats_details),
+        "filter": filter_cache.get_stats(arguments.stats_details),
+        "dependency": dependency_cache.get_stats(arguments.stats_details),
+        "description": description_cache.get_stats(),
+    }
+    for cache_name, cache_stats in caches.items():
+        hits = latencies.get(f"{cache_name} cache hit", {}).get("count", 0)
+        misses = latencies.get(f"{cache_name} cache miss", {}).get("count", 0)
+        cache_stats["lookup_hits"] = hits
+        cache_stats["lookup_misses"] = misses
+        cache_stats["hit_ratio"] = hits / (hits + misses) if hits + misses else None
+
+    package_filter = arguments.package_filter
+    return {
+        "query": {
+            "packages": arguments.package_names,
+            "query_engine": arguments.query_engine,
+            "base_url": arguments.base_url,
+            "repositories": arguments.repository_names.split(","),
+            "arch": arguments.arch,
+        },
+        "total_calls": stats["total_calls"],
+        "calls_by_type": stats["calls_by_type"],
+        "query_time": sum(latencies[call_type]["total"] for call_type in stats["calls_by_type"] if call_type in latencies),
+        "process_start_time": latencies.get("process start", {}).get("total", 0.0),
+        "filter": {
+            "description": package_filter.description if package_filter is not None else None,
+            "calls": stats["filter_calls"],
+            "failures": stats["filter_failures"],
+            "time": stats["filter_time"],
+            "slowest_call": stats["slowest_filter_call"],
+        },
+        "latencies": latencies,
+        "memory": {
+            "initial_resident": stats["initial_resident_memory"],
+            "resident": stats["resident_memory"],
+            "peak_resident": stats["peak_resident_memory"],
+        },
+        "graph": {
+            "walks": stats["graph_count"],
+            "packages": stats["graph_packages"],
+            "edges": stats["graph_edges"],
+            "closures": stats["closure_count"],
+            "closure_dependents": stats["closure_dependents"],
+            "largest_closure": stats["largest_closure"],
+        },
+        "caches": caches,
+        "persistent_cache": persistent_store.get_stats() if persistent_store is not None else None,
+    }
+
+
+def format_text_statistics(statistics: Dict[str, Any]) -> str:
+    """
+    Format statistics for people to read.
+
+    Args:
+        statistics: The statistics, as returned by collect_statistics
+
+    Returns:
+        The statistics as lines of text
+    """
+    lines = ["", "📊 FINAL STATISTICS:"]
+    lines.append(f"   Total repoquery calls: {statistics['total_calls']}")
+    lines.append("   Calls by type:")
+    for call_type, count in statistics["calls_by_type"].items():
+        lines.append(f"     {call_type}: {count}")
+    lines.append(f"   Query time: {statistics['query_time']:.2f}s (process starts {statistics['process_start_time']:.2f}s)")
+
+    filter_stats = statistics["filter"]
+    if filter_stats["description"] is not None:
+        lines.append(f"   Filter command calls: {filter_stats['calls']}")
+        lines.append(f"   Filter command failures: {filter_stats['failures']}")
+        lines.append(f"   Filter command time: {filter_stats['time']:.2f}s (slowest call {filter_stats['slowest_call']:.2f}s)")
+
+    if statistics["latencies"]:
+        lines.append("   Latency by type (p50 / p95 / max):")
+        for category, latency in statistics["latencies"].items():
+            lines.append(
+                f"     {category}: {format_duration(latency['p50'])} / {format_duration(latency['p95'])} / {format_duration(latency['max'])} "
+                f"({latency['count']} timed, {latency['total']:.2f}s wall clock, {latency['cpu_time']:.2f}s CPU"
+                + (f", {latency['command_cpu_time']:.2f}s CPU in commands)" if latency["command_cpu_time"] else ")")
+            )
+
+    memory = statistics["memory"]
+    if memory["initial_resident"] is not None and memory["resident"] is not None:
+        lines.append(f"   Resident memory before: {memory['initial_resident'] / 1048576:.1f} MiB")
+        lines.append(f"   Resident memory after: {memory['resident'] / 1048576:.1f} MiB")
+    if memory["peak_resident"] is not None:
+        lines.append(f"   Peak resident memory: {memory['peak_resident'] / 1048576:.1f} MiB")
+
+    graph = statistics["graph"]
+    if graph["walks"]:
+        lines.append(f"   Dependents graphs walked: {graph['walks']} ({graph['packages']} packages, {graph['edges']} direct dependencies)")
+    if graph["closures"]:
+        lines.append(f"   Transitive closures: {graph['closures']} ({graph['closure_dependents']} dependents, largest {graph['largest_closure']})")
+
+    persistent_cache = statistics["persistent_cache"]
+    if persistent_cache is not None:
+        lines.append(f"   Persistent cache: {persistent_cache['path']} (repository key {persistent_cache['repository_key'][:16]})")
+
+    caches = statistics["caches"]
+    source_cache_stats = caches["source"]
+    lines.append(f"   Source package cache size: {source_cache_stats['cache_size']}")
+    lines.append(f"   Source package cache hits (found): {source_cache_stats['found_count']}")
+    lines.append(f"   Source package cache hits (not found): {source_cache_stats['not_found_count']}")
+    lines.append(f"   Source package cache lookups served from memory: {source_cache_stats['memory_hits']}")
+    lines.append(f"   Source package cache lookups served from persistent cache: {source_cache_stats['persistent_hits']}")
+    lines.append(f"   Source package cache hit ratio: {format_ratio(source_cache_stats['hit_ratio'])}")
+    if source_cache_stats["preloaded"]:
+        lines.append("   Source package cache preloaded with all packages (listing omitted)")
+
+    if source_cache_stats.get("cached_results") and not source_cache_stats["preloaded"]:
+        lines.append("   Cached source packages:")
+        for package, result in source_cache_stats["cached_results"].items():
+            if not result:
+                status = "not found"
+            else:
+                status = f"→ {result}"
+            lines.append(f"     {package}: {status}")
+
+    filter_cache_stats = caches["filter"]
+    lines.append(f"   Filter cache size: {filter_cache_stats['cache_size']}")
+    lines.append(f"   Filter cache hits (passed): {filter_cache_stats['passed_count']}")
+    lines.append(f"   Filter cache hits (failed): {filter_cache_stats['failed_count']}")
+    lines.append(f"   Filter cache lookups served from memory: {filter_cache_stats['memory_hits']}")
+    lines.append(f"   Filter cache lookups served from persistent cache: {filter_cache_stats['persistent_hits']}")
+    lines.append(f"   Filter cache hit ratio: {format_ratio(filter_cache_stats['hit_ratio'])}")
+
+    if filter_cache_stats.get("cached_results"):
+        lines.append("   Cached filter results:")
+        for package, result in filter_cache_stats["cached_results"].items():
+            status = "pass" if result else "fail"
+            lines.append(f"     {package}: {status}")
+
+    dependency_cache_stats = caches["dependency"]
+    lines.append(f"   Dependency cache size: {dependency_cache_stats['cache_size']}")
+    lines.append(f"   Dependency cache total dependents: {dependency_cache_stats['total_dependents']}")
+    lines.append(f"   Dependency cache complete results: {dependency_cache_stats['complete_count']}")
+    lines.append(f"   Dependency cache partial results: {dependency_cache_stats['partial_count']}")
+    lines.append(f"   Dependency cache lookups served from memory: {dependency_cache_stats['memory_hits']}")
+    lines.append(f"   Dependency cache lookups served from persistent cache: {dependency_cache_stats['persistent_hits']}")
+    lines.append(f"   Dependency cache hit ratio: {format_ratio(dependency_cache_stats['hit_ratio'])}")
+
+    if dependency_cache_stats.get("cached_results"):
+        lines.append("   Cached dependency results:")
+        for package, entry in dependency_cache_stats["cached_results"].items():
+            partial_info = " (partial)" if entry["partial"] else " (complete)"
+            lines.append(f"     {package}: {entry['dependents']} dependents{partial_info}")
+
+    description_cache_stats = caches["description"]
+    lines.append(f"   Description cache size: {description_cache_stats['cache_size']}")
+    lines.append(f"   Description cache hits (found): {description_cache_stats['found_count']}")
+    lines.append(f"   Description cache hits (not found): {description_cache_stats['not_found_count']}")
+    lines.append(f"   Description cache lookups served from memory: {description_cache_stats['memory_hits']}")
+    lines.append(f"   Description cache lookups served from persistent cache: {description_cache_stats['persistent_hits']}")
+    lines.append(f"   Description cache hit ratio: {format_ratio(description_cache_stats['hit_ratio'])}")
+
+    return "\n".join(lines)
+
+
+def format_ratio(ratio: float | None) -> str:
+    """
+    Format a ratio for the statistics as a percentage.
+
+    Args:
+        ratio: The ratio, or None if there was nothing to compute it from
+
+    Returns:
+        The formatted ratio, e.g. '97.5%', or 'n/a'
+    """
+    if ratio is None:
+        return "n/a"
+    return f"{ratio * 100:.1f}%"
+
+
+def format_prometheus_statistics(statistics: Dict[str, Any]) -> str:
+    """
+    Format statistics in the Prometheus text exposition format.
+
+    The output is meant for the node_exporter textfile collector, so it has no
+    timestamps. Per-package listings are left out, whatever --stats-details says.
+
+    Args:
+        statistics: The statistics, as returned by collect_statistics
+
+    Returns:
+        The statistics as Prometheus metrics
+    """
+    lines: List[str] = []
+
+    def add_metric(name: str, metric_type: str, help_text: str, samples: List[Tuple[str, Dict[str, str], Any]]) -> None:
+        samples = [(suffix, labels, value) for suffix, labels, value in samples if value is not None]
+        if not samples:
+            return
+        full_name = f"{PROMETHEUS_METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for suffix, labels, value in samples:
+            value_text = repr(value) if isinstance(value, float) else str(int(value))
+            label_text = ",".join(f'{label}="{escape_prometheus_label(label_value)}"' for label, label_value in labels.items())
+            lines.append(f"{full_name}{suffix}{{{label_text}}} {value_text}" if label_text else f"{full_name}{suffix} {value_text}")
+
+    query = statistics["query"]
+    add_metric("query_info", "gauge", "The query the statistics are about", [
+        ("", {
+            "query_engine": query["query_engine"],
+            "base_url": query["base_url"],
+            "repositories": ",".join(query["repositories"]),
+            "arch": query["arch"],
+        }, 1),
+    ])
+    add_metric("repoquery_calls_total", "counter", "Repository queries made, by type", [
+        ("", {"type": call_type}, count) for call_type, count in statistics["calls_by_type"].items()
+    ])
+    add_metric("query_seconds_total", "counter", "Time spent in repository queries, added up across concurrent queries", [
+        ("", {}, statistics["query_time"]),
+    ])
+    add_metric("process_start_seconds_total", "counter", "Time spent starting subprocesses, up to them being executed", [
+        ("", {}, statistics["process_start_time"]),
+    ])
+
+    filter_stats = statistics["filter"]
+    if filter_stats["description"] is not None:
+        add_metric("filter_calls_total", "counter", "Filter runs", [("", {}, filter_stats["calls"])])
+        add_metric("filter_failures_total", "counter", "Filter runs that rejected the package or failed", [("", {}, filter_stats["failures"])])
+        add_metric("filter_seconds_total", "counter", "Time spent running the filter", [("", {}, filter_stats["time"])])
+
+    latencies = statistics["latencies"]
+    duration_samples: List[Tuple[str, Dict[str, str], Any]] = []
+    for category, latency in latencies.items():
+        duration_samples.append(("", {"type": category, "quantile": "0.5"}, latency["p50"]))
+        duration_samples.append(("", {"type": category, "quantile": "0.95"}, latency["p95"]))
+        duration_samples.append(("_sum", {"type": category}, latency["total"]))
+        duration_samples.append(("_count", {"type": category}, latency["count"]))
+    add_metric("duration_seconds", "summary", "Wall-clock time of queries, filter runs, cache lookups and process starts, by type", duration_samples)
+    add_metric("duration_max_seconds", "gauge", "Longest wall-clock time of a query, filter run, cache lookup or process start, by type", [
+        ("", {"type": category}, latency["max"]) for category, latency in latencies.items()
+    ])
+    add_metric("cpu_seconds_total", "counter", "CPU time this process spent on queries, filter runs, cache lookups and process starts, by type", [
+        ("", {"type": category}, latency["cpu_time"]) for category, latency in latencies.items()
+    ])
+    add_metric("command_cpu_seconds_total", "counter", "CPU time the commands run for queries and filter runs (dnf, filter commands) spent, by type", [
+        ("", {"type": category}, latency["command_cpu_time"]) for category, latency in latencies.items()
+    ])
+
+    memory = statistics["memory"]
+    add_metric("initial_resident_memory_bytes", "gauge", "Resident memory when the process started", [("", {}, memory["initial_resident"])])
+    add_metric("resident_memory_bytes", "gauge", "Resident memory", [("", {}, memory["resident"])])
+    add_metric("peak_resident_memory_bytes", "gauge", "Peak resident memory", [("", {}, memory["peak_resident"])])
+
+    graph = statistics["graph"]
+    add_metric("graph_walks_total", "counter", "Dependents graphs walked", [("", {}, graph["walks"])])
+    add_metric("graph_packages_total", "counter", "Packages in the dependents graphs walked", [("", {}, graph["packages"])])
+    add_metric("graph_edges_total", "counter", "Direct dependencies in the dependents graphs walked", [("", {}, graph["edges"])])
+    add_metric("closures_total", "counter", "Transitive closures computed", [("", {}, graph["closures"])])
+    add_metric("closure_dependents_total", "counter", "Transitive dependents in the closures computed", [("", {}, graph["closure_dependents"])])
+    add_metric("largest_closure_dependents", "gauge", "Transitive dependents in the largest closure computed", [("", {}, graph["largest_closure"])])
+
+    caches = statistics["caches"]
+    add_metric("cache_entries", "gauge", "Entries in the in-memory caches", [
+        ("", {"cache": cache_name}, cache_stats["cache_size"]) for cache_name, cache_stats in caches.items()
+    ])
+    add_metric("cache_lookups_total", "counter", "Cache lookups, by result", [
+        sample
+        for cache_name, cache_stats in caches.items()
+        for sample in (
+            ("", {"cache": cache_name, "result": "hit"}, cache_stats["lookup_hits"]),
+            ("", {"cache": cache_name, "result": "miss"}, cache_stats["lookup_misses"]),
+        )
+    ])
+    add_metric("cache_hits_total", "counter", "Cache hits, by where they were served from", [
+        sample
+        for cache_name, cache_stats in caches.items()
+        for sample in (
+            ("", {"cache": cache_name, "store": "memory"}, cache_stats["memory_hits"]),
+            ("", {"cache": cache_name, "store": "persistent"}, cache_stats["persistent_hits"]),
+        )
+    ])
+    add_metric("cache_hit_ratio", "gauge", "Share of cache lookups that were hits", [
+        ("", {"cache": cache_name}, cache_stats["hit_ratio"]) for cache_name, cache_stats in caches.items()
+    ])
+    add_metric("dependency_cache_dependents", "gauge", "Direct dependents in the dependency cache", [
+        ("", {}, caches["dependency"]["total_dependents"]),
+    ])
+
+    return "\n".join(lines) + "\n"
+
+
+def escape_prometheus_label(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text exposition format.
+
+    Args:
+        value: The label value
+
+    Returns:
+        The value with backslashes, double quotes and newlines escaped
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def display_statistics(
+        arguments: argparse.Namespace,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> None:
+    """
+    Display detailed statistics about the operation, in the --stats-format format.
+
+    The statistics go to the --stats-file file if there is one, stderr otherwise.
+    The file is replaced in one go, so a metrics collector never reads it half written.
 
-    parser.add_argument(
-        "--no-refresh",
-        action="store_true",
-        help="Skip dnf cache update and use existing cache only"
-    )
-    parser.add_argument(
-        "--stats",
-        action="store_true",
-        help="Print detailed statistics about repoquery calls and cache usage"
-    )
-    parser.add_argument(
-        "--show-cycles",
-        action="store_true",
-        help="Show cycles in dependency graph"
-    )
-    parser.add_argument(
-        "--filter-command",
-        help="Optional shell command to run on each dependent package to filter results. "
-             "The command receives PACKAGE environment variable set to the package name. "
-             "If the command returns a non-zero exit code, the package is pruned from output. "
-             "Example: --filter-command 'echo $PACKAGE | grep -q \"^kernel$\"'"
-    )
-    parser.add_argument(
-        "--describe",
-        action="store_true",
-        help="Include package descriptions in output. For plain format, descriptions are appended to package names. "
-             "For JSON format, descriptions are added as a 'description' field to each package object."
-    )
-    parser.add_argument(
-        "--log-file",
-        type=Path,
-        help="Redirect all log output to this file instead of stderr"
-    )
-    parser.add_argument(
-        "--allow-missing",
-        action="store_true",
-        help="Allow missing packages to be non-fatal to operation. "
-             "If a package is not found in repositories, continue with empty results instead of exiting with error."
+    Args:
+        arguments: Parsed command line arguments of the query
+        metrics: Metrics object containing operation statistics
+        source_cache: Cache object containing source package cache statistics
+        filter_cache: Cache object containing filter cache statistics
+        dependency_cache: Cache object containing dependency cache statistics
+        description_cache: Cache object containing description cache statistics
+        persistent_store: Persistent store backing the caches, if any
+    """
+    statistics = collect_statistics(
+        arguments, metrics, source_cache, filter_cache, dependency_cache, description_cache, persistent_store
     )
-    return parser.parse_args()
 
+    if arguments.stats_format == "json":
+        output_data = json.dumps(statistics, indent=2) + "\n"
+    elif arguments.stats_format == "prometheus":
+        output_data = format_prometheus_statistics(statistics)
+    else:
+        output_data = format_text_statistics(statistics) + "\n"
 
-def build_repository_paths(
-        base_url: str,
-        repository_names: str,
-        arch: str
-    ) -> Dict[str, str]:
+    if not arguments.stats_file:
+        sys.stderr.write(output_data)
+        return
+
+    temporary_path = arguments.stats_file.with_name(f".{arguments.stats_file.name}.{os.getpid()}.tmp")
+    try:
+        temporary_path.write_text(output_data)
+        temporary_path.replace(arguments.stats_file)
+    except OSError as error:
+        logging.error("%s", f"Could not write the statistics: {error}")
+        temporary_path.unlink(missing_ok=True)
+
+
+def find_package_dependents(
+        arguments: argparse.Namespace,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache
+    ) -> Tuple[Iterable[Dict[str, Any]] | List[str], Dict[str, str] | None]:
     """
-    Build repository paths from base URL and repository names.
+    Find the dependents a query asks for.
 
     Args:
-        base_url: Base URL for the repositories
-        repository_names: Comma-separated list of repository names or full URLs
-        arch: CPU architecture (e.g., 'x86_64', 'aarch64')
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
 
     Returns:
-        Dictionary mapping repository IDs to their full URLs
+        The dependents data (see write_dependents_output) and the package descriptions if
+        --describe is used, None otherwise
 
     Raises:
-        SystemExit: If no valid repositories are provided
+        RepoQueryError: If a query fails
+        NoDependentsFoundError: If the package has no dependents
+        PackageNotFoundError: If a package is missing from the repositories
     """
-    repositories = [
-        repo.strip() for repo in repository_names.split(",")
-        if repo.strip()
-    ]
-    if not repositories:
-        logging.error("At least one repository alias or URL must be provided")
-        sys.exit(EXIT_INVALID_ARGUMENTS)
+    if arguments.union:
+        dependents_data = build_blast_radius(
+            arguments.package_names,
+            query_engine,
+            show_source_packages=arguments.source_packages,
+            source_cache=source_cache,
+            metrics=metrics,
+            filter_cache=filter_cache,
+            dependency_cache=dependency_cache,
+            keep_cycles=arguments.show_cycles,
+            verbose=arguments.verbose,
+            package_filter=arguments.package_filter,
+            allow_missing=arguments.allow_missing,
+            filter_jobs=arguments.filter_jobs,
+        )
+    elif arguments.all:
+        dependents_graph = build_dependents_graph(
+            arguments.package_name,
+            query_engine,
+            show_source_packages=arguments.source_packages,
+            source_cache=source_cache,
+            metrics=metrics,
+            filter_cache=filter_cache,
+            dependency_cache=dependency_cache,
+            max_results=arguments.max_results,
+            verbose=arguments.verbose,
+            keep_cycles=arguments.show_cycles,
+            package_filter=arguments.package_filter,
+            allow_missing=arguments.allow_missing,
+            filter_jobs=arguments.filter_jobs,
+        )
 
-    base = base_url.rstrip("/")
-    paths: Dict[str, str] = {}
-    for repository in repositories:
-        if repository.startswith(("http://", "https://")):
-            repository_url = repository.rstrip("/")
-            repository_id = derive_repository_id_from_url(repository_url)
-            paths[repository_id] = repository_url
-            continue
+        # Made as they're iterated over, so the dependents of all the packages
+        # are never held as lists of names at the same time
+        dependents_data = dependents_graph.entries()
+    else:
+        dependents_data = build_dependents_list(
+            arguments.package_name,
+            query_engine,
+            show_source_packages=arguments.source_packages,
+            source_cache=source_cache,
+            metrics=metrics,
+            filter_cache=filter_cache,
+            dependency_cache=dependency_cache,
+            max_results=arguments.max_results,
+            verbose=arguments.verbose,
+            keep_cycles=arguments.show_cycles,
+            package_filter=arguments.package_filter,
+            allow_missing=arguments.allow_missing,
+            source_jobs=arguments.source_jobs,
+            filter_jobs=arguments.filter_jobs,
+        )
 
-        repository_id = repository
-        repository_url = f"{base}/compose/{repository}/{arch}/os/"
-        paths[repository_id] = repository_url
+    package_descriptions = None
+    if arguments.describe:
+        logging.debug("🔄 Fetching package descriptions...")
+        package_descriptions = collect_package_descriptions(
+            arguments, query_engine, metrics, description_cache, dependents_data
+        )
 
-        repository_id = repository + "-sources"
-        repository_url = f"{base}/compose/{repository}/source/tree/"
-        paths[repository_id] = repository_url
-    return paths
+    return dependents_data, package_descriptions
 
 
-def set_up_logging(verbose: bool, log_file: Path | None) -> None:
+def stream_package_dependents(
+        arguments: argparse.Namespace,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache
+    ) -> None:
     """
-    Set up logging configuration.
+    Find the dependents a query asks for, writing them out as newline-delimited JSON as they are found.
+
+    Without --all, each line is a dependent of the package. With --all, each line is a
+    package of the graph with its transitive dependents, written as soon as they are
+    final, and a last line holds the 'partial' flags that changed after their packages
+    were written. With --union, each line is an affected package and its 'roots'.
 
     Args:
-        verbose: Whether to enable debug logging
-        log_file: Optional file path to redirect logs to
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
+
+    Raises:
+        RepoQueryError: If a query fails
+        NoDependentsFoundError: If the package has no dependents
+        PackageNotFoundError: If a package is missing from the repositories
     """
-    level = logging.DEBUG if verbose else logging.INFO
+    with contextlib.ExitStack() as stack:
+        if arguments.output_file:
+            output_stream = stack.enter_context(open(arguments.output_file, "w"))
+        else:
+            output_stream = sys.stdout
 
-    if log_file:
-        logger = logging.getLogger()
-        logger.setLevel(level)
+        def write_record(record: Dict[str, Any]) -> None:
+            output_stream.write(json.dumps(record) + "\n")
+            output_stream.flush()
 
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(level)
-        file_handler.setFormatter(logging.Formatter("%(message)s"))
-        logger.addHandler(file_handler)
+        def build_record(package: str, **fields: Any) -> Dict[str, Any]:
+            record: Dict[str, Any] = {"package": package}
+            if arguments.describe:
+                description = query_package_description(package, query_engine, metrics, description_cache, arguments.verbose)
+                if description:
+                    record["description"] = description
+            record.update(fields)
+            return record
+
+        if arguments.union:
+            affected_packages = build_blast_radius(
+                arguments.package_names,
+                query_engine,
+                show_source_packages=arguments.source_packages,
+                source_cache=source_cache,
+                metrics=metrics,
+                filter_cache=filter_cache,
+                dependency_cache=dependency_cache,
+                keep_cycles=arguments.show_cycles,
+                verbose=arguments.verbose,
+                package_filter=arguments.package_filter,
+                allow_missing=arguments.allow_missing,
+                filter_jobs=arguments.filter_jobs,
+            )
+            if arguments.describe:
+                query_package_descriptions(
+                    [package_entry["package"] for package_entry in affected_packages],
+                    query_engine, metrics, description_cache, arguments.verbose
+                )
+            for package_entry in affected_packages:
+                write_record(build_record(package_entry["package"], roots=package_entry["roots"]))
+        elif arguments.all:
+            package_ids = dependency_cache.package_ids
+
+            def write_packages(packages: List[Tuple[int, array, bool]]) -> None:
+                if arguments.describe:
+                    query_package_descriptions(
+                        package_ids.names(package for package, _, _ in packages),
+                        query_engine, metrics, description_cache, arguments.verbose
+                    )
+                for package, dependents, partial in packages:
+                    write_record(build_record(package_ids.name(package), dependents=package_ids.names(dependents), partial=partial))
+
+            changed_partial_flags = stream_dependents_graph(
+                arguments.package_name,
+                query_engine,
+                show_source_packages=arguments.source_packages,
+                source_cache=source_cache,
+                metrics=metrics,
+                filter_cache=filter_cache,
+                dependency_cache=dependency_cache,
+                write_packages=write_packages,
+                max_results=arguments.max_results,
+                verbose=arguments.verbose,
+                keep_cycles=arguments.show_cycles,
+                package_filter=arguments.package_filter,
+                allow_missing=arguments.allow_missing,
+                filter_jobs=arguments.filter_jobs,
+            )
+            write_record({"partial": {package_ids.name(package): partial for package, partial in changed_partial_flags.items()}})
+        else:
+            dependents = generate_dependents(
+                arguments.package_name,
+                query_engine,
+                show_source_packages=arguments.source_packages,
+                source_cache=source_cache,
+                metrics=metrics,
+                filter_cache=filter_cache,
+                dependency_cache=dependency_cache,
+                max_results=arguments.max_results,
+                verbose=arguments.verbose,
+                keep_cycles=arguments.show_cycles,
+                package_filter=arguments.package_filter,
+                allow_missing=arguments.allow_missing,
+                source_jobs=arguments.source_jobs,
+                filter_jobs=arguments.filter_jobs,
+            )
+            dependent_count = 0
+            for dependent in dependents:
+                write_record(build_record(dependent))
+                dependent_count += 1
 
-        stderr_handler = logging.StreamHandler(sys.stderr)
-        stderr_handler.setLevel(logging.ERROR)
-        stderr_handler.setFormatter(logging.Formatter("%(message)s"))
-        logger.addHandler(stderr_handler)
-    else:
-        logging.basicConfig(format="%(message)s", level=level)
+            if dependent_count == 0:
+                raise NoDependentsFoundError(arguments.package_name)
 
 
-def log_operation(
-        package_name: str,
-        all_dependents: bool,
-        source_packages: bool,
-        max_results: int | None,
-        filter_command: str | None,
-        output_file: Path | None
-    ) -> None:
+def answer_query(
+        arguments: argparse.Namespace,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> int:
     """
-    Log information about the operation being performed.
+    Answer a query: find the dependents, write the output and report any errors.
 
     Args:
-        package_name: Name of the package to inspect
-        all_dependents: Whether to include transitive dependencies
-        source_packages: Whether to convert to source package names
-        max_results: Maximum number of results to return
-        filter_command: Optional shell command to filter packages
-        output_file: Optional output file path
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
+        persistent_store: Persistent store backing the caches, if any
+
+    Returns:
+        The exit code for the query
     """
-    operation = "transitive" if all_dependents else "direct"
-    package_type = "as source packages" if source_packages else ""
-    max_info = f" (max {max_results})" if max_results else ""
-    filter_info = f" with filter: {filter_command}" if filter_command else ""
-    output_info = f" to \"{output_file}\"" if output_file else ""
+    try:
+        if arguments.format == "ndjson":
+            stream_package_dependents(
+                arguments, query_engine, metrics, source_cache, filter_cache, dependency_cache, description_cache
+            )
+        else:
+            dependents_data, package_descriptions = find_package_dependents(
+                arguments, query_engine, metrics, source_cache, filter_cache, dependency_cache, description_cache
+            )
+            write_dependents_output(arguments, dependents_data, package_descriptions)
 
-    logging.info(
-        f"\n🔍 Finding {operation} reverse dependencies of \"{package_name}\" "
-        f"{package_type}{max_info}{filter_info}{output_info}\n"
-    )
+        if arguments.stats:
+            display_statistics(arguments, metrics, source_cache, filter_cache, dependency_cache, description_cache, persistent_store)
 
+    except (RepoQueryError, FilterError) as error:
+        logging.error("%s", error)
+        return error.exit_code
+    except NoDependentsFoundError as error:
+        if not arguments.allow_missing:
+            logging.error("%s", error)
+            return error.exit_code
+        logging.info("%s (continuing with empty results due to --allow-missing)", error)
+    except PackageNotFoundError as error:
+        if not arguments.allow_missing:
+            logging.error("%s", f"Could not query dependents for {arguments.package_name} because repositories are incomplete (at least the {error.package_name} package is missing)")
+            return error.exit_code
+        logging.info("%s (continuing with empty results due to --allow-missing)", error)
 
-def set_up_repositories_and_cache(
-        base_url: str,
-        repository_names: str,
-        arch: str,
-        no_refresh: bool,
-        verbose: bool
-    ) -> Dict[str, str]:
+    return EXIT_SUCCESS
+
+
+def answer_ranking(
+        arguments: argparse.Namespace,
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> int:
     """
-    Set up repositories and update dnf cache if needed.
+    Rank every package by its transitive dependents, write out the top of the ranking and report any errors.
 
     Args:
-        base_url: Base URL for nightly repositories
-        repository_names: Comma-separated list of repository names
-        arch: CPU architecture
-        no_refresh: Whether to skip dnf cache update
-        verbose: Whether to enable verbose logging
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results (unused, for the statistics)
+        dependency_cache: Cache object to store dependency results (unused, for the statistics)
+        description_cache: Cache object to store package descriptions (unused, for the statistics)
+        persistent_store: Persistent store backing the caches, if any
 
     Returns:
-        Dictionary mapping repository IDs to URLs
+        The exit code for the query
     """
-    repositories = build_repository_paths(base_url, repository_names, arch)
+    logging.info(f"\n🔍 Ranking {'source ' if arguments.source_packages else ''}packages by transitive reverse dependencies (top {arguments.top})\n")
 
-    if not no_refresh:
-        update_dnf_cache(repositories, verbose)
-    else:
-        logging.info("⏭️  Skipping dnf cache update (using existing cache)")
+    try:
+        if arguments.source_packages and not arguments.preload_source_map:
+            preload_source_packages(query_engine, source_cache)
 
-    return repositories
+        ranking = rank_packages_by_impact(query_engine, arguments.source_packages, source_cache, metrics, arguments.top)
+
+        if arguments.format == "json":
+            output_data = json.dumps(ranking, indent=2)
+        else:
+            output_data = "\n".join(f"{entry['package']}: {entry['transitive_dependents']}" for entry in ranking)
+        write_output(output_data, arguments.output_file)
 
+        if arguments.stats:
+            display_statistics(arguments, metrics, source_cache, filter_cache, dependency_cache, description_cache, persistent_store)
 
-def collect_package_descriptions(
+    except RepoQueryError as error:
+        logging.error("%s", error)
+        return error.exit_code
+
+    return EXIT_SUCCESS
+
+
+def find_dependents_by_package(
         arguments: argparse.Namespace,
-        repositories: Dict[str, str],
+        query_engine: QueryEngine,
         metrics: RepoQueryMetrics,
-        dependents_data: List[Dict[str, Any]] | List[str]
-    ) -> Dict[str, str]:
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache
+    ) -> Dict[str, List[str]]:
     """
-    Collect package descriptions for all relevant packages.
+    Find the dependents a query asks for, keyed by package.
 
     Args:
-        arguments: Parsed command line arguments
-        repositories: Dictionary mapping repository IDs to URLs
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
         metrics: Metrics object to track repoquery calls
-        dependents_data: Either a list of package dictionaries (for --all) or a list of strings (for direct only)
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
+
+    Returns:
+        Dictionary mapping each package of the graph (with --all) or the package to its dependents
+
+    Raises:
+        RepoQueryError: If a query fails
+        PackageNotFoundError: If a package is missing from the repositories
+    """
+    try:
+        dependents_data, _ = find_package_dependents(
+            arguments, query_engine, metrics, source_cache, filter_cache, dependency_cache, description_cache
+        )
+    except NoDependentsFoundError:
+        return {}
+
+    if arguments.all:
+        return {package_entry["package"]: package_entry["dependents"] for package_entry in dependents_data}
+    return {arguments.package_name: dependents_data}
+
 
-    Returns:
-        Dictionary mapping package names to their descriptions
+def diff_dependents(old_dependents: Dict[str, List[str]], new_dependents: Dict[str, List[str]]) -> List[Dict[str, Any]]:
     """
-    package_descriptions = {}
+    Find the dependents each package gained or lost between two composes.
 
-    if arguments.all:
-        all_packages = set()
-        for package_entry in dependents_data:
-            all_packages.add(package_entry["package"])
-            all_packages.update(package_entry["dependents"])
+    Args:
+        old_dependents: Dictionary mapping packages to their dependents in the old compose
+        new_dependents: Dictionary mapping packages to their dependents in the new compose
 
-        for package in all_packages:
-            description = query_package_description(
-                package, repositories, metrics, arguments.verbose
-            )
-            package_descriptions[package] = description
-    else:
-        all_packages_to_describe = [arguments.package_name] + dependents_data
-        for package in all_packages_to_describe:
-            description = query_package_description(
-                package, repositories, metrics, arguments.verbose
-            )
-            package_descriptions[package] = description
+    Returns:
+        List of dictionaries containing the 'package' and its 'added' and 'removed' dependents,
+        for the packages whose dependents changed, in the order of the new compose then the old one
+    """
+    differences: List[Dict[str, Any]] = []
+    for package in dict.fromkeys([*new_dependents, *old_dependents]):
+        old_list = old_dependents.get(package, [])
+        new_list = new_dependents.get(package, [])
+        old_set = set(old_list)
+        new_set = set(new_list)
+        added = [dependent for dependent in new_list if dependent not in old_set]
+        removed = [dependent for dependent in old_list if dependent not in new_set]
+        if added or removed:
+            differences.append({"package": package, "added": added, "removed": removed})
 
-    return package_descriptions
+    return differences
 
 
-def generate_output(
-        arguments: argparse.Namespace,
-        dependents_data: List[Dict[str, Any]] | List[str],
-        package_descriptions: Dict[str, str] | None
-    ) -> str:
+def generate_comparison_output(arguments: argparse.Namespace, differences: List[Dict[str, Any]]) -> str:
     """
-    Generate output in the requested format.
+    Generate the output of a compose comparison in the requested format.
 
     Args:
         arguments: Parsed command line arguments
-        dependents_data: Either a list of package dictionaries (for --all) or a list of strings (for direct only)
-        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+        differences: The differences, as returned by diff_dependents
 
     Returns:
         Formatted output string
     """
     if arguments.format == "json":
-        return generate_json_output(arguments, dependents_data, package_descriptions)
-    else:
-        return generate_plain_output(arguments, dependents_data, package_descriptions)
+        return json.dumps(differences, indent=2)
 
+    output_lines = []
+    for difference in differences:
+        output_lines.append(difference["package"])
+        output_lines.extend(f"  + {dependent}" for dependent in difference["added"])
+        output_lines.extend(f"  - {dependent}" for dependent in difference["removed"])
+    return "\n".join(output_lines)
 
-def generate_json_output(
+
+def answer_comparison(
         arguments: argparse.Namespace,
-        dependents_data: List[Dict[str, Any]] | List[str],
-        package_descriptions: Dict[str, str] | None
-    ) -> str:
+        repositories: Dict[str, str],
+        compare_repositories: Dict[str, str],
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> int:
     """
-    Generate JSON formatted output.
+    Answer a query in both composes, write out how the dependents changed and report any errors.
+
+    The older compose is walked first. The newer one is then walked with an incremental
+    query engine, which answers from the older compose's results for packages that
+    haven't changed, and the source package mappings of unchanged packages and the
+    filter results are shared between the walks.
 
     Args:
-        arguments: Parsed command line arguments
-        dependents_data: Either a list of package dictionaries (for --all) or a list of strings (for direct only)
-        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+        arguments: Parsed command line arguments of the query
+        repositories: Dictionary mapping repository IDs to URLs of the newer compose
+        compare_repositories: Dictionary mapping repository IDs to URLs of the older compose
+        query_engine: Query engine to answer repository queries about the newer compose
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings of the newer compose
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results of the newer compose
+        description_cache: Cache object to store package descriptions
+        persistent_store: Persistent store backing the caches, if any
 
     Returns:
-        JSON formatted string
+        The exit code for the query
     """
-    if arguments.all:
-        output_array = []
-        for package_entry in dependents_data:
-            package_obj = {"package": package_entry["package"]}
-            if arguments.describe and package_descriptions:
-                description = package_descriptions.get(package_entry["package"])
-                if description:
-                    package_obj["description"] = description
-            package_obj["dependents"] = package_entry["dependents"]
-            if "partial" in package_entry:
-                package_obj["partial"] = package_entry["partial"]
-            output_array.append(package_obj)
-    else:
-        output_array = [
-            {"package": arguments.package_name, "dependents": dependents_data}
-        ]
-        if arguments.describe and package_descriptions:
-            description = package_descriptions.get(arguments.package_name)
-            if description:
-                output_array[0]["description"] = description
+    old_persistent_store = None
+    old_query_engine = None
+    try:
+        if arguments.persistent_cache:
+            old_persistent_store = open_persistent_cache(
+                arguments.persistent_cache, compare_repositories, arguments.query_engine, arguments.no_refresh
+            )
+        old_source_cache = SourcePackageCache(old_persistent_store)
+        old_dependency_cache = DependencyCache(old_persistent_store)
+        old_query_engine = create_query_engine(arguments.query_engine, compare_repositories, metrics, arguments.verbose, arguments.jobs)
+
+        logging.debug(f"🔄 Finding dependents in the compose at {arguments.compare_base_url}")
+        old_dependents = find_dependents_by_package(
+            arguments, old_query_engine, metrics, old_source_cache, filter_cache, old_dependency_cache, description_cache
+        )
+
+        logging.debug("🔄 Finding the packages that changed between the composes")
+        changes = ComposeChanges(compare_repositories, repositories)
+        source_cache.copy_from(old_source_cache, lambda package_name: not changes.is_changed(package_name))
 
-    return json.dumps(output_array, indent=2)
+        logging.debug(f"🔄 Finding dependents in the compose at {arguments.base_url}")
+        incremental_query_engine = IncrementalQueryEngine(query_engine, old_dependency_cache, changes, arguments.verbose)
+        new_dependents = find_dependents_by_package(
+            arguments, incremental_query_engine, metrics, source_cache, filter_cache, dependency_cache, description_cache
+        )
 
+        differences = diff_dependents(old_dependents, new_dependents)
+        write_output(generate_comparison_output(arguments, differences), arguments.output_file)
 
-def generate_plain_output(
+        if arguments.stats:
+            display_statistics(arguments, metrics, source_cache, filter_cache, dependency_cache, description_cache, persistent_store)
+
+    except (RepoQueryError, FilterError) as error:
+        logging.error("%s", error)
+        return error.exit_code
+    except PackageNotFoundError as error:
+        if not arguments.allow_missing:
+            logging.error("%s", f"Could not query dependents for {arguments.package_name} because repositories are incomplete (at least the {error.package_name} package is missing)")
+            return error.exit_code
+        logging.info("%s (continuing with empty results due to --allow-missing)", error)
+    finally:
+        if old_query_engine is not None:
+            old_query_engine.close()
+        if old_persistent_store is not None:
+            old_persistent_store.close()
+
+    return EXIT_SUCCESS
+
+
+def answer_queries(
         arguments: argparse.Namespace,
-        dependents_data: List[Dict[str, Any]] | List[str],
-        package_descriptions: Dict[str, str] | None
-    ) -> str:
+        query_engine: QueryEngine,
+        metrics: RepoQueryMetrics,
+        source_cache: SourcePackageCache,
+        filter_cache: FilterCache,
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
+    ) -> int:
     """
-    Generate plain text formatted output.
+    Answer a query for several packages, writing one line of JSON per package.
+
+    The packages share the caches, so the parts of their dependents graphs they
+    have in common are only queried once. Each line has the package name and either
+    the 'results' the JSON output would have for it, or an 'error' message and the
+    'exit_code' the package failed with. A failing package doesn't stop the others.
 
     Args:
-        arguments: Parsed command line arguments
-        dependents_data: Either a list of package dictionaries (for --all) or a list of strings (for direct only)
-        package_descriptions: Dictionary of package descriptions if --describe is used, None otherwise
+        arguments: Parsed command line arguments of the query
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        filter_cache: Cache object to store filter results of the query's filter command
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
+        persistent_store: Persistent store backing the caches, if any
 
     Returns:
-        Plain text formatted string
+        EXIT_SUCCESS, or the exit code of the first package that failed
     """
-    if arguments.all:
-        # Find the root package entry
-        root_package_entry = None
-        for package_entry in dependents_data:
-            if package_entry["package"] == arguments.package_name:
-                root_package_entry = package_entry
-                break
-
-        if root_package_entry:
-            collected_packages = root_package_entry["dependents"]
+    exit_code = EXIT_SUCCESS
+    with contextlib.ExitStack() as stack:
+        if arguments.output_file:
+            output_stream = stack.enter_context(open(arguments.output_file, "w"))
         else:
-            collected_packages = []
-    else:
-        collected_packages = dependents_data
+            output_stream = sys.stdout
+
+        for package_name in arguments.package_names:
+            package_arguments = argparse.Namespace(**vars(arguments))
+            package_arguments.package_name = package_name
+
+            log_operation(
+                package_name,
+                arguments.all,
+                arguments.source_packages,
+                arguments.max_results,
+                arguments.package_filter,
+                arguments.output_file
+            )
 
-    if arguments.describe and package_descriptions:
-        output_lines = []
-        for package in collected_packages:
-            description = package_descriptions.get(package)
-            if description:
-                output_lines.append(f"{package}: {description}")
-            else:
-                output_lines.append(package)
-        return "\n".join(output_lines)
-    else:
-        return "\n".join(collected_packages)
+            record: Dict[str, Any] = {"package": package_name}
+            try:
+                dependents_data, package_descriptions = find_package_dependents(
+                    package_arguments, query_engine, metrics, source_cache, filter_cache, dependency_cache, description_cache
+                )
+                record["results"] = build_json_output(package_arguments, dependents_data, package_descriptions)
+            except (RepoQueryError, FilterError) as error:
+                record["error"] = str(error)
+                record["exit_code"] = error.exit_code
+            except (NoDependentsFoundError, PackageNotFoundError) as error:
+                if arguments.allow_missing:
+                    logging.info("%s (continuing with empty results due to --allow-missing)", error)
+                    record["results"] = []
+                else:
+                    record["error"] = str(error)
+                    record["exit_code"] = error.exit_code
 
+            if "error" in record:
+                logging.error("%s", record["error"])
+                if exit_code == EXIT_SUCCESS:
+                    exit_code = record["exit_code"]
 
-def write_output(output_data: str, output_file: Path | None) -> None:
+            output_stream.write(json.dumps(record) + "\n")
+            output_stream.flush()
+
+    if arguments.stats:
+        display_statistics(arguments, metrics, source_cache, filter_cache, dependency_cache, description_cache, persistent_store)
+
+    return exit_code
+
+
+class QueryServer(socketserver.UnixStreamServer):
     """
-    Write output to file or stdout.
+    Answers queries from --connect clients, keeping the query engine and caches hot.
 
-    Args:
-        output_data: The formatted output data
-        output_file: Optional output file path
+    Each request is one line of JSON with the client's command line arguments,
+    and each response is one line of JSON with the exit code and whatever the
+    query wrote to stdout and stderr. Requests are answered one at a time.
     """
-    logging.debug(f"\n✅ Final output:\n{output_data}\n")
-    if output_file:
-        output_file.write_text(output_data)
-    else:
-        print(output_data)
 
+    def __init__(
+            self,
+            socket_path: Path,
+            arguments: argparse.Namespace,
+            repositories: Dict[str, str],
+            query_engine: QueryEngine,
+            metrics: RepoQueryMetrics,
+            source_cache: SourcePackageCache,
+            dependency_cache: DependencyCache,
+            description_cache: DescriptionCache,
+            persistent_store: PersistentCacheStore | None = None
+        ):
+        self._arguments = arguments
+        self._repositories = repositories
+        self._query_engine = query_engine
+        self._metrics = metrics
+        self._source_cache = source_cache
+        self._dependency_cache = dependency_cache
+        self._description_cache = description_cache
+        self._persistent_store = persistent_store
+        self._package_filters: Dict[Tuple[str, str | None, str | None], PackageFilter] = {}
+        self._filter_caches: Dict[Tuple[str, str | None, str | None] | None, FilterCache] = {}
+        self._query_count: int = 0
+        super().__init__(str(socket_path), QueryRequestHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        for package_filter in self._package_filters.values():
+            package_filter.close()
+
+    def answer(
+            self,
+            argv: List[str],
+            package_names: List[str] | None = None,
+            working_directory: str | None = None,
+            environment: Dict[str, str] | None = None
+        ) -> Dict[str, Any]:
+        """
+        Answer a query from a client.
+
+        Args:
+            argv: The client's command line arguments
+            package_names: The packages to inspect, if the client already collected them
+            working_directory: The client's working directory, to run filters in
+            environment: The client's environment, to run filters in
 
-def display_statistics(
-        filter_command: str | None,
+        Returns:
+            Dictionary with the 'exit_code' of the query and its 'stdout' and 'stderr' output
+        """
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+
+        log_handler = logging.StreamHandler(stderr)
+        log_handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger()
+        logger.addHandler(log_handler)
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                exit_code = self._answer(argv, package_names, working_directory, environment, log_handler)
+        finally:
+            logger.removeHandler(log_handler)
+
+        return {"exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def _answer(
+            self,
+            argv: List[str],
+            package_names: List[str] | None,
+            working_directory: str | None,
+            environment: Dict[str, str] | None,
+            log_handler: logging.Handler
+        ) -> int:
+        """
+        Answer a query from a client, with its output already redirected.
+
+        Args:
+            argv: The client's command line arguments
+            package_names: The packages to inspect, if the client already collected them
+            working_directory: The client's working directory, to run filters in
+            environment: The client's environment, to run filters in
+            log_handler: The handler passing log messages on to the client
+
+        Returns:
+            The exit code for the query
+        """
+        try:
+            arguments = parse_command_line_arguments(argv)
+        except SystemExit as error:
+            return error.code if isinstance(error.code, int) else EXIT_INVALID_ARGUMENTS
+
+        log_handler.setLevel(logging.DEBUG if arguments.verbose else logging.INFO)
+
+        if arguments.serve:
+            logging.error("Can't start a daemon from a query")
+            return EXIT_INVALID_ARGUMENTS
+
+        if package_names is None:
+            try:
+                package_names = read_package_names(arguments)
+            except OSError as error:
+                logging.error("%s", f"Could not read packages: {error}")
+                return EXIT_INVALID_ARGUMENTS
+
+        exit_code = set_package_names(arguments, package_names)
+        if exit_code != EXIT_SUCCESS:
+            return exit_code
+
+        repositories = build_repository_paths(arguments.base_url, arguments.repository_names, arguments.arch)
+        if repositories != self._repositories or arguments.query_engine != self._arguments.query_engine:
+            logging.error("The daemon serves different repositories or another query engine than the query asks for")
+            return EXIT_INVALID_ARGUMENTS
+
+        try:
+            package_filter = create_package_filter(arguments, working_directory, environment)
+        except FilterError as error:
+            logging.error("%s", error)
+            return error.exit_code
+
+        # Queries with the same filter, run from the same directory in the same environment,
+        # share it, so a filter coprocess keeps running between them
+        filter_description = package_filter.description if package_filter is not None else None
+        if package_filter is not None:
+            environment_digest = None
+            if environment is not None:
+                environment_digest = sha256(json.dumps(environment, sort_keys=True).encode()).hexdigest()
+            filter_key = (filter_description, working_directory, environment_digest)
+            arguments.package_filter = self._package_filters.setdefault(filter_key, package_filter)
+        else:
+            filter_key = None
+            arguments.package_filter = None
+
+        filter_cache = self._filter_caches.get(filter_key)
+        if filter_cache is None:
+            filter_cache = FilterCache(self._persistent_store, filter_description)
+            self._filter_caches[filter_key] = filter_cache
+
+        self._query_count += 1
+        logging.debug(f"📨 Answering query {self._query_count}: {quote_command(argv)}")
+
+        if answers_per_package(arguments):
+            answer = answer_queries
+        else:
+            log_query(arguments)
+            answer = answer_query
+
+        # The client writes the output file
+        arguments.output_file = None
+
+        return answer(
+            arguments,
+            self._query_engine,
+            self._metrics,
+            self._source_cache,
+            filter_cache,
+            self._dependency_cache,
+            self._description_cache,
+            self._persistent_store
+        )
+
+
+class QueryRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads a query from a --connect client and sends back the answer.
+    """
+
+    def handle(self) -> None:
+        request_line = self.rfile.readline()
+        if not request_line:
+            return
+
+        try:
+            request = json.loads(request_line)
+            argv = [str(argument) for argument in request["arguments"]]
+            package_names = request.get("package_names")
+            if package_names is not None:
+                package_names = [str(package_name) for package_name in package_names]
+            working_directory = request.get("working_directory")
+            if working_directory is not None:
+                working_directory = str(working_directory)
+            environment = request.get("environment")
+            if environment is not None:
+                environment = {str(name): str(value) for name, value in environment.items()}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            response = {"exit_code": EXIT_SERVER_ERROR, "stdout": "", "stderr": f"Invalid request: {error}\n"}
+        else:
+            response = self.server.answer(argv, package_names, working_directory, environment)
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def serve_queries(
+        arguments: argparse.Namespace,
+        repositories: Dict[str, str],
+        query_engine: QueryEngine,
         metrics: RepoQueryMetrics,
         source_cache: SourcePackageCache,
-        filter_cache: FilterCache,
-        dependency_cache: DependencyCache
+        dependency_cache: DependencyCache,
+        description_cache: DescriptionCache,
+        persistent_store: PersistentCacheStore | None = None
     ) -> None:
     """
-    Display detailed statistics about the operation.
+    Answer queries from --connect clients on a Unix socket until interrupted.
 
     Args:
-        filter_command: Optional shell command used to filter packages
-        metrics: Metrics object containing operation statistics
-        source_cache: Cache object containing source package cache statistics
-        filter_cache: Cache object containing filter cache statistics
+        arguments: Parsed command line arguments of the daemon
+        repositories: Dictionary mapping repository IDs to URLs
+        query_engine: Query engine to answer repository queries
+        metrics: Metrics object to track repoquery calls
+        source_cache: Cache object to store source package mappings
+        dependency_cache: Cache object to store dependency results
+        description_cache: Cache object to store package descriptions
+        persistent_store: Persistent store backing the caches, if any
     """
-    stats = metrics.get_stats()
-    print("\n📊 FINAL STATISTICS:", file=sys.stderr)
-    print(f"   Total dnf repoquery calls: {stats['total_calls']}", file=sys.stderr)
-    print("   Calls by type:", file=sys.stderr)
-    for call_type, count in stats["calls_by_type"].items():
-        print(f"     {call_type}: {count}", file=sys.stderr)
-
-    if filter_command:
-        print(f"   Filter command calls: {stats['filter_calls']}", file=sys.stderr)
-        print(f"   Filter command failures: {stats['filter_failures']}", file=sys.stderr)
-
-    source_cache_stats = source_cache.get_stats()
-    print(f"   Source package cache size: {source_cache_stats['cache_size']}", file=sys.stderr)
-    print(f"   Source package cache hits (found): {source_cache_stats['found_count']}", file=sys.stderr)
-    print(f"   Source package cache hits (not found): {source_cache_stats['not_found_count']}", file=sys.stderr)
-
-    if source_cache_stats["cached_packages"]:
-        print("   Cached source packages:", file=sys.stderr)
-        for package in source_cache_stats["cached_packages"]:
-            result = source_cache.get(package)
-            if result is None:
-                status = "not found"
-            else:
-                status = f"→ {result}"
-            print(f"     {package}: {status}", file=sys.stderr)
+    socket_path = arguments.serve
+    if socket_path.is_socket():
+        # Left behind by a daemon that didn't shut down cleanly
+        socket_path.unlink()
+
+    server = QueryServer(
+        socket_path,
+        arguments,
+        repositories,
+        query_engine,
+        metrics,
+        source_cache,
+        dependency_cache,
+        description_cache,
+        persistent_store
+    )
 
-    filter_cache_stats = filter_cache.get_stats()
-    print(f"   Filter cache size: {filter_cache_stats['cache_size']}", file=sys.stderr)
-    print(f"   Filter cache hits (passed): {filter_cache_stats['passed_count']}", file=sys.stderr)
-    print(f"   Filter cache hits (failed): {filter_cache_stats['failed_count']}", file=sys.stderr)
+    def stop(signal_number: int, frame: Any) -> None:
+        raise KeyboardInterrupt
 
-    if filter_cache_stats["cached_packages"]:
-        print("   Cached filter results:", file=sys.stderr)
-        for package in filter_cache_stats["cached_packages"]:
-            result = filter_cache.get(package)
-            status = "pass" if result else "fail"
-            print(f"     {package}: {status}", file=sys.stderr)
+    signal.signal(signal.SIGTERM, stop)
+
+    logging.info(f"🚀 Answering queries on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        logging.info("👋 Stopped answering queries")
+
+
+def forward_query(
+        socket_path: Path,
+        argv: List[str],
+        package_names: List[str],
+        per_package: bool,
+        output_file: Path | None
+    ) -> int:
+    """
+    Have a --serve daemon answer a query and pass on its answer.
+
+    Args:
+        socket_path: The daemon's Unix socket
+        argv: The command line arguments of the query
+        package_names: The packages to inspect
+        per_package: Whether the answer is one line of JSON per package
+        output_file: Optional output file path
 
-    dependency_cache_stats = dependency_cache.get_stats()
-    print(f"   Dependency cache size: {dependency_cache_stats['cache_size']}", file=sys.stderr)
-    print(f"   Dependency cache total dependents: {dependency_cache_stats['total_dependents']}", file=sys.stderr)
-    print(f"   Dependency cache complete results: {dependency_cache_stats['complete_count']}", file=sys.stderr)
-    print(f"   Dependency cache partial results: {dependency_cache_stats['partial_count']}", file=sys.stderr)
+    Returns:
+        The exit code for the query
+    """
+    logging.debug(f"📨 Forwarding query to {socket_path}")
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(str(socket_path))
+            # Filters run in the client's working directory and environment, not the daemon's
+            request = {
+                "arguments": argv,
+                "package_names": package_names,
+                "working_directory": os.getcwd(),
+                "environment": dict(os.environ)
+            }
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            connection.shutdown(socket.SHUT_WR)
+            with connection.makefile("rb") as stream:
+                response = json.loads(stream.readline())
+    except (OSError, ValueError) as error:
+        logging.error("%s", f"Could not get an answer from the daemon on {socket_path}: {error}")
+        return EXIT_SERVER_ERROR
+
+    sys.stderr.write(response["stderr"])
+    if output_file and response["stdout"]:
+        output_data = response["stdout"]
+        if not per_package:
+            # The output was printed, with a newline write_output doesn't add to files
+            output_data = output_data.removesuffix("\n")
+        output_file.write_text(output_data)
+    else:
+        sys.stdout.write(response["stdout"])
 
-    if dependency_cache_stats["cached_packages"]:
-        print("   Cached dependency results:", file=sys.stderr)
-        for package in dependency_cache_stats["cached_packages"]:
-            dependents = dependency_cache.get(package)
-            if dependents is not None:
-                entry = dependency_cache._cache[package]
-                partial_info = " (partial)" if entry["partial"] else " (complete)"
-                print(f"     {package}: {len(dependents)} dependents{partial_info}", file=sys.stderr)
+    return response["exit_code"]
 
 
 def main() -> None:
@@ -1575,107 +7585,121 @@ def main() -> None:
 
     set_up_logging(arguments.verbose, arguments.log_file)
 
-    log_operation(
-        arguments.package_name,
-        arguments.all,
-        arguments.source_packages,
-        arguments.max_results,
-        arguments.filter_command,
-        arguments.output_file
-    )
+    if not arguments.serve and not arguments.rank_all:
+        try:
+            package_names = read_package_names(arguments)
+        except OSError as error:
+            logging.error("%s", f"Could not read packages: {error}")
+            sys.exit(EXIT_INVALID_ARGUMENTS)
+
+        exit_code = set_package_names(arguments, package_names)
+        if exit_code != EXIT_SUCCESS:
+            sys.exit(exit_code)
+
+        if arguments.compare_base_url and answers_per_package(arguments):
+            logging.error("--compare-base-url compares the dependents of a single package")
+            sys.exit(EXIT_INVALID_ARGUMENTS)
+
+    if arguments.connect:
+        sys.exit(forward_query(arguments.connect, sys.argv[1:], arguments.package_names, answers_per_package(arguments), arguments.output_file))
+
+    try:
+        arguments.package_filter = create_package_filter(arguments)
+    except FilterError as error:
+        logging.error("%s", error)
+        sys.exit(error.exit_code)
+
+    if not arguments.serve and not arguments.rank_all and not answers_per_package(arguments):
+        log_query(arguments)
 
     repositories = set_up_repositories_and_cache(
         arguments.base_url,
         arguments.repository_names,
         arguments.arch,
         arguments.no_refresh,
-        arguments.verbose
+        arguments.verbose,
+        arguments.query_engine,
+        arguments.refresh_state,
+        arguments.refresh_jobs,
+        arguments.force_refresh
     )
 
-    metrics = RepoQueryMetrics()
-    source_cache = SourcePackageCache()
-    filter_cache = FilterCache()
-    dependency_cache = DependencyCache()
+    compare_repositories = None
+    if arguments.compare_base_url:
+        compare_repositories = set_up_repositories_and_cache(
+            arguments.compare_base_url,
+            arguments.repository_names,
+            arguments.arch,
+            arguments.no_refresh,
+            arguments.verbose,
+            arguments.query_engine,
+            arguments.refresh_state,
+            arguments.refresh_jobs,
+            arguments.force_refresh
+        )
 
-    try:
-        if arguments.all:
-            dependents_graph = build_dependents_graph(
-                arguments.package_name,
-                repositories,
-                show_source_packages=arguments.source_packages,
-                source_cache=source_cache,
-                metrics=metrics,
-                filter_cache=filter_cache,
-                dependency_cache=dependency_cache,
-                max_results=arguments.max_results,
-                verbose=arguments.verbose,
-                keep_cycles=arguments.show_cycles,
-                filter_command=arguments.filter_command,
-                allow_missing=arguments.allow_missing,
-            )
+    persistent_store = None
+    if arguments.persistent_cache:
+        persistent_store = open_persistent_cache(arguments.persistent_cache, repositories, arguments.query_engine, arguments.no_refresh)
 
-            dependents_data = []
-            for package, entry in dependents_graph.items():
-                package_entry = {
-                    "package": package,
-                    "dependents": entry["dependents"],
-                    "partial": entry["partial"]
-                }
-                dependents_data.append(package_entry)
-        else:
-            dependents_data = build_dependents_list(
-                arguments.package_name,
-                repositories,
-                show_source_packages=arguments.source_packages,
-                source_cache=source_cache,
-                metrics=metrics,
-                filter_cache=filter_cache,
-                dependency_cache=dependency_cache,
-                max_results=arguments.max_results,
-                verbose=arguments.verbose,
-                keep_cycles=arguments.show_cycles,
-                filter_command=arguments.filter_command,
-                allow_missing=arguments.allow_missing,
-            )
+    metrics = RepoQueryMetrics(tracing=arguments.trace_file is not None)
+    source_cache = SourcePackageCache(persistent_store)
+    filter_cache = FilterCache(persistent_store, arguments.package_filter.description if arguments.package_filter is not None else None)
+    dependency_cache = DependencyCache(persistent_store)
+    description_cache = DescriptionCache(persistent_store)
+    query_engine = None
 
-        package_descriptions = None
-        if arguments.describe:
-            logging.debug("🔄 Fetching package descriptions...")
-            package_descriptions = collect_package_descriptions(
-                arguments, repositories, metrics, dependents_data
-            )
+    exit_code = EXIT_SUCCESS
+    try:
+        query_engine = create_query_engine(arguments.query_engine, repositories, metrics, arguments.verbose, arguments.jobs)
 
-        output_data = generate_output(arguments, dependents_data, package_descriptions)
-        write_output(output_data, arguments.output_file)
+        if arguments.preload_source_map and (arguments.source_packages or arguments.serve):
+            preload_source_packages(query_engine, source_cache)
 
-        if arguments.stats:
-            display_statistics(arguments.filter_command, metrics, source_cache, filter_cache, dependency_cache)
+        if arguments.serve:
+            serve_queries(
+                arguments, repositories, query_engine, metrics,
+                source_cache, dependency_cache, description_cache, persistent_store
+            )
+        elif arguments.rank_all:
+            exit_code = answer_ranking(
+                arguments, query_engine, metrics,
+                source_cache, filter_cache, dependency_cache, description_cache, persistent_store
+            )
+        elif arguments.compare_base_url:
+            exit_code = answer_comparison(
+                arguments, repositories, compare_repositories, query_engine, metrics,
+                source_cache, filter_cache, dependency_cache, description_cache, persistent_store
+            )
+        else:
+            answer = answer_queries if answers_per_package(arguments) else answer_query
+            exit_code = answer(
+                arguments, query_engine, metrics,
+                source_cache, filter_cache, dependency_cache, description_cache, persistent_store
+            )
 
     except RepoQueryError as error:
         logging.error("%s", error)
-        sys.exit(error.exit_code)
-    except NoDependentsFoundError as error:
-        if arguments.allow_missing:
-            logging.info("%s (continuing with empty results due to --allow-missing)", error)
-            if arguments.all:
-                dependents_data = [{"package": arguments.package_name, "dependents": [], "partial": False}]
-            else:
-                dependents_data = []
-        else:
-            logging.error("%s", error)
-            sys.exit(error.exit_code)
-    except PackageNotFoundError as error:
-        if arguments.allow_missing:
-            logging.info("%s (continuing with empty results due to --allow-missing)", error)
-            if arguments.all:
-                dependents_data = [{"package": arguments.package_name, "dependents": [], "partial": False}]
-            else:
-                dependents_data = []
-        else:
-            logging.error("%s", f"Could not query dependents for {arguments.package_name} because repositories are incomplete (at least the {error.package_name} package is missing)")
-            sys.exit(error.exit_code)
+        exit_code = error.exit_code
     except KeyboardInterrupt:
-        sys.exit(0)
+        exit_code = EXIT_SUCCESS
+    finally:
+        if query_engine is not None:
+            query_engine.close()
+        if arguments.package_filter is not None:
+            arguments.package_filter.close()
+        if persistent_store is not None:
+            persistent_store.close()
+
+    if arguments.trace_file:
+        try:
+            metrics.write_trace(arguments.trace_file)
+        except OSError as error:
+            logging.error("%s", f"Could not write the trace: {error}")
+        else:
+            logging.debug(f"📝 Wrote trace to {arguments.trace_file}")
+
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":